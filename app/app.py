@@ -5,8 +5,9 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse, HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.logging.middleware import LoggingMiddleware
+from app.logging.writer import close_request_log_writer
 from app.core.router import register_routes
-from app.core.database import init_db
+from app.core.database import init_db, dispose_async_engines
 from typing import Any
 from fastapi.exceptions import ResponseValidationError, RequestValidationError
 from app.logging.exception_handlers import (
@@ -21,6 +22,9 @@ def create_app() -> FastAPI:
 
     app = FastAPI(docs_url="/api/docs", redoc_url="/api/redoc", openapi_url="/api/openapi.json")
     init_db()
+    app.add_event_handler("shutdown", dispose_async_engines)
+    # Write the request logs still queued before the process exits
+    app.add_event_handler("shutdown", close_request_log_writer)
 
     # Add request logger middleware
     app.add_middleware(LoggingMiddleware)
@@ -6,6 +6,7 @@ from sqlalchemy import desc, and_, or_
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from app.calculations.audit_models import CalculationAuditLog
+from app.core.retention import RetentionResult, ensure_future_partitions, purge_before
 
 
 class CalculationAuditDAO:
@@ -282,16 +283,11 @@ class CalculationAuditDAO:
             "detailed_history": detailed_history
         }
 
-    def cleanup_old_audit_logs(self, days_to_keep: int = 365) -> int:
-        """Clean up audit logs older than specified days. Returns count of deleted records."""
+    def cleanup_old_audit_logs(self, days_to_keep: int = 365) -> RetentionResult:
+        """Clean up audit logs older than specified days."""
         cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-        
-        deleted_count = self.db.query(CalculationAuditLog).filter(
-            CalculationAuditLog.changed_at < cutoff_date
-        ).delete()
-        
-        self.db.commit()
-        return deleted_count
+        ensure_future_partitions(self.db)
+        return purge_before(self.db, CalculationAuditLog.__table__, CalculationAuditLog.changed_at, cutoff_date)
 
     def delete(self, audit_id: int) -> bool:
         """Delete a specific audit log (use with caution)."""
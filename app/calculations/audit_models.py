@@ -1,7 +1,7 @@
 # app/calculations/audit_models.py
 """Calculation audit trail models with optimized connection management."""
 
-from sqlalchemy import Column, Integer, String, DateTime, JSON, event
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index, event, insert
 from sqlalchemy.sql import func
 from sqlalchemy.orm import Session
 from app.core.database import Base
@@ -11,7 +11,8 @@ import threading
 from contextlib import contextmanager
 import time
 import atexit
-import queue
+import os
+from collections import deque
 
 
 # Thread-local storage for audit context
@@ -21,6 +22,14 @@ _audit_context = threading.local()
 _audit_logger = None
 _audit_logger_lock = threading.Lock()
 
+# Commit interval of the flusher thread; 0 keeps the per-database default (SQLite 2s, SQL Server 0.5s)
+AUDIT_COMMIT_INTERVAL_SECONDS = float(os.getenv("AUDIT_COMMIT_INTERVAL_SECONDS", "0"))
+AUDIT_MAX_BATCH_SIZE = int(os.getenv("AUDIT_MAX_BATCH_SIZE", "500"))
+# Entries that hit a SQLite lock are retried this many times, holding at most this many
+AUDIT_MAX_RETRIES = int(os.getenv("AUDIT_MAX_RETRIES", "5"))
+AUDIT_RETRY_QUEUE_SIZE = int(os.getenv("AUDIT_RETRY_QUEUE_SIZE", "5000"))
+AUDIT_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("AUDIT_SHUTDOWN_TIMEOUT_SECONDS", "10"))
+
 
 # Add these utility functions to app/calculations/audit_models.py or create a separate audit utils file
 
@@ -80,6 +89,11 @@ class CalculationAuditLog(Base):
     changed_fields = Column(JSON, nullable=True)
     changed_by = Column(String(100), nullable=True, index=True)
     changed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Dashboards, trends and retention all select by time range
+        Index("idx_calculation_audit_logs_changed_at", "changed_at"),
+    )
     
     def __repr__(self):
         return f"<CalculationAuditLog(id={self.id}, table={self.table_name}, record_id={self.record_id}, operation={self.operation})>"
@@ -116,104 +130,150 @@ def audit_context(user: str):
 # ===== SINGLETON AUDIT LOGGER =====
 
 class AuditLogger:
-    """Database-aware audit logger that adapts to SQLite vs SQL Server."""
+    """Database-aware audit logger that writes batches from a background flusher thread.
+
+    add_audit only queues the entry; the flusher inserts everything pending with one executemany
+    every commit interval, or as soon as a full batch is waiting. Batches that hit a SQLite lock
+    go to a bounded retry queue instead of being lost or blocking callers.
+    """
     
     def __init__(self):
         self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # One batch insert at a time (flusher or manual flush)
         self._pending_audits = []
+        self._retry_audits = deque()  # (attempts, audit_data) of entries that hit a lock
         self._last_commit_time = time.time()
+        self._last_error = None
+        self._written = 0
+        self._failed = 0
+        self._dropped = 0
+        self._retried = 0
+        self._batches = 0
         
         # Detect database type and configure accordingly
         from app.core.database import DATABASE_URL
         self._is_sqlite = DATABASE_URL.startswith("sqlite")
         
         if self._is_sqlite:
-            # SQLite configuration: Use batching to avoid locks
-            self._commit_interval = 2.0
-            self._max_batch_size = 25
-            self._use_batching = True
+            # SQLite configuration: longer interval so audit writes rarely compete for the writer lock
+            self._commit_interval = AUDIT_COMMIT_INTERVAL_SECONDS or 2.0
             print("🔍 Audit system: SQLite detected - using batched commits")
         else:
-            # SQL Server configuration: Use immediate commits
-            self._commit_interval = 0.1  # Very short for near-immediate commits
-            self._max_batch_size = 1     # Commit every single audit entry
-            self._use_batching = False
-            print("🔍 Audit system: SQL Server detected - using immediate commits")
+            # SQL Server configuration: short interval, still one bulk insert per batch
+            self._commit_interval = AUDIT_COMMIT_INTERVAL_SECONDS or 0.5
+            print("🔍 Audit system: SQL Server detected - using batched commits")
+        self._max_batch_size = AUDIT_MAX_BATCH_SIZE
+        self._use_batching = True
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._run_flusher, name="audit-flusher", daemon=True)
+        self._flusher.start()
         
     def _get_session(self):
         """Get a new session for audit operations."""
         from app.core.database import SessionLocal
         return SessionLocal()
     
-    def _should_commit(self) -> bool:
-        """Check if we should commit pending audits."""
-        return (
-            len(self._pending_audits) >= self._max_batch_size or
-            time.time() - self._last_commit_time >= self._commit_interval
-        )
-    
     def add_audit(self, audit_data: Dict[str, Any]) -> None:
-        """Add an audit entry with database-appropriate handling."""
+        """Queue an audit entry for the flusher thread."""
         try:
             with self._lock:
                 self._pending_audits.append(audit_data)
-                
-                if self._should_commit():
-                    self._commit_pending()
-                    
+                batch_ready = len(self._pending_audits) >= self._max_batch_size
+            if batch_ready or self._stop.is_set():
+                # A full batch (or a logger that is closing) shouldn't wait for the interval
+                self._wake.set()
         except Exception as e:
             print(f"Warning: Could not add audit entry: {e}")
-    
+
+    def _run_flusher(self) -> None:
+        """Commit pending audits every interval, or as soon as a full batch is waiting."""
+        while not self._stop.is_set():
+            self._wake.wait(self._commit_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self._commit_pending()
+            except Exception as e:
+                print(f"Warning: Audit flusher failed: {e}")
+
     def _commit_pending(self) -> None:
-        """Commit pending audits using database-appropriate strategy."""
-        if not self._pending_audits:
-            return
-            
+        """Insert queued audits (entries waiting for a retry first) in batches of max_batch_size."""
+        with self._write_lock:
+            while True:
+                with self._lock:
+                    batch = [self._retry_audits.popleft() for _ in range(min(len(self._retry_audits), self._max_batch_size))]
+                    room = self._max_batch_size - len(batch)
+                    batch += [(0, audit_data) for audit_data in self._pending_audits[:room]]
+                    del self._pending_audits[:room]
+                if not batch:
+                    return
+                if not self._insert_batch(batch):
+                    return  # Locked - leave the rest for the next interval
+
+    def _insert_batch(self, batch: List[tuple]) -> bool:
+        """Bulk insert one batch. Returns False when the database was locked and the batch was queued for a retry."""
         session = None
         try:
             session = self._get_session()
-            
-            # Create audit log entries
-            for audit_data in self._pending_audits:
-                audit_log = CalculationAuditLog(**audit_data)
-                session.add(audit_log)
-            
+            session.execute(insert(CalculationAuditLog), [audit_data for _, audit_data in batch])
             session.commit()
-            self._pending_audits.clear()
-            self._last_commit_time = time.time()
+            with self._lock:
+                self._written += len(batch)
+                self._batches += 1
+                self._last_commit_time = time.time()
+            return True
             
         except Exception as e:
-            if self._is_sqlite and "database is locked" in str(e):
-                print(f"Warning: SQLite lock detected - will retry later: {e}")
-                # For SQLite, don't clear pending audits on lock error - they'll retry
-            else:
-                print(f"Warning: Audit commit failed: {e}")
-                self._pending_audits.clear()  # Clear to prevent infinite retries
-            
             if session:
                 try:
                     session.rollback()
-                except:
+                except Exception:
                     pass
+            with self._lock:
+                self._last_error = str(e)
+                if self._is_sqlite and "database is locked" in str(e):
+                    print(f"Warning: SQLite lock detected - will retry later: {e}")
+                    self._queue_retries(batch)
+                    return False
+                print(f"Warning: Audit commit failed: {e}")
+                self._failed += len(batch)  # Dropped to prevent infinite retries
+                return True
         finally:
             if session:
                 try:
                     session.close()
-                except:
+                except Exception:
                     pass
+
+    def _queue_retries(self, batch: List[tuple]) -> None:
+        """Keep locked entries for another attempt, within the retry limits (caller holds the lock)."""
+        for attempts, audit_data in reversed(batch):
+            if attempts + 1 > AUDIT_MAX_RETRIES:
+                self._dropped += 1
+                continue
+            self._retry_audits.appendleft((attempts + 1, audit_data))
+            self._retried += 1
+        while len(self._retry_audits) > AUDIT_RETRY_QUEUE_SIZE:
+            # Full retry queue - drop from the back rather than grow without bound
+            self._retry_audits.pop()
+            self._dropped += 1
     
     def flush(self) -> None:
-        """Force commit all pending audits."""
+        """Force commit all pending audits now, in the calling thread."""
         try:
-            with self._lock:
-                if self._pending_audits:
-                    self._commit_pending()
+            self._commit_pending()
         except Exception as e:
             print(f"Warning: Audit flush failed: {e}")
     
     def close(self) -> None:
-        """Close the audit logger and commit any pending entries."""
+        """Stop the flusher thread and commit any pending entries."""
         try:
+            self._stop.set()
+            self._wake.set()
+            self._flusher.join(AUDIT_SHUTDOWN_TIMEOUT_SECONDS)
             self.flush()
         except Exception as e:
             print(f"Warning: Audit logger close failed: {e}")
@@ -223,10 +283,18 @@ class AuditLogger:
         with self._lock:
             return {
                 "pending_count": len(self._pending_audits),
+                "retry_queue_count": len(self._retry_audits),
+                "written_count": self._written,
+                "failed_count": self._failed,
+                "dropped_count": self._dropped,
+                "retried_count": self._retried,
+                "batches_committed": self._batches,
                 "last_commit_time": self._last_commit_time,
+                "last_error": self._last_error,
                 "commit_interval": self._commit_interval,
                 "max_batch_size": self._max_batch_size,
                 "use_batching": self._use_batching,
+                "flusher_running": self._flusher.is_alive(),
                 "database_type": "sqlite" if self._is_sqlite else "sql_server",
                 "is_sqlite": self._is_sqlite
             }
@@ -319,6 +387,7 @@ def setup_calculation_audit_listeners():
     
     # Import here to avoid circular imports
     from app.calculations.models import UserCalculation, SystemCalculation
+    from app.calculations.definition_cache import invalidate_calculation_definition
     
     # Store original values before updates - simplified approach
     _original_values = {}
@@ -329,6 +398,7 @@ def setup_calculation_audit_listeners():
     def user_calc_after_insert(mapper, connection, target):
         """Log insert operation immediately."""
         if target.id:
+            invalidate_calculation_definition(target)
             try:
                 new_values = serialize_model_instance(target)
                 log_audit_entry('user_calculations', target.id, 'INSERT', None, new_values)
@@ -373,6 +443,7 @@ def setup_calculation_audit_listeners():
     def user_calc_after_update(mapper, connection, target):
         """Log update operation."""
         if target.id:
+            invalidate_calculation_definition(target)
             try:
                 old_values = _original_values.pop(f"user_calc_{target.id}", None)
                 new_values = serialize_model_instance(target)
@@ -386,6 +457,7 @@ def setup_calculation_audit_listeners():
     def user_calc_before_delete(mapper, connection, target):
         """Log delete operation."""
         if target.id:
+            invalidate_calculation_definition(target)
             try:
                 old_values = serialize_model_instance(target)
                 log_audit_entry('user_calculations', target.id, 'DELETE', old_values, None)
@@ -398,6 +470,7 @@ def setup_calculation_audit_listeners():
     def system_calc_after_insert(mapper, connection, target):
         """Log insert operation."""
         if target.id:
+            invalidate_calculation_definition(target)
             try:
                 new_values = serialize_model_instance(target)
                 log_audit_entry('system_calculations', target.id, 'INSERT', None, new_values)
@@ -440,6 +513,7 @@ def setup_calculation_audit_listeners():
     def system_calc_after_update(mapper, connection, target):
         """Log update operation."""
         if target.id:
+            invalidate_calculation_definition(target)
             try:
                 old_values = _original_values.pop(f"system_calc_{target.id}", None)
                 new_values = serialize_model_instance(target)
@@ -453,6 +527,7 @@ def setup_calculation_audit_listeners():
     def system_calc_before_delete(mapper, connection, target):
         """Log delete operation."""
         if target.id:
+            invalidate_calculation_definition(target)
             try:
                 old_values = serialize_model_instance(target)
                 log_audit_entry('system_calculations', target.id, 'DELETE', old_values, None)
@@ -249,10 +249,12 @@ class CalculationAuditService:
         if days_to_keep > 3650:  # 10 years
             raise ValueError("Retention period cannot exceed 10 years")
 
-        deleted_count = self.audit_dao.cleanup_old_audit_logs(days_to_keep)
+        result = self.audit_dao.cleanup_old_audit_logs(days_to_keep)
         
         return {
-            "deleted_count": deleted_count,
+            "deleted_count": result.deleted_count,
+            "truncated_partitions": result.truncated_partitions,
+            "delete_batches": result.delete_batches,
             "retention_days": days_to_keep,
             "cleanup_date": datetime.now().isoformat()
         }
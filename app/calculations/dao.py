@@ -2,9 +2,60 @@
 """Data Access Objects for the new separated calculation system"""
 
 from sqlalchemy.orm import Session
+from sqlalchemy import or_
 from typing import List, Optional, Dict, Any
 from .models import UserCalculation, SystemCalculation, GroupLevel
 
+# Calculation ids per usage query - keeps the IN list under SQL Server's parameter limit
+USAGE_QUERY_BATCH_SIZE = 1000
+
+
+def get_report_usage(db: Session, calc_ids: List[int], calculation_types: List[Optional[str]]) -> Dict[int, List[Dict[str, Any]]]:
+    """Map each calculation id to the active reports using it - one query per USAGE_QUERY_BATCH_SIZE ids"""
+    # Import here to avoid circular imports
+    from app.reporting.models import ReportCalculation, Report
+
+    usage = {calc_id: [] for calc_id in calc_ids}
+    if not calc_ids:
+        return usage
+
+    type_conditions = [
+        ReportCalculation.calculation_type.is_(None) if calc_type is None
+        else ReportCalculation.calculation_type == calc_type
+        for calc_type in calculation_types
+    ]
+    rows = []
+    calc_id_strings = [str(calc_id) for calc_id in calc_ids]
+    for start in range(0, len(calc_id_strings), USAGE_QUERY_BATCH_SIZE):
+        rows += (
+            db.query(
+                ReportCalculation.calculation_id,
+                ReportCalculation.display_order,
+                ReportCalculation.display_name,
+                Report.id,
+                Report.name,
+                Report.scope,
+            )
+            .join(Report)
+            .filter(
+                # calculation_id holds the string form of the integer id
+                ReportCalculation.calculation_id.in_(calc_id_strings[start:start + USAGE_QUERY_BATCH_SIZE]),
+                or_(*type_conditions),
+                Report.is_active == True
+            )
+            .order_by(ReportCalculation.id)
+            .all()
+        )
+    for calculation_id, display_order, display_name, report_id, report_name, report_scope in rows:
+        usage[int(calculation_id)].append({
+            "report_id": report_id,
+            "report_name": report_name,
+            "report_scope": report_scope,
+            "display_order": display_order,
+            "display_name": display_name
+        })
+    return usage
+
 
 class UserCalculationDAO:
     """DAO for user-defined calculations"""
@@ -93,6 +144,10 @@ class UserCalculationDAO:
         self.db.delete(calculation)
         self.db.commit()
 
+    def get_usage_by_ids(self, calc_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Get the reports using each user calculation (legacy rows have no calculation_type)"""
+        return get_report_usage(self.db, calc_ids, ['user_calculation', 'user', None])
+
     def count_by_group_level(self) -> Dict[str, int]:
         """Get count of user calculations by group level"""
         results = (
@@ -171,6 +226,10 @@ class SystemCalculationDAO:
             .all()
         )
 
+    def get_usage_by_ids(self, calc_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Get the reports using each system calculation"""
+        return get_report_usage(self.db, calc_ids, ['system_calculation', 'system'])
+
     def get_pending_approval(self) -> List[SystemCalculation]:
         """Get system calculations pending approval"""
         return (
@@ -0,0 +1,151 @@
+# app/calculations/definition_cache.py
+"""Versioned read-through cache of user and system calculation definitions."""
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from typing import Dict, Any, Optional, List, Iterable, Tuple, Type
+import os
+import threading
+import time
+
+
+CALC_DEFINITION_CACHE_ENABLED = os.getenv("CALC_DEFINITION_CACHE_ENABLED", "true").lower() == "true"
+# Invalidation hooks only reach this process - other workers pick up changes after the TTL
+CALC_DEFINITION_CACHE_TTL_SECONDS = float(os.getenv("CALC_DEFINITION_CACHE_TTL_SECONDS", "60"))
+
+CalculationModel = Type[Any]  # UserCalculation or SystemCalculation
+
+# Global definition cache singleton
+_definition_cache = None
+_definition_cache_lock = threading.Lock()
+
+
+class CalculationDefinitionCache:
+    """Thread-safe cache of active calculation definitions, keyed by (table, id).
+
+    Entries are detached copies (or None for ids with no active definition), so they can be
+    shared between sessions and threads. Every
+    invalidation bumps a version; a load that started before an invalidation is not stored.
+    """
+
+    def __init__(self, ttl_seconds: float = CALC_DEFINITION_CACHE_TTL_SECONDS):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int], tuple] = {}  # key -> (loaded_at, definition)
+        self._ttl_seconds = ttl_seconds
+        self._version = 0
+        self._hits = 0
+        self._misses = 0
+        self._loads = 0
+
+    def get(self, db: Session, model: CalculationModel, calc_id: int) -> Optional[Any]:
+        """Get an active calculation definition, loading it on a miss."""
+        return self.get_many(db, model, [calc_id]).get(calc_id)
+
+    def get_many(self, db: Session, model: CalculationModel, calc_ids: Iterable[int],
+                 refresh: bool = False) -> Dict[int, Any]:
+        """Get active calculation definitions by id, loading every miss (or every id, on refresh) with one query."""
+        found, missing = {}, []
+        with self._lock:
+            version = self._version
+            for calc_id in dict.fromkeys(calc_ids):
+                entry = self._entries.get((model.__tablename__, calc_id))
+                if entry and not refresh and not self._is_expired(entry[0]):
+                    if entry[1] is not None:
+                        found[calc_id] = entry[1]
+                    self._hits += 1
+                else:
+                    missing.append(calc_id)
+                    self._misses += 1
+
+        if missing:
+            loaded = db.query(model).filter(model.id.in_(missing), model.is_active == True).all()
+            snapshots = {calc.id: _snapshot(calc) for calc in loaded}
+            with self._lock:
+                self._loads += 1
+                if self._version == version:
+                    # Nothing changed while loading - safe to keep. Ids that aren't in this table are
+                    # remembered too, so type auto-detection doesn't query for them on every run
+                    loaded_at = time.time()
+                    for calc_id in missing:
+                        self._entries[(model.__tablename__, calc_id)] = (loaded_at, snapshots.get(calc_id))
+            found.update(snapshots)
+        return found
+
+    def invalidate(self, model: Optional[CalculationModel] = None, calc_id: Optional[int] = None) -> None:
+        """Drop one definition, or all of them, and bump the version."""
+        with self._lock:
+            self._version += 1
+            if model is None or calc_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((model.__tablename__, calc_id), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get definition cache statistics."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "version": self._version,
+                "ttl_seconds": self._ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "loads": self._loads,
+            }
+
+    def _is_expired(self, loaded_at: float) -> bool:
+        return bool(self._ttl_seconds) and time.time() - loaded_at > self._ttl_seconds
+
+
+def _snapshot(calc):
+    """Detached copy of a loaded definition with every column attribute set."""
+    copy = type(calc)()
+    # Column order keeps validators happy (aggregation_function is set before weight_field)
+    for attr in inspect(type(calc)).column_attrs:
+        setattr(copy, attr.key, getattr(calc, attr.key))
+    return copy
+
+
+def get_calculation_definition_cache() -> CalculationDefinitionCache:
+    """Get the singleton calculation definition cache."""
+    global _definition_cache
+    if _definition_cache is None:
+        with _definition_cache_lock:
+            if _definition_cache is None:
+                _definition_cache = CalculationDefinitionCache()
+    return _definition_cache
+
+
+def load_calculation_definitions(db: Session, model: CalculationModel, calc_ids: List[int],
+                                 refresh: bool = False) -> Dict[int, Any]:
+    """Active definitions by id, through the cache unless it is disabled.
+
+    refresh reads the committed definitions even when cached copies haven't expired yet.
+    """
+    if not CALC_DEFINITION_CACHE_ENABLED:
+        return {calc.id: calc for calc in db.query(model).filter(model.id.in_(calc_ids), model.is_active == True)}
+    return get_calculation_definition_cache().get_many(db, model, calc_ids, refresh)
+
+
+def load_calculation_definition(db: Session, model: CalculationModel, calc_id: int) -> Optional[Any]:
+    """Active definition by id, through the cache unless it is disabled."""
+    return load_calculation_definitions(db, model, [calc_id]).get(calc_id)
+
+
+def invalidate_calculation_definition(target) -> None:
+    """Drop a changed definition now and again once its transaction commits.
+
+    Mapper events fire at flush, so a concurrent load could still read the old committed row
+    until the commit - the second invalidation removes whatever it cached.
+    """
+    model, calc_id = type(target), target.id
+    try:
+        get_calculation_definition_cache().invalidate(model, calc_id)
+        session = object_session(target)
+        if session is not None:
+            event.listen(
+                session, "after_commit",
+                lambda committed_session: get_calculation_definition_cache().invalidate(model, calc_id),
+                once=True,
+            )
+    except Exception as e:
+        print(f"Warning: Could not invalidate calculation definition cache: {e}")
@@ -3,10 +3,60 @@
 
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass
-
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Callable
+from dataclasses import dataclass, field, replace
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from contextlib import contextmanager, nullcontext
+import hashlib
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.core.exceptions import ReportGenerationError, ReportTimeoutError
 from .models import UserCalculation, SystemCalculation, AggregationFunction, get_static_field_info
+from .definition_cache import load_calculation_definition
+
+
+# "compiled" fuses every calculation that shares a group level into one statement,
+# "individual" runs one query per calculation (easiest to debug),
+# "parallel" runs the per-calculation queries concurrently on separate warehouse connections
+EXECUTION_MODES = ("compiled", "individual", "parallel")
+DEFAULT_EXECUTION_MODE = os.getenv("REPORT_EXECUTION_MODE", "compiled").lower()
+
+# Parallel mode limits: connections per report execution, connections across all reports,
+# and how long a report's queries may run before they are cancelled
+REPORT_MAX_PARALLEL_QUERIES = int(os.getenv("REPORT_MAX_PARALLEL_QUERIES", "4"))
+REPORT_GLOBAL_MAX_PARALLEL_QUERIES = int(os.getenv("REPORT_GLOBAL_MAX_PARALLEL_QUERIES", "8"))
+REPORT_QUERY_TIMEOUT_SECONDS = float(os.getenv("REPORT_QUERY_TIMEOUT_SECONDS", "300"))
+
+_global_query_slots = threading.BoundedSemaphore(REPORT_GLOBAL_MAX_PARALLEL_QUERIES)
+
+# "vectorized" key-aligns calculation columns with hash joins, "rows" is the original
+# per-row dictionary merge (kept as the reference implementation)
+MERGE_STRATEGIES = ("vectorized", "rows")
+REPORT_MERGE_STRATEGY = os.getenv("REPORT_MERGE_STRATEGY", "vectorized").lower()
+# Below this many result rows the pandas setup costs more than the row merge saves
+REPORT_VECTORIZED_MERGE_MIN_ROWS = int(os.getenv("REPORT_VECTORIZED_MERGE_MIN_ROWS", "5000"))
+
+# Rows per batch when streaming a report - bounds what a streaming request holds in memory
+REPORT_STREAM_BATCH_SIZE = int(os.getenv("REPORT_STREAM_BATCH_SIZE", "1000"))
+
+# When enabled, every statement is tagged with a hash of its text and report debug info
+# says how often that text has run (and, on SQL Server, how often its cached plan was reused)
+REPORT_PLAN_REUSE_STATS = os.getenv("REPORT_PLAN_REUSE_STATS", "false").lower() == "true"
+
+# Selections with more deal/tranche entries than this are staged into a temp table and
+# joined, instead of being spelled out as an OR chain in every statement
+SELECTION_STAGING_THRESHOLD = int(os.getenv("REPORT_SELECTION_STAGING_THRESHOLD", "500"))
+# Staged tr_id for deals selected with all of their tranches
+ALL_TRANCHES = "*"
+
+_statement_executions: Dict[str, int] = {}
+_statement_executions_lock = threading.Lock()
 
 
 @dataclass
@@ -32,6 +82,8 @@ class QueryFilters:
     """Standard filters applied to all calculations"""
     deal_tranche_map: Dict[int, List[str]]  # deal_id -> [tranche_ids] or [] for all
     cycle_code: int
+    selection_table: Optional[str] = None  # Temp table holding the staged selection, if any
+    prepared: Optional["PreparedStatements"] = None  # SQL generated ahead of time for this selection
 
 
 @dataclass
@@ -41,52 +93,396 @@ class QueryResult:
     columns: List[str]
     calc_type: str
     group_level: Optional[str] = None
+    params: Dict[str, Any] = field(default_factory=dict)  # Bind values for the :name placeholders in sql
+
+
+@dataclass
+class PreparedStatements:
+    """SQL generated ahead of time for a fixed selection and set of calculations.
+
+    Only the bind values change between runs; params of the stored queries are ignored.
+    """
+    selection_table: Optional[str]  # Staged selection table the statements read from, if any
+    queries: Dict[str, QueryResult]  # alias -> per-calculation statement
+    compiled_queries: Dict[str, QueryResult]  # group level -> fused statement
+    compile_errors: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class CompiledColumn:
+    """A single calculation lowered into one column of a fused group-level statement"""
+    alias: str
+    source: str  # CTE the column is computed in: "static", "agg" or "sys_<n>"
+    expression: str  # Aggregate expression evaluated inside that CTE
+    from_clause: Optional[str] = None  # Only used by system calculation CTEs
+    condition: Optional[str] = None  # Advanced filter - keys it matches no rows for are left out, as per calculation
+
+
+@dataclass
+class CompiledLevel:
+    """All calculations of one group level, compiled into a single statement"""
+    group_level: str
+    columns: List[CompiledColumn] = field(default_factory=list)
+
+
+class ExecutionTimings:
+    """Where the time of one report execution went.
+
+    Entries are per stage: "query" (one per statement, named by calculation alias or compiled
+    level, with the rows it fetched), "merge" and "serialization". Thread-safe, so parallel
+    workers can record into it.
+    """
+
+    def __init__(self, entries: Optional[List[Dict[str, Any]]] = None):
+        self._lock = threading.Lock()
+        self.entries: List[Dict[str, Any]] = list(entries or [])
+
+    def record(self, stage: str, name: Optional[str], duration_ms: float, row_count: Optional[int] = None):
+        """Add one timed stage"""
+        with self._lock:
+            self.entries.append({
+                'stage': stage, 'name': name, 'duration_ms': duration_ms, 'row_count': row_count
+            })
+
+    @contextmanager
+    def measure(self, stage: str, name: Optional[str] = None):
+        """Time a block; the block may set row_count on the yielded entry"""
+        entry = {'row_count': None}
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            self.record(stage, name, (time.perf_counter() - start) * 1000, entry['row_count'])
 
 
 class SimpleCalculationResolver:
     """Generates simple, debuggable SQL for each calculation type"""
 
-    def __init__(self, dw_db: Session, config_db: Session):
+    def __init__(self, dw_db: Session, config_db: Session, timings: Optional[ExecutionTimings] = None):
         self.dw_db = dw_db
         self.config_db = config_db
+        self.timings = timings  # Collects statement and merge timings when set
+        # Runs the in-memory merge, given the merge function and its arguments - set to move it
+        # off the calling thread (the event loop, when running on an async session)
+        self.run_merge: Optional[Callable[..., List[Dict[str, Any]]]] = None
 
-    def resolve_report(self, calc_requests: List[CalculationRequest], filters: QueryFilters) -> Dict[str, Any]:
+    def resolve_report(self, calc_requests: List[CalculationRequest], filters: QueryFilters,
+                       execution_mode: Optional[str] = None) -> Dict[str, Any]:
         """Main entry point - resolves all calculations and merges results"""
+        execution_mode = (execution_mode or DEFAULT_EXECUTION_MODE).lower()
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode: {execution_mode}")
+
+        if execution_mode == "parallel":
+            # Each worker connection stages its own copy of the selection
+            return self._resolve_report_parallel(calc_requests, filters)
+
+        filters = self._stage_selection(filters)
+        try:
+            result = self._resolve_report_with_mode(calc_requests, filters, execution_mode)
+        finally:
+            if filters.selection_table:
+                self._drop_selection_table(filters.selection_table)
+
+        result['debug_info']['selection_staged'] = filters.selection_table is not None
+        return result
+
+    def _resolve_report_with_mode(self, calc_requests: List[CalculationRequest], filters: QueryFilters,
+                                  execution_mode: str) -> Dict[str, Any]:
+        """Run the requested execution path"""
+        if execution_mode == "compiled":
+            try:
+                return self._resolve_report_compiled(calc_requests, filters)
+            except Exception as e:
+                # A fused statement that fails (usually a bad system SQL) must not blank the
+                # report - rerun through the per-calculation path so errors stay isolated
+                print(f"Warning: Compiled report execution failed, falling back to individual queries: {e}")
+                result = self._resolve_report_individual(calc_requests, filters)
+                result['debug_info']['compiled_fallback_error'] = str(e)
+                return result
+
+        return self._resolve_report_individual(calc_requests, filters)
+
+    def stream_report(self, calc_requests: List[CalculationRequest], filters: QueryFilters,
+                      execution_mode: Optional[str] = None,
+                      batch_size: int = REPORT_STREAM_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the merged report rows in batches, in the same order as resolve_report.
+
+        Compiled mode reads the tranche-level statement through a server-side cursor, so only the
+        deal-level values and one batch of rows are held at a time. The other modes, and a compiled
+        statement that fails before producing rows, resolve the report in full and yield it in batches.
+        """
+        execution_mode = (execution_mode or DEFAULT_EXECUTION_MODE).lower()
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode: {execution_mode}")
+
+        if execution_mode != "compiled":
+            merged_data = self.resolve_report(calc_requests, filters, execution_mode)['merged_data']
+            yield from self._batched(merged_data, batch_size)
+            return
+
+        filters = self._stage_selection(filters)
+        batches = self._stream_compiled(calc_requests, filters, batch_size)
+        try:
+            try:
+                first_batch = next(batches, None)
+            except Exception as e:
+                print(f"Warning: Compiled report streaming failed, falling back to individual queries: {e}")
+                merged_data = self._resolve_report_individual(calc_requests, filters)['merged_data']
+                yield from self._batched(merged_data, batch_size)
+                return
+
+            if first_batch is not None:
+                yield first_batch
+                yield from batches
+        finally:
+            # Close the cursor before the staged selection it reads from is dropped
+            batches.close()
+            if filters.selection_table:
+                self._drop_selection_table(filters.selection_table)
+
+    def _stream_compiled(self, calc_requests: List[CalculationRequest], filters: QueryFilters,
+                         batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Run the fused statements, fetching tranche rows batch by batch and merging deal values onto them"""
+        _, queries, _ = self.compile_report(calc_requests, filters)
+
+        deal_query = queries.get("deal")
+        deal_rows = self._execute_compiled_level(deal_query) if deal_query else []
+        tranche_query = queries.get("tranche")
+        if tranche_query is None:
+            with self._measure("merge"):
+                merged_data = self._merge_compiled_results(deal_rows, [], filters)
+            yield from self._batched(merged_data, batch_size)
+            return
+
+        deal_values = self._compiled_deal_values(deal_rows)
+        # Fetching and merging interleave with the consumer, so their time is summed per batch
+        query_ms, merge_ms, row_count = 0.0, 0.0, 0
+        start = time.perf_counter()
+        result = self._run_statement(tranche_query.sql, tranche_query.params, stream=True)
+        try:
+            rows_streamed = False
+            while True:
+                rows = result.fetchmany(batch_size)
+                fetched = time.perf_counter()
+                query_ms += (fetched - start) * 1000
+                if not rows:
+                    break
+                row_count += len(rows)
+                tranche_rows = self._compiled_rows(tranche_query, rows)
+                batch = self._merge_compiled_tranche_rows(deal_values, tranche_rows, filters)
+                merge_ms += (time.perf_counter() - fetched) * 1000
+                if batch:
+                    rows_streamed = True
+                    yield batch
+                start = time.perf_counter()
+        finally:
+            result.close()
+            if self.timings is not None:
+                self.timings.record("query", "compiled_tranche", query_ms, row_count)
+                self.timings.record("merge", None, merge_ms)
+
+        if not rows_streamed:
+            # Matches _merge_compiled_results, which falls back to deal rows without tranche rows
+            yield from self._batched(self._merge_compiled_results(deal_rows, [], filters), batch_size)
+
+    def _batched(self, rows: List[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Split already merged rows into batches"""
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+
+    def _resolve_report_individual(self, calc_requests: List[CalculationRequest], filters: QueryFilters) -> Dict[str, Any]:
+        """Debug path - one SQL statement per calculation, merged in memory"""
 
         # 1. Resolve each calculation to individual SQL queries
         individual_results = {}
         for request in calc_requests:
+            query_result = None
             try:
                 query_result = self.resolve_single_calculation(request, filters)
                 individual_results[request.alias] = {
                     'query_result': query_result,
-                    'data': self._execute_sql(query_result.sql)
+                    'columns': self._execute_calculation_sql(request.alias, query_result)
                 }
             except Exception as e:
-                # Store error but continue processing other calculations
+                # Store error but continue processing other calculations - a statement that
+                # failed to run keeps its SQL for debugging
                 individual_results[request.alias] = {
-                    'query_result': QueryResult(f"-- ERROR: {str(e)}", [], "error"),
-                    'data': [],
+                    'query_result': query_result or QueryResult(f"-- ERROR: {str(e)}", [], "error"),
+                    'columns': {},
                     'error': str(e)
                 }
 
         # 2. Merge results in memory based on common keys
-        merged_data = self._merge_calculation_results(individual_results, filters)
+        merged_data = self._merge(self._merge_calculation_results, individual_results, filters)
+        individual_queries = {alias: result['query_result'] for alias, result in individual_results.items()}
 
         return {
             'merged_data': merged_data,
-            'individual_queries': {alias: result['query_result'] for alias, result in individual_results.items()},
-            'debug_info': {
-                'total_calculations': len(calc_requests),
-                'static_fields': len([r for r in calc_requests if r.calc_type == 'static_field']),
-                'user_calculations': len([r for r in calc_requests if r.calc_type == 'user_calculation']),
-                'system_calculations': len([r for r in calc_requests if r.calc_type == 'system_calculation']),
-                'errors': [alias for alias, result in individual_results.items() if 'error' in result]
-            }
+            'individual_queries': individual_queries,
+            'debug_info': self._build_debug_info(
+                calc_requests,
+                "individual",
+                [alias for alias, result in individual_results.items() if 'error' in result],
+                individual_queries
+            )
         }
 
+    def _resolve_report_parallel(self, calc_requests: List[CalculationRequest], filters: QueryFilters) -> Dict[str, Any]:
+        """Parallel path - per-calculation queries on a bounded pool of warehouse connections.
+
+        SQL is resolved up front on this thread (the config session is not thread-safe); workers
+        only execute it. Results are merged in request order, so output matches the individual path.
+        A statement that fails cancels the other workers and fails the execution.
+        """
+        selection_table = self.selection_table_for(filters)
+        query_filters = replace(filters, selection_table=selection_table)
+
+        individual_results: Dict[str, Dict[str, Any]] = {}
+        pending: "queue.Queue[Tuple[str, QueryResult]]" = queue.Queue()
+        for request in calc_requests:
+            try:
+                pending.put((request.alias, self.resolve_single_calculation(request, query_filters)))
+            except Exception as e:
+                individual_results[request.alias] = {
+                    'query_result': QueryResult(f"-- ERROR: {str(e)}", [], "error"),
+                    'columns': {},
+                    'error': str(e)
+                }
+
+        executed: Dict[str, Dict[str, Any]] = {}
+        cancelled = threading.Event()
+        active_connections: List[Any] = []
+        connections_lock = threading.Lock()
+        engine = self.dw_db.get_bind()
+        deadline = time.monotonic() + REPORT_QUERY_TIMEOUT_SECONDS
+
+        def run_worker():
+            if not _global_query_slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                return  # No slot before the deadline - reported as a timeout below
+            try:
+                with engine.connect() as connection:
+                    dbapi_connection = connection.connection.driver_connection
+                    if engine.dialect.name == "mssql":
+                        # pyodbc query timeout, so SQL Server cancels the statement server-side
+                        dbapi_connection.timeout = max(int(deadline - time.monotonic()), 1)
+                    with connections_lock:
+                        active_connections.append(dbapi_connection)
+                    try:
+                        if selection_table:
+                            self._create_selection_table(filters, selection_table, connection)
+                        while not cancelled.is_set():
+                            try:
+                                alias, query_result = pending.get_nowait()
+                            except queue.Empty:
+                                break
+                            try:
+                                columns = self._execute_calculation_sql(alias, query_result, connection)
+                            except Exception as e:
+                                raise ReportGenerationError(f"Calculation '{alias}' failed: {e}") from e
+                            with connections_lock:
+                                if cancelled.is_set():
+                                    break  # The execution already failed or timed out - drop the result
+                                executed[alias] = {'query_result': query_result, 'columns': columns}
+                    finally:
+                        with connections_lock:
+                            active_connections.remove(dbapi_connection)
+                        if engine.dialect.name == "mssql":
+                            dbapi_connection.timeout = 0  # Back to the pool without a query timeout
+            finally:
+                _global_query_slots.release()
+
+        worker_count = max(1, min(REPORT_MAX_PARALLEL_QUERIES, pending.qsize()))
+        pool = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="report-query")
+        futures = [pool.submit(run_worker) for _ in range(worker_count)]
+        done, not_done = wait(futures, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_EXCEPTION)
+
+        def cancel_workers():
+            with connections_lock:
+                cancelled.set()
+                for dbapi_connection in active_connections:
+                    if hasattr(dbapi_connection, "interrupt"):  # sqlite3
+                        dbapi_connection.interrupt()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        failed = [future for future in done if future.exception()]
+        if failed:
+            cancel_workers()
+            raise ReportGenerationError(f"Parallel report execution failed: {failed[0].exception()}")
+        if not_done or not pending.empty():
+            cancel_workers()
+            raise ReportTimeoutError(
+                f"Report queries did not finish within {REPORT_QUERY_TIMEOUT_SECONDS:g} seconds and were cancelled"
+            )
+        pool.shutdown()
+
+        # Restore request order so the merge is deterministic
+        individual_results.update(executed)
+        individual_results = {
+            request.alias: individual_results[request.alias]
+            for request in calc_requests if request.alias in individual_results
+        }
+
+        merged_data = self._merge(self._merge_calculation_results, individual_results, filters)
+        individual_queries = {alias: result['query_result'] for alias, result in individual_results.items()}
+
+        debug_info = self._build_debug_info(
+            calc_requests,
+            "parallel",
+            [alias for alias, result in individual_results.items() if 'error' in result],
+            individual_queries
+        )
+        debug_info['selection_staged'] = selection_table is not None
+        debug_info['parallel_workers'] = worker_count
+        return {
+            'merged_data': merged_data,
+            'individual_queries': individual_queries,
+            'debug_info': debug_info
+        }
+
+    def _resolve_report_compiled(self, calc_requests: List[CalculationRequest], filters: QueryFilters) -> Dict[str, Any]:
+        """Compiled path - one fused statement per group level, merged on (deal, tranche) keys"""
+        _, queries, errors = self.compile_report(calc_requests, filters)
+
+        level_rows = {}
+        for group_level, query_result in queries.items():
+            level_rows[group_level] = self._execute_compiled_level(query_result)
+
+        merged_data = self._merge(
+            self._merge_compiled_results, level_rows.get("deal", []), level_rows.get("tranche", []), filters
+        )
+
+        individual_queries = {f"compiled_{level}": query for level, query in queries.items()}
+        for alias, error in errors.items():
+            individual_queries[alias] = QueryResult(f"-- ERROR: {error}", [], "error")
+
+        return {
+            'merged_data': merged_data,
+            'individual_queries': individual_queries,
+            'debug_info': self._build_debug_info(calc_requests, "compiled", list(errors.keys()), individual_queries)
+        }
+
+    def _build_debug_info(self, calc_requests: List[CalculationRequest], execution_mode: str,
+                          errors: List[str], queries: Dict[str, QueryResult]) -> Dict[str, Any]:
+        """Summarise a report resolution for the execution metadata"""
+        debug_info = {
+            'execution_mode': execution_mode,
+            'total_calculations': len(calc_requests),
+            'static_fields': len([r for r in calc_requests if r.calc_type == 'static_field']),
+            'user_calculations': len([r for r in calc_requests if r.calc_type == 'user_calculation']),
+            'system_calculations': len([r for r in calc_requests if r.calc_type == 'system_calculation']),
+            'errors': errors
+        }
+        if REPORT_PLAN_REUSE_STATS:
+            debug_info['plan_reuse'] = self._collect_plan_reuse(queries)
+        return debug_info
+
     def resolve_single_calculation(self, request: CalculationRequest, filters: QueryFilters) -> QueryResult:
         """Route to appropriate resolver for this calculation type"""
+        prepared = self._prepared_statements(filters)
+        if prepared and request.alias in prepared.queries:
+            return replace(prepared.queries[request.alias], params=self.build_filter_params(filters))
+
         if request.calc_type == "static_field":
             return self._resolve_static_field(request, filters)
         elif request.calc_type == "user_calculation":
@@ -124,21 +520,14 @@ class SimpleCalculationResolver:
         # Build WHERE clause - only include cycle filter if TrancheBal is involved
         where_conditions = []
         
-        # Build deal-tranche conditions
-        deal_conditions = []
-        for deal_id, tranche_ids in filters.deal_tranche_map.items():
-            if "Tranche" in required_models and tranche_ids:  # Only filter tranches if we have Tranche model
-                tranche_list = "', '".join(tranche_ids)
-                deal_conditions.append(f"(deal.dl_nbr = {deal_id} AND tranche.tr_id IN ('{tranche_list}'))")
-            else:  # Deal-only or all tranches for this deal
-                deal_conditions.append(f"deal.dl_nbr = {deal_id}")
-
-        if deal_conditions:
-            where_conditions.append(f"({' OR '.join(deal_conditions)})")
+        # Only filter tranches if we have the Tranche model
+        selection_condition = self._build_selection_condition(filters, "Tranche" in required_models)
+        if selection_condition:
+            where_conditions.append(selection_condition)
         
         # Only add cycle filter if TrancheBal is involved
         if "TrancheBal" in required_models:
-            where_conditions.append(f"tranchebal.cycle_cde = {filters.cycle_code}")
+            where_conditions.append("tranchebal.cycle_cde = :cycle_code")
 
         where_clause = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
 
@@ -154,37 +543,14 @@ class SimpleCalculationResolver:
             columns.append("tranche_id")
         columns.append(request.alias)
 
-        return QueryResult(sql, columns, "static_field")
+        return QueryResult(sql, columns, "static_field", params=self.build_filter_params(filters))
 
     def _resolve_user_calculation(self, request: CalculationRequest, filters: QueryFilters) -> QueryResult:
         """Generate SQL for user-defined aggregations"""
-        if not request.calc_id:
-            raise ValueError("calc_id is required for user_calculation")
-
-        calc = self.config_db.query(UserCalculation).filter_by(id=request.calc_id, is_active=True).first()
-        if not calc:
-            raise ValueError(f"User calculation {request.calc_id} not found")
+        calc = self._load_user_calculation(request)
 
         # Build aggregation expression
-        agg_field = f"{calc.source_model.value.lower()}.{calc.source_field}"
-
-        if calc.aggregation_function == AggregationFunction.SUM:
-            agg_expr = f"SUM({agg_field})"
-        elif calc.aggregation_function == AggregationFunction.AVG:
-            agg_expr = f"AVG({agg_field})"
-        elif calc.aggregation_function == AggregationFunction.COUNT:
-            agg_expr = f"COUNT({agg_field})"
-        elif calc.aggregation_function == AggregationFunction.MIN:
-            agg_expr = f"MIN({agg_field})"
-        elif calc.aggregation_function == AggregationFunction.MAX:
-            agg_expr = f"MAX({agg_field})"
-        elif calc.aggregation_function == AggregationFunction.WEIGHTED_AVG:
-            if not calc.weight_field:
-                raise ValueError(f"Weight field required for weighted average calculation {calc.name}")
-            weight_field = f"{calc.source_model.value.lower()}.{calc.weight_field}"
-            agg_expr = f"SUM({agg_field} * {weight_field}) / NULLIF(SUM({weight_field}), 0)"
-        else:
-            raise ValueError(f"Unsupported aggregation function: {calc.aggregation_function}")
+        agg_expr = self._build_aggregation_expression(calc)
 
         # Build GROUP BY columns
         if calc.group_level.value == "deal":
@@ -217,16 +583,12 @@ JOIN tranchebal ON tranche.dl_nbr = tranchebal.dl_nbr AND tranche.tr_id = tranch
 {where_clause}
 GROUP BY {', '.join(group_columns)}"""
 
-        return QueryResult(sql, result_columns, "user_calculation", calc.group_level.value)
+        return QueryResult(sql, result_columns, "user_calculation", calc.group_level.value,
+                           self.build_filter_params(filters))
 
     def _resolve_system_calculation(self, request: CalculationRequest, filters: QueryFilters) -> QueryResult:
         """Generate SQL for system-defined raw SQL calculations"""
-        if not request.calc_id:
-            raise ValueError("calc_id is required for system_calculation")
-
-        calc = self.config_db.query(SystemCalculation).filter_by(id=request.calc_id, is_active=True).first()
-        if not calc:
-            raise ValueError(f"System calculation {request.calc_id} not found")
+        calc = self._load_system_calculation(request)
 
         # Inject filters into the raw SQL
         modified_sql = self._inject_filters_into_raw_sql(calc.raw_sql, filters)
@@ -237,10 +599,114 @@ GROUP BY {', '.join(group_columns)}"""
         else:  # TRANCHE level
             result_columns = ["dl_nbr", "tr_id", calc.result_column_name]
 
-        return QueryResult(modified_sql, result_columns, "system_calculation", calc.group_level.value)
+        return QueryResult(modified_sql, result_columns, "system_calculation", calc.group_level.value,
+                           self.build_filter_params(filters))
 
     def _merge_calculation_results(self, individual_results: Dict[str, Any], filters: QueryFilters) -> List[Dict[str, Any]]:
         """Merge results from different calculations based on common keys"""
+        total_rows = sum(
+            len(next(iter(result_info['columns'].values()), []))
+            for result_info in individual_results.values() if 'error' not in result_info
+        )
+        if REPORT_MERGE_STRATEGY == "vectorized" and total_rows >= REPORT_VECTORIZED_MERGE_MIN_ROWS:
+            merged_data = self._merge_calculation_columns(individual_results, filters)
+            if merged_data is not None:
+                return merged_data
+        return self._merge_calculation_rows(individual_results, filters)
+
+    def _merge_calculation_columns(self, individual_results: Dict[str, Any],
+                                   filters: QueryFilters) -> Optional[List[Dict[str, Any]]]:
+        """Columnar merge producing exactly the rows (and key order) of _merge_calculation_rows.
+
+        Each calculation's key columns become a pandas index; values are aligned onto the row spine
+        with get_indexer (a hash join) and deal-level columns are broadcast onto tranche rows by
+        position. Returns None for irregular input (duplicate or NULL keys, static fields mixing
+        levels, aliases that shadow key columns) so the caller can use the row merge instead.
+        """
+        parts: Dict[str, List[Tuple[str, pd.Index, np.ndarray]]] = {"deal": [], "tranche": []}
+
+        for alias, result_info in individual_results.items():
+            if 'error' in result_info:
+                continue
+            columns = result_info['columns']
+            row_count = len(next(iter(columns.values()))) if columns else 0
+            if not row_count:
+                continue
+            if alias in ('deal_number', 'tranche_id', 'cycle_code'):
+                return None
+
+            def column(name: str) -> np.ndarray:
+                # Missing columns read as NULL, like row.get() in the row merge
+                return np.asarray(columns.get(name, [None] * row_count), dtype=object)
+
+            group_level = result_info['query_result'].group_level
+            if group_level not in ("deal", "tranche"):  # Static fields - level depends on tranche_id
+                tranche_ids = column('tranche_id')
+                missing_tranches = tranche_ids == None  # noqa: E711 - elementwise on object arrays
+                if missing_tranches.all():
+                    group_level = "deal"
+                elif not missing_tranches.any():
+                    group_level = "tranche"
+                else:
+                    return None
+
+            key_arrays = [column('deal_number')] + ([column('tranche_id')] if group_level == "tranche" else [])
+            if any((key_array == None).any() for key_array in key_arrays):  # noqa: E711
+                return None
+            index = pd.MultiIndex.from_arrays(key_arrays) if group_level == "tranche" else pd.Index(key_arrays[0], dtype=object)
+            if index.has_duplicates:
+                return None
+            parts[group_level].append((alias, index, column(alias)))
+
+        def align(level_parts: List[Tuple[str, pd.Index, np.ndarray]]):
+            """Row spine in first-seen order plus every alias' values and presence on it"""
+            spine = level_parts[0][1].append([index for _, index, _ in level_parts[1:]]).drop_duplicates()
+            aligned = []
+            for alias, index, values in level_parts:
+                positions = index.get_indexer(spine)
+                present = positions >= 0
+                spine_values = np.full(len(spine), None, dtype=object)
+                spine_values[present] = values[positions[present]]
+                aligned.append((alias, spine_values, present))
+            return spine, aligned
+
+        if parts["tranche"]:
+            spine, aligned = align(parts["tranche"])
+            key_columns = [
+                ('deal_number', spine.get_level_values(0).tolist()),
+                ('tranche_id', spine.get_level_values(1).tolist()),
+            ]
+            if parts["deal"]:
+                deal_spine, deal_aligned = align(parts["deal"])
+                deal_positions = deal_spine.get_indexer(spine.get_level_values(0))
+                has_deal = deal_positions >= 0
+                safe_positions = np.where(has_deal, deal_positions, 0)
+                aligned += [
+                    (alias, np.where(has_deal, values[safe_positions], None), has_deal & present[safe_positions])
+                    for alias, values, present in deal_aligned
+                ]
+        elif parts["deal"]:
+            spine, aligned = align(parts["deal"])
+            key_columns = [('deal_number', spine.tolist())]
+        else:
+            return []
+
+        names = [name for name, _ in key_columns] + ['cycle_code'] + [alias for alias, _, _ in aligned]
+        value_columns = [values for _, values in key_columns] + [[filters.cycle_code] * len(spine)] + \
+                        [values.tolist() for _, values, _ in aligned]
+        final_data = [dict(zip(names, row_values)) for row_values in zip(*value_columns)]
+
+        # Calculations without a row for a key are left out of that row, as in the row merge
+        aliases = np.array([alias for alias, _, _ in aligned], dtype=object)
+        missing = ~np.column_stack([present for _, _, present in aligned])
+        for row_index in np.flatnonzero(missing.any(axis=1)).tolist():
+            row = final_data[row_index]
+            for alias in aliases[missing[row_index]]:
+                del row[alias]
+        return final_data
+
+    def _merge_calculation_rows(self, individual_results: Dict[str, Any], filters: QueryFilters) -> List[Dict[str, Any]]:
+        """Merge results row by row, keyed on (deal, tranche, cycle) tuples"""
 
         # Group results by their key structure
         deal_level_data = {}  # key: (deal_id, cycle_code)
@@ -251,7 +717,7 @@ GROUP BY {', '.join(group_columns)}"""
             if 'error' in result_info:
                 continue  # Skip errored calculations
 
-            data = result_info['data']
+            data = self._result_rows(result_info['columns'])
             query_result = result_info['query_result']
 
             for row in data:
@@ -307,8 +773,294 @@ GROUP BY {', '.join(group_columns)}"""
 
         return final_data
 
+    # ===== COMPILED EXECUTION =====
+
+    def compile_report(self, calc_requests: List[CalculationRequest], filters: QueryFilters
+                       ) -> Tuple[Dict[str, CompiledLevel], Dict[str, QueryResult], Dict[str, str]]:
+        """Lower calculations into one fused statement per group level.
+
+        Returns the compiled levels, the statement for each level and any per-calculation errors.
+        Prepared statements are returned without their levels, which are only needed to build them.
+        """
+        prepared = self._prepared_statements(filters)
+        if prepared:
+            params = self.build_filter_params(filters)
+            queries = {level: replace(query, params=params) for level, query in prepared.compiled_queries.items()}
+            return {}, queries, dict(prepared.compile_errors)
+
+        levels: Dict[str, CompiledLevel] = {}
+        errors: Dict[str, str] = {}
+
+        for position, request in enumerate(calc_requests):
+            try:
+                group_level, column = self._compile_calculation(request, filters, position)
+            except Exception as e:
+                errors[request.alias] = str(e)
+                continue
+            levels.setdefault(group_level, CompiledLevel(group_level)).columns.append(column)
+
+        queries = {
+            group_level: QueryResult(
+                self._build_compiled_level_sql(level, filters),
+                self._compiled_key_columns(group_level) + [column.alias for column in level.columns],
+                "compiled",
+                group_level,
+                self.build_filter_params(filters),
+            )
+            for group_level, level in levels.items()
+        }
+        return levels, queries, errors
+
+    def prepare_statements(self, calc_requests: List[CalculationRequest], filters: QueryFilters) -> PreparedStatements:
+        """Generate the per-calculation and fused statements for a selection once, for reuse across runs.
+
+        Calculations that fail to resolve are left out and resolved (and reported) again when run.
+        """
+        filters = replace(filters, selection_table=self.selection_table_for(filters), prepared=None)
+
+        queries = {}
+        for request in calc_requests:
+            try:
+                queries[request.alias] = replace(self.resolve_single_calculation(request, filters), params={})
+            except Exception as e:
+                print(f"Warning: Could not prepare SQL for {request.alias}: {e}")
+
+        _, compiled_queries, compile_errors = self.compile_report(calc_requests, filters)
+        compiled_queries = {level: replace(query, params={}) for level, query in compiled_queries.items()}
+        return PreparedStatements(filters.selection_table, queries, compiled_queries, compile_errors)
+
+    def _prepared_statements(self, filters: QueryFilters) -> Optional[PreparedStatements]:
+        """Prepared statements of the filters, if they were generated for the same staged selection"""
+        prepared = filters.prepared
+        if prepared is not None and prepared.selection_table == filters.selection_table:
+            return prepared
+        return None
+
+    def _compile_calculation(self, request: CalculationRequest, filters: QueryFilters,
+                             position: int) -> Tuple[str, CompiledColumn]:
+        """Lower a single calculation into a column of its group level's statement"""
+        if request.calc_type == "static_field":
+            if not request.field_path:
+                raise ValueError("field_path is required for static_field calculations")
+            field_info = get_static_field_info(request.field_path)
+            group_level = "tranche" if self._requires_tranche_data(request.field_path) else "deal"
+            # Balance fields share the aggregate scan; deal/tranche attributes don't need a cycle
+            source = "agg" if "TrancheBal" in field_info['required_models'] else "static"
+            return group_level, CompiledColumn(request.alias, source, f"MAX({request.field_path})")
+
+        if request.calc_type == "user_calculation":
+            calc = self._load_user_calculation(request)
+            condition = None
+            if calc.advanced_config and 'filters' in calc.advanced_config:
+                condition = self._build_advanced_filters(calc.advanced_config['filters'])
+            expression = self._build_aggregation_expression(calc, condition)
+            return calc.group_level.value, CompiledColumn(request.alias, "agg", expression, condition=condition)
+
+        if request.calc_type == "system_calculation":
+            calc = self._load_system_calculation(request)
+            modified_sql = self._inject_filters_into_raw_sql(calc.raw_sql, filters)
+            return calc.group_level.value, CompiledColumn(
+                request.alias,
+                f"sys_{position}",
+                f"MAX(src.{calc.result_column_name})",
+                f"FROM ({modified_sql}) src",
+            )
+
+        raise ValueError(f"Unknown calculation type: {request.calc_type}")
+
+    def _compiled_key_columns(self, group_level: str) -> List[str]:
+        """Key columns returned by a compiled statement for the given level"""
+        return ["deal_number", "tranche_id"] if group_level == "tranche" else ["deal_number"]
+
+    def _build_compiled_level_sql(self, level: CompiledLevel, filters: QueryFilters) -> str:
+        """Build the fused statement for one group level.
+
+        Each source (static attributes, the shared aggregate scan, each system SQL) becomes a CTE
+        grouped on the level keys. The union of their keys is the row spine, which mirrors how
+        the in-memory merge keeps every key any calculation returned.
+
+        After the keys and values, one presence marker per calculation says whether its own query
+        would have returned the key (NULL when not), so _compiled_rows can leave it out like the
+        merge does. Rows come back in the merge's first-seen order: grouped by the first calculation
+        that returns them, then by key.
+        """
+        is_tranche = level.group_level == "tranche"
+        keys = self._compiled_key_columns(level.group_level)
+
+        sources: List[str] = []
+        for column in level.columns:
+            if column.source not in sources:
+                sources.append(column.source)
+
+        ctes = []
+        for source in sources:
+            cte_name = f"{level.group_level}_{source}"
+            source_columns = [(index, column) for index, column in enumerate(level.columns) if column.source == source]
+            value_select = ", ".join(f"{column.expression} AS c{index}" for index, column in source_columns)
+            presence_select = [
+                f"MAX(CASE WHEN {column.condition} THEN 1 END) AS p{index}"
+                for index, column in source_columns if column.condition
+            ]
+            if presence_select:
+                value_select += ", " + ", ".join(presence_select)
+
+            if source.startswith("sys_"):
+                key_select = ["src.dl_nbr AS deal_number"] + (["src.tr_id AS tranche_id"] if is_tranche else [])
+                group_by = ["src.dl_nbr"] + (["src.tr_id"] if is_tranche else [])
+                from_clause = source_columns[0][1].from_clause
+                where_clause = ""
+            else:
+                key_select = ["deal.dl_nbr AS deal_number"] + (["tranche.tr_id AS tranche_id"] if is_tranche else [])
+                group_by = ["deal.dl_nbr"] + (["tranche.tr_id"] if is_tranche else [])
+                if source == "agg":
+                    from_clause = self._build_from_clause(["Deal", "Tranche", "TrancheBal"])
+                    where_clause = self._build_where_clause(filters)
+                else:
+                    from_clause = self._build_from_clause(["Deal", "Tranche"] if is_tranche else ["Deal"])
+                    selection_condition = self._build_selection_condition(filters, is_tranche)
+                    where_clause = f"WHERE {selection_condition}" if selection_condition else ""
+
+            body = f"SELECT {', '.join(key_select)}, {value_select}\n{from_clause}"
+            if where_clause:
+                body += f"\n{where_clause}"
+            body += f"\nGROUP BY {', '.join(group_by)}"
+            ctes.append(f"{cte_name} AS (\n{body}\n)")
+
+        key_list = ", ".join(keys)
+        spine = "\nUNION\n".join(f"SELECT {key_list} FROM {level.group_level}_{source}" for source in sources)
+        ctes.append(f"report_keys AS (\n{spine}\n)")
+
+        select_columns = [f"report_keys.{key}" for key in keys]
+        for index, column in enumerate(level.columns):
+            quoted_alias = column.alias.replace('"', '""')
+            select_columns.append(f'{level.group_level}_{column.source}.c{index} AS "{quoted_alias}"')
+
+        # A calculation is present for a key when its CTE has the row and, if filtered, a row matched
+        presence = [
+            f"{level.group_level}_{column.source}.p{index}" if column.condition
+            else f"{level.group_level}_{column.source}.deal_number"
+            for index, column in enumerate(level.columns)
+        ]
+        select_columns += [f"{marker} AS p{index}" for index, marker in enumerate(presence)]
+        first_present = " ".join(f"WHEN {marker} IS NOT NULL THEN {index}" for index, marker in enumerate(presence))
+
+        joins = []
+        for source in sources:
+            cte_name = f"{level.group_level}_{source}"
+            on_clause = " AND ".join(f"{cte_name}.{key} = report_keys.{key}" for key in keys)
+            joins.append(f"LEFT JOIN {cte_name} ON {on_clause}")
+
+        return f"""WITH {', '.join(ctes)}
+SELECT {', '.join(select_columns)}
+FROM report_keys
+{chr(10).join(joins)}
+ORDER BY CASE {first_present} END, {', '.join(f'report_keys.{key}' for key in keys)}"""
+
+    def _merge(self, merge: Callable[..., List[Dict[str, Any]]], *args) -> List[Dict[str, Any]]:
+        """Run a merge of executed results, timed, through run_merge when it is set"""
+        with self._measure("merge"):
+            return self.run_merge(merge, *args) if self.run_merge else merge(*args)
+
+    def _measure(self, stage: str, name: Optional[str] = None):
+        """Time a block into the execution timings, if they are being collected"""
+        return self.timings.measure(stage, name) if self.timings is not None else nullcontext({})
+
+    def _execute_calculation_sql(self, alias: str, query_result: QueryResult, connection=None) -> Dict[str, List[Any]]:
+        """Run one calculation's statement, timed under its alias. Errors propagate to the caller"""
+        with self._measure("query", alias) as timing:
+            columns = self._fetch_sql_columns(query_result.sql, query_result.params, connection)
+            timing['row_count'] = len(next(iter(columns.values()), []))
+        return columns
+
+    def _execute_compiled_level(self, query_result: QueryResult) -> List[Dict[str, Any]]:
+        """Run a fused group-level statement, timed under its level - its calculations share one scan"""
+        with self._measure("query", f"compiled_{query_result.group_level}") as timing:
+            rows = self._execute_compiled_sql(query_result)
+            timing['row_count'] = len(rows)
+        return rows
+
+    def _execute_compiled_sql(self, query_result: QueryResult) -> List[Dict[str, Any]]:
+        """Execute a compiled statement, mapping result columns by position.
+
+        Errors propagate so the caller can fall back to individual queries.
+        """
+        result = self._run_statement(query_result.sql, query_result.params)
+        return self._compiled_rows(query_result, result.fetchall())
+
+    def _compiled_rows(self, query_result: QueryResult, rows) -> List[Dict[str, Any]]:
+        """Rows of a compiled statement, without the calculations (or keys) their own query wouldn't return.
+
+        Each row holds the key columns, one value per calculation and then one presence marker per calculation.
+        """
+        keys = self._compiled_key_columns(query_result.group_level)
+        aliases = query_result.columns[len(keys):]
+        compiled_rows = []
+        for row in rows:
+            values, markers = row[len(keys):len(keys) + len(aliases)], row[len(keys) + len(aliases):]
+            compiled_row = dict(zip(keys, row))
+            compiled_row.update(
+                (alias, value) for alias, value, marker in zip(aliases, values, markers) if marker is not None
+            )
+            if len(compiled_row) > len(keys):
+                compiled_rows.append(compiled_row)
+        return compiled_rows
+
+    def _merge_compiled_results(self, deal_rows: List[Dict[str, Any]], tranche_rows: List[Dict[str, Any]],
+                                filters: QueryFilters) -> List[Dict[str, Any]]:
+        """Broadcast deal-level values onto tranche rows, matching _merge_calculation_results"""
+        if not tranche_rows:
+            return [
+                {'deal_number': row['deal_number'], 'cycle_code': filters.cycle_code,
+                 **{k: v for k, v in row.items() if k != 'deal_number'}}
+                for row in deal_rows
+            ]
+
+        return self._merge_compiled_tranche_rows(self._compiled_deal_values(deal_rows), tranche_rows, filters)
+
+    def _compiled_deal_values(self, deal_rows: List[Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+        """Deal-level values keyed by deal number, ready to broadcast onto tranche rows"""
+        return {
+            row['deal_number']: {k: v for k, v in row.items() if k != 'deal_number'}
+            for row in deal_rows
+        }
+
+    def _merge_compiled_tranche_rows(self, deal_values: Dict[Any, Dict[str, Any]],
+                                     tranche_rows: List[Dict[str, Any]], filters: QueryFilters) -> List[Dict[str, Any]]:
+        """Merge tranche-level rows with the deal-level values of their deal"""
+        final_data = []
+        for row in tranche_rows:
+            merged_row = {
+                'deal_number': row['deal_number'],
+                'tranche_id': row['tranche_id'],
+                'cycle_code': filters.cycle_code,
+            }
+            merged_row.update({k: v for k, v in row.items() if k not in ('deal_number', 'tranche_id')})
+            merged_row.update(deal_values.get(row['deal_number'], {}))
+            final_data.append(merged_row)
+        return final_data
+
     # ===== HELPER METHODS =====
 
+    def _load_user_calculation(self, request: CalculationRequest) -> UserCalculation:
+        """Load the active user calculation referenced by a request"""
+        if not request.calc_id:
+            raise ValueError("calc_id is required for user_calculation")
+
+        calc = load_calculation_definition(self.config_db, UserCalculation, request.calc_id)
+        if not calc:
+            raise ValueError(f"User calculation {request.calc_id} not found")
+        return calc
+
+    def _load_system_calculation(self, request: CalculationRequest) -> SystemCalculation:
+        """Load the active system calculation referenced by a request"""
+        if not request.calc_id:
+            raise ValueError("calc_id is required for system_calculation")
+
+        calc = load_calculation_definition(self.config_db, SystemCalculation, request.calc_id)
+        if not calc:
+            raise ValueError(f"System calculation {request.calc_id} not found")
+        return calc
+
     def _requires_tranche_data(self, field_path: str) -> bool:
         """Check if field requires tranche-level data"""
         return field_path.startswith("tranche.") or field_path.startswith("tranchebal.")
@@ -324,21 +1076,74 @@ GROUP BY {', '.join(group_columns)}"""
 
     def _build_where_clause(self, filters: QueryFilters) -> str:
         """Build WHERE clause from standard filters"""
-        conditions = [f"tranchebal.cycle_cde = {filters.cycle_code}"]
+        conditions = ["tranchebal.cycle_cde = :cycle_code"]
+
+        selection_condition = self._build_selection_condition(filters)
+        if selection_condition:
+            conditions.append(selection_condition)
+
+        return f"WHERE {' AND '.join(conditions)}"
+
+    def build_filter_params(self, filters: QueryFilters) -> Dict[str, Any]:
+        """Bind values for the placeholders written by the filter builders.
+
+        Placeholders are named by position (deal_0, deal_0_tranche_1, ...), so the statement
+        text only depends on the shape of the selection and is reused across runs and cycles.
+        """
+        params: Dict[str, Any] = {'cycle_code': filters.cycle_code}
+        if filters.selection_table:
+            return params  # The selection lives in the staged table
+        for deal_index, (deal_id, tranche_ids) in enumerate(filters.deal_tranche_map.items()):
+            params[f"deal_{deal_index}"] = deal_id
+            for tranche_index, tranche_id in enumerate(tranche_ids):
+                params[f"deal_{deal_index}_tranche_{tranche_index}"] = tranche_id
+        return params
+
+    def _build_selection_condition(self, filters: QueryFilters, include_tranches: bool = True) -> str:
+        """Build the deal/tranche selection predicate shared by every calculation query"""
+        if filters.selection_table:
+            tranche_match = f" AND sel.tr_id IN ('{ALL_TRANCHES}', tranche.tr_id)" if include_tranches else ""
+            return (f"EXISTS (SELECT 1 FROM {filters.selection_table} sel "
+                    f"WHERE sel.dl_nbr = deal.dl_nbr{tranche_match})")
 
-        # Build deal-tranche conditions
         deal_conditions = []
-        for deal_id, tranche_ids in filters.deal_tranche_map.items():
-            if tranche_ids:  # Specific tranches
-                tranche_list = "', '".join(tranche_ids)
-                deal_conditions.append(f"(deal.dl_nbr = {deal_id} AND tranche.tr_id IN ('{tranche_list}'))")
-            else:  # All tranches for this deal
-                deal_conditions.append(f"deal.dl_nbr = {deal_id}")
+        for deal_index, tranche_ids in enumerate(filters.deal_tranche_map.values()):
+            if include_tranches and tranche_ids:  # Specific tranches
+                tranche_list = ", ".join(
+                    f":deal_{deal_index}_tranche_{tranche_index}" for tranche_index in range(len(tranche_ids))
+                )
+                deal_conditions.append(f"(deal.dl_nbr = :deal_{deal_index} AND tranche.tr_id IN ({tranche_list}))")
+            else:  # Deal-only or all tranches for this deal
+                deal_conditions.append(f"deal.dl_nbr = :deal_{deal_index}")
 
-        if deal_conditions:
-            conditions.append(f"({' OR '.join(deal_conditions)})")
+        return f"({' OR '.join(deal_conditions)})" if deal_conditions else ""
 
-        return f"WHERE {' AND '.join(conditions)}"
+    def _build_aggregation_expression(self, calc: UserCalculation, condition: Optional[str] = None) -> str:
+        """Build the aggregate for a user calculation, optionally restricted to rows matching condition"""
+        agg_field = f"{calc.source_model.value.lower()}.{calc.source_field}"
+
+        def operand(expression: str) -> str:
+            # Conditional aggregation lets calculations with their own filters share one scan
+            return f"CASE WHEN {condition} THEN {expression} END" if condition else expression
+
+        if calc.aggregation_function == AggregationFunction.SUM:
+            return f"SUM({operand(agg_field)})"
+        elif calc.aggregation_function == AggregationFunction.AVG:
+            return f"AVG({operand(agg_field)})"
+        elif calc.aggregation_function == AggregationFunction.COUNT:
+            return f"COUNT({operand(agg_field)})"
+        elif calc.aggregation_function == AggregationFunction.MIN:
+            return f"MIN({operand(agg_field)})"
+        elif calc.aggregation_function == AggregationFunction.MAX:
+            return f"MAX({operand(agg_field)})"
+        elif calc.aggregation_function == AggregationFunction.WEIGHTED_AVG:
+            if not calc.weight_field:
+                raise ValueError(f"Weight field required for weighted average calculation {calc.name}")
+            weight_field = f"{calc.source_model.value.lower()}.{calc.weight_field}"
+            return (f"SUM({operand(f'{agg_field} * {weight_field}')}) / "
+                    f"NULLIF(SUM({operand(weight_field)}), 0)")
+        else:
+            raise ValueError(f"Unsupported aggregation function: {calc.aggregation_function}")
 
     def _build_advanced_filters(self, filter_config: List[Dict[str, Any]]) -> str:
         """Build additional WHERE conditions from advanced config (future expansion)"""
@@ -357,19 +1162,12 @@ GROUP BY {', '.join(group_columns)}"""
 
     def _inject_filters_into_raw_sql(self, raw_sql: str, filters: QueryFilters) -> str:
         """Inject standard filters into system calculation SQL"""
-        filter_parts = [f"tranchebal.cycle_cde = {filters.cycle_code}"]
+        filter_parts = ["tranchebal.cycle_cde = :cycle_code"]
 
         # Build deal-tranche filter
-        deal_conditions = []
-        for deal_id, tranche_ids in filters.deal_tranche_map.items():
-            if tranche_ids:
-                tranche_list = "', '".join(tranche_ids)
-                deal_conditions.append(f"(deal.dl_nbr = {deal_id} AND tranche.tr_id IN ('{tranche_list}'))")
-            else:
-                deal_conditions.append(f"deal.dl_nbr = {deal_id}")
-
-        if deal_conditions:
-            filter_parts.append(f"({' OR '.join(deal_conditions)})")
+        selection_condition = self._build_selection_condition(filters)
+        if selection_condition:
+            filter_parts.append(selection_condition)
 
         full_filter = ' AND '.join(filter_parts)
 
@@ -392,14 +1190,138 @@ GROUP BY {', '.join(group_columns)}"""
 
         return modified_sql
 
-    def _execute_sql(self, sql: str) -> List[Dict[str, Any]]:
-        """Execute SQL and return results as list of dictionaries"""
+    def _fetch_sql_columns(self, sql: str, params: Optional[Dict[str, Any]] = None,
+                           connection=None) -> Dict[str, List[Any]]:
+        """Execute SQL and return results as column name -> list of values"""
+        result = self._run_statement(sql, params, connection)
+        columns = list(result.keys())
+        rows = result.fetchall()
+        if not rows:
+            return {column: [] for column in columns}
+        return {column: list(values) for column, values in zip(columns, zip(*rows))}
+
+    def _result_rows(self, columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        """Turn a columnar result back into one dictionary per row"""
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+    # ===== SELECTION STAGING =====
+
+    def _stage_selection(self, filters: QueryFilters) -> QueryFilters:
+        """Load a large deal/tranche selection into a temp table for this execution.
+
+        Returns filters pointing at the staged table, or the filters unchanged when the
+        selection is small enough to inline.
+        """
+        if not self._should_stage_selection(filters):
+            return filters
+
+        table_name = self._selection_table_name()
+        self._create_selection_table(filters, table_name)
+        return replace(filters, selection_table=table_name)
+
+    def selection_table_for(self, filters: QueryFilters) -> Optional[str]:
+        """Staged selection table a run with these filters reads from, or None when the selection is inlined"""
+        return self._selection_table_name() if self._should_stage_selection(filters) else None
+
+    @contextmanager
+    def selection_staged(self, filters: QueryFilters):
+        """Stage the selection on the warehouse session while statements generated against it are inspected"""
+        table_name = self.selection_table_for(filters)
+        if table_name is None:
+            yield None
+            return
+        self._create_selection_table(filters, table_name)
+        try:
+            yield table_name
+        finally:
+            self._drop_selection_table(table_name)
+
+    def _should_stage_selection(self, filters: QueryFilters) -> bool:
+        """Whether the selection is too large to inline into every statement"""
+        selection_size = sum(max(len(tranche_ids), 1) for tranche_ids in filters.deal_tranche_map.values())
+        return selection_size > SELECTION_STAGING_THRESHOLD
+
+    def _selection_table_name(self) -> str:
+        """Connection-scoped temp table name for the warehouse dialect"""
+        return "#report_selection" if self.dw_db.get_bind().dialect.name == "mssql" else "report_selection"
+
+    def _create_selection_table(self, filters: QueryFilters, table_name: str, connection=None):
+        """Create and fill the staged selection table on the session or the given connection"""
+        db = connection if connection is not None else self.dw_db
+        rows = [
+            {'dl_nbr': deal_id, 'tr_id': tranche_id}
+            for deal_id, tranche_ids in filters.deal_tranche_map.items()
+            for tranche_id in (set(tranche_ids) or [ALL_TRANCHES])
+        ]
+
+        if table_name.startswith("#"):
+            # Local temp tables are scoped to the connection the session holds
+            create_sql = f"CREATE TABLE {table_name} (dl_nbr INT NOT NULL, tr_id VARCHAR(15) NOT NULL, " \
+                         f"PRIMARY KEY (dl_nbr, tr_id))"
+        else:
+            create_sql = f"CREATE TEMP TABLE {table_name} (dl_nbr INTEGER NOT NULL, tr_id VARCHAR(15) NOT NULL, " \
+                         f"PRIMARY KEY (dl_nbr, tr_id))"
+
+        self._drop_selection_table(table_name, connection)
+        db.execute(text(create_sql))
+        db.execute(text(f"INSERT INTO {table_name} (dl_nbr, tr_id) VALUES (:dl_nbr, :tr_id)"), rows)
+
+    def _drop_selection_table(self, table_name: str, connection=None):
+        """Drop a staged selection table if it exists on the session or the given connection"""
+        db = connection if connection is not None else self.dw_db
+        if table_name.startswith("#"):
+            db.execute(text(f"IF OBJECT_ID('tempdb..{table_name}') IS NOT NULL DROP TABLE {table_name}"))
+        else:
+            db.execute(text(f"DROP TABLE IF EXISTS temp.{table_name}"))
+
+    # ===== PLAN REUSE =====
+
+    def _run_statement(self, sql: str, params: Optional[Dict[str, Any]] = None, connection=None,
+                       stream: bool = False):
+        """Execute a statement with bound parameters, tagging it when plan reuse stats are enabled.
+
+        With stream=True rows are read through a server-side cursor instead of being buffered by the driver.
+        """
+        if REPORT_PLAN_REUSE_STATS:
+            statement_hash = self._statement_hash(sql)
+            with _statement_executions_lock:
+                _statement_executions[statement_hash] = _statement_executions.get(statement_hash, 0) + 1
+            # The tag is derived from the text itself, so it doesn't break plan reuse
+            sql = f"/* stmt:{statement_hash} */\n{sql}"
+        db = connection if connection is not None else self.dw_db
+        if stream:
+            return db.execute(text(sql), params or {}, execution_options={"stream_results": True})
+        return db.execute(text(sql), params or {})
+
+    def _statement_hash(self, sql: str) -> str:
+        """Stable identifier for a statement text"""
+        return hashlib.sha1(sql.encode("utf-8")).hexdigest()[:16]
+
+    def _collect_plan_reuse(self, queries: Dict[str, QueryResult]) -> Dict[str, Dict[str, Any]]:
+        """Report how often each statement text has been executed and its cached plan reused"""
+        is_mssql = self.dw_db.get_bind().dialect.name == "mssql"
+        plan_reuse = {}
+        for alias, query_result in queries.items():
+            if query_result.calc_type == "error":
+                continue
+            statement_hash = self._statement_hash(query_result.sql)
+            with _statement_executions_lock:
+                executions = _statement_executions.get(statement_hash, 0)
+            entry = {'statement_hash': statement_hash, 'executions': executions}
+            if is_mssql:
+                entry.update(self._get_cached_plan_stats(statement_hash))
+            plan_reuse[alias] = entry
+        return plan_reuse
+
+    def _get_cached_plan_stats(self, statement_hash: str) -> Dict[str, Any]:
+        """Look up the SQL Server plan cache entry for a tagged statement (needs VIEW SERVER STATE)"""
         try:
-            result = self.dw_db.execute(text(sql))
-            columns = result.keys()
-            return [dict(zip(columns, row)) for row in result.fetchall()]
+            row = self.dw_db.execute(text("""SELECT COUNT(*) AS cached_plans, SUM(cp.usecounts) AS plan_use_count
+FROM sys.dm_exec_cached_plans cp
+CROSS APPLY sys.dm_exec_sql_text(cp.plan_handle) st
+WHERE st.text LIKE :pattern"""), {'pattern': f"%stmt:{statement_hash}%"}).first()
+            return {'cached_plans': row.cached_plans, 'plan_use_count': row.plan_use_count or 0}
         except Exception as e:
-            # Return empty result set on error, but log it
-            print(f"SQL Execution Error: {e}")
-            print(f"Failed SQL: {sql}")
-            return []
\ No newline at end of file
+            print(f"Warning: Could not read plan cache stats: {e}")
+            return {'cached_plans': None, 'plan_use_count': None}
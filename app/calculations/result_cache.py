@@ -0,0 +1,231 @@
+# app/calculations/result_cache.py
+"""Result cache for report executions with an in-process LRU and an optional disk tier."""
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+
+REPORT_CACHE_ENABLED = os.getenv("REPORT_CACHE_ENABLED", "true").lower() == "true"
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "128"))
+# Warehouse loads of an open cycle don't invalidate the cache, so entries expire (0 keeps them until evicted)
+REPORT_CACHE_TTL_SECONDS = float(os.getenv("REPORT_CACHE_TTL_SECONDS", "900"))
+# Set to a directory to keep results across restarts and share them between workers
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "")
+
+# Global result cache singleton
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def build_cache_key(sql_set: List[Dict[str, Any]], deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                    execution_mode: str) -> str:
+    """Hash the resolved SQL set, the deal/tranche selection, the cycle and the execution mode into a cache key."""
+    payload = json.dumps(
+        {
+            "sql": sql_set,
+            "execution_mode": execution_mode,
+            "deal_tranche_map": {str(deal_id): sorted(tranche_ids) for deal_id, tranche_ids in deal_tranche_map.items()},
+            "cycle_code": cycle_code,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportResultCache:
+    """Thread-safe LRU of report execution results, optionally backed by pickle files on disk.
+
+    Results are kept pickled, so every hit is a fresh copy callers can change freely. Every
+    invalidation bumps a version; a result computed before an invalidation is not stored.
+    """
+
+    def __init__(self, max_entries: int = REPORT_CACHE_MAX_ENTRIES, ttl_seconds: float = REPORT_CACHE_TTL_SECONDS,
+                 cache_dir: str = REPORT_CACHE_DIR):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (stored_at, pickled result)
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._cache_dir = cache_dir or None
+        self._version = 0
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._stale_writes = 0
+
+        if self._cache_dir:
+            os.makedirs(self._cache_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result, checking memory first and then the disk tier."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._is_expired(entry[0]):
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return pickle.loads(entry[1])
+            if entry:
+                del self._entries[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry and not self._is_expired(entry[0]):
+                self._store_memory(key, entry)
+                self._hits += 1
+                self._disk_hits += 1
+                return pickle.loads(entry[1])
+            self._misses += 1
+        return None
+
+    def get_version(self) -> int:
+        """Current version - read it before the definitions a result is computed from."""
+        with self._lock:
+            return self._version
+
+    def set(self, key: str, result: Dict[str, Any], version: Optional[int] = None) -> bool:
+        """Cache a copy of a result in memory and, if configured, on disk.
+
+        With the version read before the result was computed, a result that an invalidation has
+        since made stale is dropped. Returns whether the result was stored.
+        """
+        entry = (time.time(), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            if version is not None and version != self._version:
+                self._stale_writes += 1
+                return False
+            self._store_memory(key, entry)
+        self._write_disk(key, entry)
+        with self._lock:
+            if version is not None and version != self._version:
+                # Invalidated while the file was written - don't leave it for the next read
+                self._remove_disk(key)
+                return False
+        return True
+
+    def invalidate(self) -> None:
+        """Drop every cached result (calculation or report definitions changed)."""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._invalidations += 1
+
+        if self._cache_dir:
+            for file_name in os.listdir(self._cache_dir):
+                if file_name.endswith(".pkl"):
+                    try:
+                        os.remove(os.path.join(self._cache_dir, file_name))
+                    except OSError as e:
+                        print(f"Warning: Could not remove cached report result {file_name}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get result cache statistics."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "ttl_seconds": self._ttl_seconds,
+                "disk_tier": self._cache_dir,
+                "version": self._version,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "stale_writes": self._stale_writes,
+            }
+
+    def _store_memory(self, key: str, entry: tuple) -> None:
+        """Insert an entry and evict the least recently used ones. Caller holds the lock."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return bool(self._ttl_seconds) and time.time() - stored_at > self._ttl_seconds
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, f"{key}.pkl")
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        if not self._cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: Could not read cached report result {key}: {e}")
+            return None
+
+    def _remove_disk(self, key: str) -> None:
+        if not self._cache_dir:
+            return
+        try:
+            os.remove(self._disk_path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not remove cached report result {key}: {e}")
+
+    def _write_disk(self, key: str, entry: tuple) -> None:
+        if not self._cache_dir:
+            return
+        temp_path = f"{self._disk_path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._disk_path(key))  # Readers never see a partial file
+        except Exception as e:
+            print(f"Warning: Could not write cached report result {key}: {e}")
+
+
+def get_report_result_cache() -> ReportResultCache:
+    """Get the singleton report result cache."""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ReportResultCache()
+    return _result_cache
+
+
+def invalidate_report_results() -> None:
+    """Clear cached report results after a definition change."""
+    try:
+        get_report_result_cache().invalidate()
+    except Exception as e:
+        print(f"Warning: Could not invalidate report result cache: {e}")
+
+
+def setup_result_cache_invalidation_listeners():
+    """Invalidate cached results whenever a calculation or report definition changes."""
+
+    # Import here to avoid circular imports
+    from app.calculations.models import UserCalculation, SystemCalculation
+    from app.reporting.models import Report, ReportDeal, ReportTranche, ReportCalculation
+
+    def invalidate_on_change(mapper, connection, target):
+        # Mapper events fire at flush, so a run could still read the old committed definitions
+        # until the commit - invalidate again once it is done
+        invalidate_report_results()
+        session = object_session(target)
+        if session is not None:
+            event.listen(session, "after_commit", lambda committed_session: invalidate_report_results(), once=True)
+
+    for model in (UserCalculation, SystemCalculation, Report, ReportDeal, ReportTranche, ReportCalculation):
+        for event_name in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, event_name, invalidate_on_change)
+
+
+# Initialize the event listeners when this module is imported
+setup_result_cache_invalidation_listeners()
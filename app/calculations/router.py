@@ -15,6 +15,7 @@ from .service import (
     ReportExecutionService
 )
 from .resolver import CalculationRequest, QueryFilters
+from app.core.exceptions import ReportTimeoutError
 from .schemas import (
     UserCalculationCreate,
     UserCalculationUpdate, 
@@ -30,6 +31,7 @@ from .schemas import (
     CalculationRequestSchema
 )
 from app.calculations.audit_models import flush_pending_audits, get_audit_stats
+from app.calculations.definition_cache import get_calculation_definition_cache
 
 # Additional endpoints to add to app/calculations/router.py
 """Audit trail endpoints for the calculation router."""
@@ -387,10 +389,13 @@ def execute_report(
         result = service.execute_report(
             calc_requests,
             request.deal_tranche_map,
-            request.cycle_code
+            request.cycle_code,
+            request.execution_mode
         )
         
         return ReportExecutionResponse(**result)
+    except ReportTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error executing report: {str(e)}")
 
@@ -918,4 +923,17 @@ def flush_audit_logs():
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error flushing audit logs: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error flushing audit logs: {str(e)}")
+
+
+@router.get("/cache/stats")
+def get_definition_cache_stats():
+    """Get calculation definition cache statistics for monitoring."""
+    try:
+        return {
+            "success": True,
+            "data": get_calculation_definition_cache().get_stats(),
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving definition cache stats: {str(e)}")
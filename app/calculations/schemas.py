@@ -263,6 +263,7 @@ class ReportExecutionRequest(BaseModel):
     calculation_requests: List[CalculationRequestSchema]
     deal_tranche_map: Dict[int, List[str]]  # deal_id -> [tranche_ids] or [] for all
     cycle_code: int
+    execution_mode: Optional[str] = None  # "compiled", "individual" or "parallel"; defaults to REPORT_EXECUTION_MODE
 
     @field_validator("calculation_requests")
     @classmethod
@@ -339,6 +340,7 @@ class ReportExecutionResponse(BaseModel):
 class SQLPreviewResponse(BaseModel):
     """Schema for SQL preview responses"""
     sql_previews: Dict[str, Dict[str, Any]]
+    compiled_sql: Dict[str, str] = {}
     parameters: Dict[str, Any]
     summary: Dict[str, Any]
 
@@ -1,8 +1,11 @@
 # app/calculations/service.py
 """Simplified calculation service using the new separated model architecture with audit context."""
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from sqlalchemy.util import await_only
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from app.core.exceptions import (
     CalculationNotFoundError,
     CalculationAlreadyExistsError,
@@ -19,7 +22,12 @@ from .models import (
     get_static_field_info
 )
 from .dao import UserCalculationDAO, SystemCalculationDAO
-from .resolver import SimpleCalculationResolver, CalculationRequest, QueryFilters
+from .resolver import (
+    SimpleCalculationResolver, CalculationRequest, QueryFilters, PreparedStatements, ExecutionTimings,
+    DEFAULT_EXECUTION_MODE, REPORT_STREAM_BATCH_SIZE
+)
+from .result_cache import REPORT_CACHE_ENABLED, build_cache_key, get_report_result_cache
+from app.datawarehouse.index_advisor import IndexAdvisor
 from .schemas import (
     UserCalculationCreate,
     UserCalculationUpdate,
@@ -33,17 +41,42 @@ from .audit_models import audit_context
 class ReportExecutionService:
     """Service for executing reports with mixed calculation types"""
 
-    def __init__(self, dw_db: Session, config_db: Session):
+    def __init__(self, dw_db: Session, config_db: Session, async_dw_db: Optional[AsyncSession] = None):
         self.dw_db = dw_db
         self.config_db = config_db
+        self.async_dw_db = async_dw_db
         self.resolver = SimpleCalculationResolver(dw_db, config_db)
 
     def execute_report(self, calculation_requests: List[CalculationRequest], 
-                      deal_tranche_map: Dict[int, List[str]], cycle_code: int) -> Dict[str, Any]:
-        """Execute a report with mixed calculation types"""
+                      deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                      execution_mode: Optional[str] = None,
+                      prepared_statements: Optional[PreparedStatements] = None) -> Dict[str, Any]:
+        """Execute a report with mixed calculation types, reusing cached results when possible"""
+        cache_version, cache_key, cached_result = self._lookup_cached_result(
+            calculation_requests, deal_tranche_map, cycle_code, execution_mode, prepared_statements
+        )
+        if cached_result:
+            return cached_result
 
-        filters = QueryFilters(deal_tranche_map, cycle_code)
-        result = self.resolver.resolve_report(calculation_requests, filters)
+        result = self._execute_report_uncached(
+            calculation_requests, deal_tranche_map, cycle_code, execution_mode, prepared_statements
+        )
+        self._cache_result(cache_version, cache_key, result)
+        return result
+
+    def _execute_report_uncached(self, calculation_requests: List[CalculationRequest],
+                                 deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                                 execution_mode: Optional[str] = None,
+                                 prepared_statements: Optional[PreparedStatements] = None) -> Dict[str, Any]:
+        """Resolve and run every calculation against the warehouse"""
+
+        filters = QueryFilters(deal_tranche_map, cycle_code, prepared=prepared_statements)
+        timings = ExecutionTimings()
+        self.resolver.timings = timings
+        try:
+            result = self.resolver.resolve_report(calculation_requests, filters, execution_mode)
+        finally:
+            self.resolver.timings = None
 
         return {
             'data': result['merged_data'],
@@ -54,15 +87,148 @@ class ReportExecutionService:
                 'individual_sql_queries': {
                     alias: query_result.sql 
                     for alias, query_result in result['individual_queries'].items()
-                }
+                },
+                'timings': timings.entries
             }
         }
 
+    async def execute_report_async(self, calculation_requests: List[CalculationRequest],
+                                   deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                                   execution_mode: Optional[str] = None,
+                                   prepared_statements: Optional[PreparedStatements] = None) -> Dict[str, Any]:
+        """Execute a report without blocking the event loop.
+
+        Only warehouse queries are awaited on the async driver; config reads, SQL generation, the
+        cache and the merge run on the threadpool.
+        """
+        execution_mode = execution_mode or DEFAULT_EXECUTION_MODE
+        cache_version, cache_key, cached_result = await run_in_threadpool(
+            self._lookup_cached_result, calculation_requests, deal_tranche_map, cycle_code, execution_mode,
+            prepared_statements
+        )
+        if cached_result:
+            return cached_result
+
+        if self.async_dw_db is None or execution_mode.lower() == "parallel":
+            # No async driver, or parallel mode which manages its own worker connections
+            result = await run_in_threadpool(
+                self._execute_report_uncached, calculation_requests, deal_tranche_map, cycle_code, execution_mode,
+                prepared_statements
+            )
+        else:
+            if prepared_statements is None:
+                # Resolving SQL reads definitions from the config database - do it before the run
+                prepared_statements = await run_in_threadpool(
+                    self.resolver.prepare_statements, calculation_requests, QueryFilters(deal_tranche_map, cycle_code)
+                )
+
+            def execute(sync_dw_db: Session) -> Dict[str, Any]:
+                # Runs on the event loop against the async connection - each query is awaited on the
+                # driver, and the merge is awaited on the threadpool
+                execution_service = ReportExecutionService(sync_dw_db, self.config_db)
+                execution_service.resolver.run_merge = lambda merge, *args: await_only(run_in_threadpool(merge, *args))
+                return execution_service._execute_report_uncached(
+                    calculation_requests, deal_tranche_map, cycle_code, execution_mode, prepared_statements
+                )
+
+            result = await self.async_dw_db.run_sync(execute)
+
+        await run_in_threadpool(self._cache_result, cache_version, cache_key, result)
+        return result
+
+    def stream_report(self, calculation_requests: List[CalculationRequest],
+                      deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                      execution_mode: Optional[str] = None,
+                      batch_size: int = REPORT_STREAM_BATCH_SIZE,
+                      prepared_statements: Optional[PreparedStatements] = None,
+                      timings: Optional[ExecutionTimings] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield report rows in batches, from the result cache when possible.
+
+        Streamed results are not added to the cache - that would mean holding the whole report again.
+        Statement and merge times are recorded into timings, when given.
+        """
+        _, _, cached_result = self._lookup_cached_result(
+            calculation_requests, deal_tranche_map, cycle_code, execution_mode, prepared_statements
+        )
+        if cached_result:
+            data = cached_result['data']
+            for start in range(0, len(data), batch_size):
+                yield data[start:start + batch_size]
+            return
+
+        filters = QueryFilters(deal_tranche_map, cycle_code, prepared=prepared_statements)
+        self.resolver.timings = timings
+        try:
+            yield from self.resolver.stream_report(calculation_requests, filters, execution_mode, batch_size)
+        finally:
+            self.resolver.timings = None
+
+    def _result_cache_key(self, calculation_requests: List[CalculationRequest],
+                          deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                          execution_mode: Optional[str] = None,
+                          prepared_statements: Optional[PreparedStatements] = None) -> Optional[str]:
+        """Cache key from the SQL of every calculation, the selection, the cycle and the execution mode.
+
+        Statements already prepared for the run are reused; only the others are resolved here.
+        """
+        if not REPORT_CACHE_ENABLED:
+            return None
+
+        prepared_queries = prepared_statements.queries if prepared_statements else {}
+        filters = QueryFilters(deal_tranche_map, cycle_code, prepared=prepared_statements)
+        sql_set = []
+        for request in calculation_requests:
+            try:
+                query_result = prepared_queries.get(request.alias) or self.resolver.resolve_single_calculation(
+                    request, filters
+                )
+                sql_set.append({'alias': request.alias, 'calc_type': request.calc_type, 'sql': query_result.sql})
+            except Exception as e:
+                sql_set.append({'alias': request.alias, 'calc_type': request.calc_type, 'error': str(e)})
+        return build_cache_key(
+            sql_set, deal_tranche_map, cycle_code, (execution_mode or DEFAULT_EXECUTION_MODE).lower()
+        )
+
+    def _lookup_cached_result(self, calculation_requests: List[CalculationRequest],
+                              deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                              execution_mode: Optional[str] = None,
+                              prepared_statements: Optional[PreparedStatements] = None
+                              ) -> Tuple[int, Optional[str], Optional[Dict[str, Any]]]:
+        """Result cache version and key of an execution, and its cached result if there is one.
+
+        The version is read before the key resolves any definitions, so a result computed from
+        definitions an edit has since invalidated is not stored.
+        """
+        cache_version = get_report_result_cache().get_version()
+        cache_key = self._result_cache_key(
+            calculation_requests, deal_tranche_map, cycle_code, execution_mode, prepared_statements
+        )
+        return cache_version, cache_key, self._get_cached_result(cache_key)
+
+    def _get_cached_result(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Cached execution result for the key, flagged as a cache hit"""
+        if not cache_key:
+            return None
+        cached_result = get_report_result_cache().get(cache_key)
+        if cached_result is None:
+            return None
+        # A copy of the cached result - nothing was executed, so the timings of the run that filled it don't apply
+        cached_result['metadata'].update(cache_hit=True, timings=[])
+        return cached_result
+
+    def _cache_result(self, cache_version: int, cache_key: Optional[str], result: Dict[str, Any]):
+        """Store a copy of a fresh execution result and flag the result as a cache miss"""
+        result['metadata']['cache_hit'] = False if cache_key else None
+        if cache_key and not result['metadata']['debug_info'].get('errors'):
+            # Partial results (a calculation failed) are not worth keeping
+            get_report_result_cache().set(cache_key, result, cache_version)
+
     def preview_report_sql(self, calculation_requests: List[CalculationRequest],
-                          deal_tranche_map: Dict[int, List[str]], cycle_code: int) -> Dict[str, Any]:
+                          deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                          prepared_statements: Optional[PreparedStatements] = None) -> Dict[str, Any]:
         """Preview SQL queries without executing them"""
 
-        filters = QueryFilters(deal_tranche_map, cycle_code)
+        filters = QueryFilters(deal_tranche_map, cycle_code, prepared=prepared_statements)
         
         # Generate SQL for each calculation
         sql_previews = {}
@@ -83,11 +249,16 @@ class ReportExecutionService:
                     'error': str(e)
                 }
 
+        # Fused per-group-level statements used by the compiled execution mode
+        _, compiled_queries, _ = self.resolver.compile_report(calculation_requests, filters)
+
         return {
             'sql_previews': sql_previews,
+            'compiled_sql': {level: query.sql for level, query in compiled_queries.items()},
             'parameters': {
                 'deal_tranche_map': deal_tranche_map,
-                'cycle_code': cycle_code
+                'cycle_code': cycle_code,
+                'bind_parameters': self.resolver.build_filter_params(filters)
             },
             'summary': {
                 'total_calculations': len(calculation_requests),
@@ -98,6 +269,42 @@ class ReportExecutionService:
         }
 
 
+    def advise_report_indexes(self, calculation_requests: List[CalculationRequest],
+                              deal_tranche_map: Dict[int, List[str]], cycle_code: int,
+                              prepared_statements: Optional[PreparedStatements] = None) -> Dict[str, Any]:
+        """Warehouse query plans of a report's statements and the indexes they are missing.
+
+        The statements are the ones a run executes - over the staged selection table when the
+        selection is large - rather than the inlined SQL of the preview.
+        """
+        filters = QueryFilters(deal_tranche_map, cycle_code)
+        selection_table = self.resolver.selection_table_for(filters)
+        if prepared_statements is None or prepared_statements.selection_table != selection_table:
+            prepared_statements = self.resolver.prepare_statements(calculation_requests, filters)
+
+        statements = {alias: query.sql for alias, query in prepared_statements.queries.items()}
+        statements.update({
+            f"compiled_{level}": query.sql for level, query in prepared_statements.compiled_queries.items()
+        })
+        params = self.resolver.build_filter_params(
+            QueryFilters(deal_tranche_map, cycle_code, selection_table=selection_table)
+        )
+
+        with self.resolver.selection_staged(filters):
+            return IndexAdvisor(self.dw_db).advise(statements, params)
+
+
+def _build_usage_info(calculation, reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Usage summary of a calculation from the reports that reference it"""
+    return {
+        "calculation_id": calculation.id,
+        "calculation_name": calculation.name,
+        "is_in_use": len(reports) > 0,
+        "report_count": len(reports),
+        "reports": reports,
+    }
+
+
 class UserCalculationService:
     """Service for managing user-defined calculations with audit trail."""
 
@@ -109,21 +316,16 @@ class UserCalculationService:
         group_level_enum = GroupLevel(group_level) if group_level else None
         calculations = self.user_calc_dao.get_all(group_level_enum)
         
-        # Add usage information to each calculation
+        # Add usage information to each calculation - one usage query for the whole listing
+        try:
+            usage = self.user_calc_dao.get_usage_by_ids([calc.id for calc in calculations])
+        except Exception as e:
+            # If usage fetch fails, provide default values
+            print(f"Warning: Could not load user calculation usage: {e}")
+            usage = {}
         for calc in calculations:
-            try:
-                usage_info = self.get_user_calculation_usage(calc.id)
-                # Add usage info as attributes to the calculation object
-                calc.usage_info = usage_info
-            except Exception as e:
-                # If usage fetch fails, provide default values
-                calc.usage_info = {
-                    "calculation_id": calc.id,
-                    "calculation_name": calc.name,
-                    "is_in_use": False,
-                    "report_count": 0,
-                    "reports": [],
-                }
+            # Add usage info as attributes to the calculation object
+            calc.usage_info = _build_usage_info(calc, usage.get(calc.id, []))
         
         return calculations
 
@@ -241,49 +443,7 @@ class UserCalculationService:
         if not calculation:
             raise CalculationNotFoundError(f"User calculation with ID {calc_id} not found")
         
-        # Import here to avoid circular imports
-        from app.reporting.models import ReportCalculation, Report
-        from sqlalchemy.orm import joinedload
-        
-        # Find all reports that use this calculation
-        # For user calculations, calculation_id is stored as string representation of the integer
-        calc_id_str = str(calc_id)
-        
-        # Check both with calculation_type = 'user' AND calculation_type = None (for existing data)
-        report_usages = (
-            self.user_calc_dao.db
-            .query(ReportCalculation)
-            .join(Report)
-            .filter(
-                ReportCalculation.calculation_id == calc_id_str,
-                # Handle both new format ('user') and legacy format (None) 
-                (
-                    (ReportCalculation.calculation_type == 'user') |
-                    (ReportCalculation.calculation_type.is_(None))
-                ),
-                Report.is_active == True
-            )
-            .options(joinedload(ReportCalculation.report))
-            .all()
-        )
-        
-        reports = []
-        for usage in report_usages:
-            reports.append({
-                "report_id": usage.report.id,
-                "report_name": usage.report.name,
-                "report_scope": usage.report.scope,
-                "display_order": usage.display_order,
-                "display_name": usage.display_name
-            })
-        
-        return {
-            "calculation_id": calc_id,
-            "calculation_name": calculation.name,
-            "is_in_use": len(reports) > 0,
-            "report_count": len(reports),
-            "reports": reports,
-        }
+        return _build_usage_info(calculation, self.user_calc_dao.get_usage_by_ids([calc_id])[calc_id])
 
 
 class SystemCalculationService:
@@ -297,21 +457,16 @@ class SystemCalculationService:
         group_level_enum = GroupLevel(group_level) if group_level else None
         calculations = self.system_calc_dao.get_all(group_level_enum)
         
-        # Add usage information to each calculation
+        # Add usage information to each calculation - one usage query for the whole listing
+        try:
+            usage = self.system_calc_dao.get_usage_by_ids([calc.id for calc in calculations])
+        except Exception as e:
+            # If usage fetch fails, provide default values
+            print(f"Warning: Could not load system calculation usage: {e}")
+            usage = {}
         for calc in calculations:
-            try:
-                usage_info = self.get_system_calculation_usage(calc.id)
-                # Add usage info as attributes to the calculation object
-                calc.usage_info = usage_info
-            except Exception as e:
-                # If usage fetch fails, provide default values
-                calc.usage_info = {
-                    "calculation_id": calc.id,
-                    "calculation_name": calc.name,
-                    "is_in_use": False,
-                    "report_count": 0,
-                    "reports": [],
-                }
+            # Add usage info as attributes to the calculation object
+            calc.usage_info = _build_usage_info(calc, usage.get(calc.id, []))
         
         return calculations
 
@@ -377,45 +532,7 @@ class SystemCalculationService:
         if not calculation:
             raise CalculationNotFoundError(f"System calculation with ID {calc_id} not found")
         
-        # Import here to avoid circular imports
-        from app.reporting.models import ReportCalculation, Report
-        from sqlalchemy.orm import joinedload
-        
-        # Find all reports that use this calculation
-        # For system calculations, calculation_id is stored as string representation of the integer
-        calc_id_str = str(calc_id)
-        
-        # Check for calculation_type = 'system'
-        report_usages = (
-            self.system_calc_dao.db
-            .query(ReportCalculation)
-            .join(Report)
-            .filter(
-                ReportCalculation.calculation_id == calc_id_str,
-                ReportCalculation.calculation_type == 'system',
-                Report.is_active == True
-            )
-            .options(joinedload(ReportCalculation.report))
-            .all()
-        )
-        
-        reports = []
-        for usage in report_usages:
-            reports.append({
-                "report_id": usage.report.id,
-                "report_name": usage.report.name,
-                "report_scope": usage.report.scope,
-                "display_order": usage.display_order,
-                "display_name": usage.display_name
-            })
-        
-        return {
-            "calculation_id": calc_id,
-            "calculation_name": calculation.name,
-            "is_in_use": len(reports) > 0,
-            "report_count": len(reports),
-            "reports": reports,
-        }
+        return _build_usage_info(calculation, self.system_calc_dao.get_usage_by_ids([calc_id])[calc_id])
 
     def _validate_system_sql(self, sql: str, group_level: GroupLevel, result_column_name: str):
         """Basic validation for system SQL"""
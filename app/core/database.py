@@ -1,7 +1,8 @@
 # app/core/database.py
 """Enhanced database configuration with dual database support and audit/execution logging."""
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 import os
 
@@ -103,6 +104,60 @@ DWSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=dw_engine)
 DWBase = declarative_base()
 
 
+# ===== ASYNC ENGINE =====
+# The data warehouse through an async driver (aiosqlite / aioodbc), so long warehouse queries
+# are awaited instead of blocking the event loop. An unavailable driver leaves it as None
+# and callers fall back to the sync session on a worker thread. Config reads stay synchronous.
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mssql": "mssql+aioodbc",
+    "mssql+pyodbc": "mssql+aioodbc",
+}
+
+
+def _to_async_url(url: str) -> str:
+    """Swap the driver of a database URL for its async counterpart."""
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+def _create_async_engine(url: str):
+    """Create an async engine with the same pool sizing as the sync engine for that URL."""
+    is_sqlite = url.startswith("sqlite")
+    try:
+        async_engine = create_async_engine(
+            _to_async_url(url),
+            pool_size=2 if is_sqlite else 10,
+            max_overflow=3 if is_sqlite else 20,
+            pool_timeout=30,
+            pool_recycle=3600,
+            pool_pre_ping=True,
+        )
+    except ImportError as e:
+        print(f"Warning: Async database driver not available for {url.split('://', 1)[0]}: {e}")
+        return None
+
+    if is_sqlite:
+        @event.listens_for(async_engine.sync_engine, "connect")
+        def set_async_sqlite_pragma(dbapi_connection, connection_record):
+            """Set the same SQLite pragmas as the sync engine."""
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA busy_timeout=30000")
+            cursor.close()
+
+    return async_engine
+
+
+async_dw_engine = _create_async_engine(DATA_WAREHOUSE_URL)
+
+AsyncDWSessionLocal = (
+    async_sessionmaker(async_dw_engine, autoflush=False, expire_on_commit=False) if async_dw_engine else None
+)
+
+
 # ===== SESSION GENERATORS =====
 
 
@@ -124,6 +179,21 @@ def get_dw_db():
         db.close()
 
 
+async def dispose_async_engines():
+    """Close pooled async connections (aiosqlite keeps a worker thread per connection)."""
+    if async_dw_engine is not None:
+        await async_dw_engine.dispose()
+
+
+async def get_async_dw_db():
+    """Get async data warehouse database session (None if no async driver is installed)."""
+    if AsyncDWSessionLocal is None:
+        yield None
+        return
+    async with AsyncDWSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """Initialize database - for backward compatibility."""
     try:
@@ -146,13 +216,23 @@ def create_all_tables():
     from app.calculations.models import UserCalculation, SystemCalculation  # noqa: F401
     from app.calculations.audit_models import CalculationAuditLog  # noqa: F401 - NEW (Optimized version)
     from app.datawarehouse.models import Deal, Tranche, TrancheBal  # noqa: F401
+    from app.logging.models import Log  # noqa: F401 - the search index below is built on its table
 
     print("Creating config database tables...")
     Base.metadata.create_all(bind=engine)
 
+    # Full-text index for request log search (not part of the ORM metadata)
+    from app.logging.search import ensure_log_search_index
+    ensure_log_search_index(engine)
+
     print("Creating data warehouse tables...")
     DWBase.metadata.create_all(bind=dw_engine)
 
+    # Indexes the resolver's statements rely on, added to warehouse tables that already existed
+    from app.datawarehouse.index_advisor import ensure_warehouse_indexes
+    for index_name in ensure_warehouse_indexes(dw_engine):
+        print(f"Created warehouse index {index_name}")
+
     print("All tables created successfully!")
 
 
@@ -1,10 +1,11 @@
 # app/core/dependencies.py
 """Clean dependencies for the new calculation system with audit and execution logging."""
 
-from typing import Annotated
+from typing import Annotated, Optional
 from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.database import get_db, get_dw_db
+from app.core.database import get_db, get_dw_db, get_async_dw_db
 
 # Core database dependencies
 SessionDep = Annotated[Session, Depends(get_db)]
@@ -62,11 +63,12 @@ def get_system_calculation_service(system_calc_dao = Depends(get_system_calculat
 
 def get_report_execution_service(
     config_db: Session = Depends(get_db),
-    dw_db: Session = Depends(get_dw_db)
+    dw_db: Session = Depends(get_dw_db),
+    async_dw_db: Optional[AsyncSession] = Depends(get_async_dw_db)
 ):
     """Get report execution service"""
     from app.calculations.service import ReportExecutionService
-    return ReportExecutionService(dw_db, config_db)
+    return ReportExecutionService(dw_db, config_db, async_dw_db)
 
 # ===== REPORTING SERVICE DEPENDENCIES =====
 
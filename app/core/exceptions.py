@@ -32,6 +32,12 @@ class ReportGenerationError(ReportingSystemException):
     pass
 
 
+class ReportTimeoutError(ReportGenerationError):
+    """Raised when report queries exceed their time limit and are cancelled"""
+
+    pass
+
+
 class DataWarehouseError(ReportingSystemException):
     """Raised when data warehouse operations fail"""
 
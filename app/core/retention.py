@@ -0,0 +1,137 @@
+# app/core/retention.py
+"""Time-based retention for the append-only log tables.
+
+On SQL Server the request log, execution log, timing and audit tables can live on a monthly
+partition scheme (see README_AUDIT_SQL_SERVER.md). Retention then truncates whole partitions,
+a metadata-only operation, and keeps the scheme a few months ahead of the current date.
+Without partitions - SQLite, or an unpartitioned table - old rows are deleted in small
+batches, each its own transaction, so writers are never locked out for the whole purge.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import Column, Table, delete, select, text
+from sqlalchemy.orm import Session
+from typing import List
+import os
+import time
+
+
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+# Pause between delete batches, so queued log and audit writes get the database in between
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.05"))
+# SQL Server partition function shared by the log tables, and how many future months it keeps ready
+LOG_PARTITION_FUNCTION = os.getenv("LOG_PARTITION_FUNCTION", "pf_log_monthly")
+LOG_PARTITION_SCHEME = os.getenv("LOG_PARTITION_SCHEME", "ps_log_monthly")
+LOG_PARTITION_MONTHS_AHEAD = int(os.getenv("LOG_PARTITION_MONTHS_AHEAD", "3"))
+
+
+@dataclass
+class RetentionResult:
+    """Rows removed from one table, and how"""
+    deleted_count: int = 0
+    truncated_partitions: int = 0
+    delete_batches: int = 0
+
+
+def purge_before(session: Session, table: Table, date_column: Column, cutoff: datetime) -> RetentionResult:
+    """Remove the rows of table whose date_column is before cutoff.
+
+    Whole partitions older than the cutoff are truncated; the rest is deleted in batches.
+    Commits as it goes - callers should not hold uncommitted work on session.
+    """
+    result = RetentionResult()
+    session.commit()
+
+    if session.get_bind().dialect.name == "mssql":
+        _truncate_old_partitions(session, table, cutoff, result)
+
+    # Rows in the partition the cutoff falls into, or every old row without partitions
+    primary_key = table.primary_key.columns.values()[0]
+    while True:
+        batch = (
+            select(primary_key)
+            .where(date_column < cutoff)
+            .order_by(date_column)
+            .limit(RETENTION_BATCH_SIZE)
+            .scalar_subquery()
+        )
+        deleted = session.execute(delete(table).where(primary_key.in_(batch))).rowcount
+        session.commit()
+        if not deleted:
+            break
+        result.deleted_count += deleted
+        result.delete_batches += 1
+        if deleted < RETENTION_BATCH_SIZE:
+            break
+        time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+    return result
+
+
+def _truncate_old_partitions(session: Session, table: Table, cutoff: datetime, result: RetentionResult) -> None:
+    """Truncate the partitions of a RANGE RIGHT scheme whose upper boundary is at or before cutoff."""
+    partitions = session.execute(
+        text(
+            "SELECT p.partition_number, p.rows FROM sys.partitions p "
+            "JOIN sys.indexes i ON i.object_id = p.object_id AND i.index_id = p.index_id "
+            "JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id "
+            "JOIN sys.partition_range_values prv "
+            "ON prv.function_id = ps.function_id AND prv.boundary_id = p.partition_number "
+            "WHERE p.object_id = OBJECT_ID(:table_name) AND i.index_id <= 1 AND prv.value <= :cutoff "
+            "AND p.rows > 0"
+        ),
+        {"table_name": table.name, "cutoff": cutoff},
+    ).all()
+    if not partitions:
+        return
+
+    numbers = ", ".join(str(number) for number, _ in partitions)
+    try:
+        session.execute(text(f"TRUNCATE TABLE {table.name} WITH (PARTITIONS ({numbers}))"))
+        session.commit()
+    except Exception as e:
+        # e.g. an index that isn't aligned with the scheme - fall back to deleting the rows
+        session.rollback()
+        print(f"Warning: Could not truncate old partitions of {table.name}, deleting in batches: {e}")
+        return
+    result.deleted_count += sum(rows for _, rows in partitions)
+    result.truncated_partitions += len(partitions)
+
+
+def ensure_future_partitions(session: Session, months_ahead: int = LOG_PARTITION_MONTHS_AHEAD) -> List[datetime]:
+    """Add monthly boundaries to the log partition function up to months_ahead months from now.
+
+    Splitting an empty future partition is metadata-only; waiting until rows arrive would move data.
+    Returns the boundaries added. Does nothing when the function doesn't exist (or on SQLite).
+    """
+    if session.get_bind().dialect.name != "mssql":
+        return []
+    last_boundary = session.execute(
+        text(
+            "SELECT MAX(CAST(prv.value AS datetime2)) FROM sys.partition_range_values prv "
+            "JOIN sys.partition_functions pf ON pf.function_id = prv.function_id WHERE pf.name = :name"
+        ),
+        {"name": LOG_PARTITION_FUNCTION},
+    ).scalar()
+    if last_boundary is None:
+        return []
+
+    now = datetime.now()
+    target = _add_months(datetime(now.year, now.month, 1), months_ahead)
+    added = []
+    boundary = _add_months(datetime(last_boundary.year, last_boundary.month, 1), 1)
+    while boundary <= target:
+        session.execute(text(f"ALTER PARTITION SCHEME {LOG_PARTITION_SCHEME} NEXT USED [PRIMARY]"))
+        session.execute(
+            text(f"ALTER PARTITION FUNCTION {LOG_PARTITION_FUNCTION}() SPLIT RANGE (:boundary)"),
+            {"boundary": boundary},
+        )
+        session.commit()
+        added.append(boundary)
+        boundary = _add_months(boundary, 1)
+    return added
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month_index = value.month - 1 + months
+    return value.replace(year=value.year + month_index // 12, month=month_index % 12 + 1)
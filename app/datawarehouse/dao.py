@@ -1,10 +1,13 @@
 """Data Access Objects for the datawarehouse module (data warehouse database)."""
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from typing import List, Optional, Dict, Any
+from sqlalchemy import select, func
+from typing import List, Optional, Dict, Any, Iterable
 from app.datawarehouse.models import Deal, Tranche, TrancheBal
 
+# Deal numbers per bulk tranche query - keeps the IN list under SQL Server's parameter limit
+TRANCHE_LOOKUP_BATCH_SIZE = 1000
+
 
 class DatawarehouseDAO:
     """DAO for the new data warehouse schema."""
@@ -34,6 +37,36 @@ class DatawarehouseDAO:
         result = self.db.execute(stmt)
         return list(result.scalars().all())
 
+    def get_tranches_by_dl_nbrs(self, dl_nbrs: Iterable[int]) -> Dict[int, List[Tranche]]:
+        """Get tranches for many deals - one query per TRANCHE_LOOKUP_BATCH_SIZE deals.
+
+        Every requested deal is in the result, with an empty list if it has no tranches.
+        """
+        dl_nbrs = list(dict.fromkeys(dl_nbrs))
+        tranches_by_deal: Dict[int, List[Tranche]] = {dl_nbr: [] for dl_nbr in dl_nbrs}
+        for start in range(0, len(dl_nbrs), TRANCHE_LOOKUP_BATCH_SIZE):
+            stmt = (
+                select(Tranche)
+                .where(Tranche.dl_nbr.in_(dl_nbrs[start:start + TRANCHE_LOOKUP_BATCH_SIZE]))
+                .order_by(Tranche.dl_nbr, Tranche.tr_id)
+            )
+            for tranche in self.db.execute(stmt).scalars():
+                tranches_by_deal[tranche.dl_nbr].append(tranche)
+        return tranches_by_deal
+
+    def get_tranche_counts_by_dl_nbrs(self, dl_nbrs: Iterable[int]) -> Dict[int, int]:
+        """Count tranches for many deals without loading them (0 for deals without tranches)"""
+        dl_nbrs = list(dict.fromkeys(dl_nbrs))
+        counts: Dict[int, int] = {dl_nbr: 0 for dl_nbr in dl_nbrs}
+        for start in range(0, len(dl_nbrs), TRANCHE_LOOKUP_BATCH_SIZE):
+            stmt = (
+                select(Tranche.dl_nbr, func.count())
+                .where(Tranche.dl_nbr.in_(dl_nbrs[start:start + TRANCHE_LOOKUP_BATCH_SIZE]))
+                .group_by(Tranche.dl_nbr)
+            )
+            counts.update(self.db.execute(stmt).all())
+        return counts
+
     def get_tranche_by_keys(self, dl_nbr: int, tr_id: str) -> Optional[Tranche]:
         """Get a tranche by DL number and tranche ID"""
         stmt = select(Tranche).where(Tranche.dl_nbr == dl_nbr, Tranche.tr_id == tr_id)
@@ -0,0 +1,244 @@
+"""Managed warehouse indexes, and an advisor that checks report SQL against them."""
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.orm import Session
+from typing import Dict, List, Any, Optional, Set, Tuple
+import re
+import xml.etree.ElementTree as ET
+
+from app.core.database import DWBase
+from app.datawarehouse import models  # noqa: F401 - registers the warehouse tables and their indexes
+
+
+SHOWPLAN_NAMESPACE = "{http://schemas.microsoft.com/sqlserver/2004/07/showplan}"
+
+# table.column compared to a bind parameter, e.g. "tranchebal.cycle_cde = :cycle_code" or "... IN (:deal_1_tranche_0"
+_PARAM_PREDICATE = re.compile(r"\b(\w+)\.(\w+)\s*(?:=\s*:\w+|IN\s*\(\s*:)", re.IGNORECASE)
+# Equality between two columns, e.g. "tranche.dl_nbr = tranchebal.dl_nbr"
+_JOIN_PREDICATE = re.compile(r"\b(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)\b")
+_COLUMN_REFERENCE = re.compile(r"\b(\w+)\.(\w+)\b")
+# SQLite plan line reading a whole table, e.g. "SCAN tranchebal" (but not "SCAN ... USING COVERING INDEX")
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def managed_indexes() -> List[Dict[str, Any]]:
+    """Secondary indexes declared on the warehouse models"""
+    return [
+        {
+            "name": index.name,
+            "table": table.name,
+            "columns": [column.name for column in index.columns],
+            "include_columns": list(index.dialect_options["mssql"]["include"] or []),
+        }
+        for table in DWBase.metadata.sorted_tables
+        for index in sorted(table.indexes, key=lambda index: index.name)
+    ]
+
+
+def ensure_warehouse_indexes(engine: Engine) -> List[str]:
+    """Create the managed indexes missing from existing warehouse tables. Returns the names created.
+
+    create_all only indexes the tables it creates; warehouse tables usually exist already.
+    """
+    inspector = inspect(engine)
+    created = []
+    for table in DWBase.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine)
+                created.append(index.name)
+            except Exception as e:
+                print(f"Warning: Could not create warehouse index {index.name}: {e}")
+    return created
+
+
+class IndexAdvisor:
+    """Reads the warehouse query plans of report statements and recommends missing indexes.
+
+    On SQL Server the optimizer's own missing-index hints from the XML showplan are used.
+    SQLite has none, so a table the plan reads in full is matched against the statement's
+    predicates: parameter comparisons first, then join columns, with the other referenced
+    columns as the included ones.
+    """
+
+    def __init__(self, dw_db: Session):
+        self.dw_db = dw_db
+        self.dialect = dw_db.get_bind().dialect.name
+        self.warehouse_tables = {table.name: table for table in DWBase.metadata.sorted_tables}
+
+    def advise(self, statements: Dict[str, str], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Plans, per-statement findings and deduplicated index recommendations for named statements"""
+        existing = self._existing_indexes()
+        statement_advice = {}
+        recommendations: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+
+        for name, sql in statements.items():
+            try:
+                plan, found = self._analyze(sql, params, existing)
+            except Exception as e:
+                statement_advice[name] = {"plan": [], "recommendations": [], "error": str(e)}
+                continue
+            statement_advice[name] = {"plan": plan, "recommendations": found}
+            for recommendation in found:
+                key = (recommendation["table"], tuple(recommendation["key_columns"]))
+                merged = recommendations.setdefault(key, {**recommendation, "statements": []})
+                merged["include_columns"] = sorted(set(merged["include_columns"]) | set(recommendation["include_columns"]))
+                merged["create_sql"] = self._create_sql(merged["table"], merged["key_columns"], merged["include_columns"])
+                merged["statements"].append(name)
+
+        present = {name for indexes in existing.values() for name in indexes}
+        for table in self.warehouse_tables.values():
+            for index in table.indexes:
+                if index.name in present:
+                    continue
+                using = [name for name, sql in statements.items() if re.search(rf"\b{table.name}\b", sql)]
+                if using:
+                    recommendations[(table.name, ("managed", index.name))] = {
+                        "table": table.name,
+                        "key_columns": [column.name for column in index.columns],
+                        "include_columns": list(index.dialect_options["mssql"]["include"] or []),
+                        "reason": f"managed index {index.name} is missing (created by ensure_warehouse_indexes)",
+                        "impact": None,
+                        "create_sql": str(CreateIndex(index).compile(dialect=self.dw_db.get_bind().dialect)).strip(),
+                        "statements": using,
+                    }
+
+        return {
+            "dialect": self.dialect,
+            "statements": statement_advice,
+            "recommendations": list(recommendations.values()),
+            "managed_indexes": [
+                {**index, "present": index["name"] in present} for index in managed_indexes()
+            ],
+        }
+
+    def _existing_indexes(self) -> Dict[str, Dict[str, List[str]]]:
+        """table -> index name -> key columns, including the primary key"""
+        inspector = inspect(self.dw_db.get_bind())
+        existing = {}
+        for table_name in self.warehouse_tables:
+            if not inspector.has_table(table_name):
+                continue
+            indexes = {index["name"]: index["column_names"] for index in inspector.get_indexes(table_name)}
+            primary_key = inspector.get_pk_constraint(table_name)
+            if primary_key.get("constrained_columns"):
+                indexes[primary_key.get("name") or "PRIMARY KEY"] = primary_key["constrained_columns"]
+            existing[table_name] = indexes
+        return existing
+
+    def _analyze(self, sql: str, params: Dict[str, Any],
+                 existing: Dict[str, Dict[str, List[str]]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+        if self.dialect == "mssql":
+            return self._analyze_mssql(sql, params)
+        return self._analyze_sqlite(sql, params, existing)
+
+    # ===== SQLITE =====
+
+    def _analyze_sqlite(self, sql: str, params: Dict[str, Any],
+                        existing: Dict[str, Dict[str, List[str]]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+        rows = self.dw_db.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).all()
+        plan = [row[-1] for row in rows]
+        scanned = {
+            match.group(1) for match in (_SQLITE_FULL_SCAN.match(line) for line in plan)
+            if match and match.group(1) in self.warehouse_tables
+        }
+
+        recommendations = []
+        for table_name in sorted(scanned):
+            key_columns, include_columns = self._candidate_index(sql, table_name)
+            if not key_columns:
+                continue  # Nothing narrows the table - an index wouldn't avoid the scan
+            serving = self._serving_index(existing.get(table_name, {}), key_columns)
+            if serving:
+                # The planner preferred a scan over an index that fits (a small table) - nothing to add
+                continue
+            recommendations.append({
+                "table": table_name,
+                "key_columns": key_columns,
+                "include_columns": include_columns,
+                "reason": f"{table_name} is read in full",
+                "impact": None,
+            })
+        return plan, recommendations
+
+    def _candidate_index(self, sql: str, table_name: str) -> Tuple[List[str], List[str]]:
+        """Key columns (parameter predicates, then join columns) and the other columns a statement reads"""
+        columns = set(self.warehouse_tables[table_name].columns.keys())
+
+        key_columns: List[str] = []
+        for table, column in _PARAM_PREDICATE.findall(sql):
+            if table == table_name and column in columns and column not in key_columns:
+                key_columns.append(column)
+        for left_table, left_column, right_table, right_column in _JOIN_PREDICATE.findall(sql):
+            for table, column in ((left_table, left_column), (right_table, right_column)):
+                if table == table_name and column in columns and column not in key_columns:
+                    key_columns.append(column)
+
+        referenced: Set[str] = {
+            column for table, column in _COLUMN_REFERENCE.findall(sql) if table == table_name and column in columns
+        }
+        return key_columns, sorted(referenced - set(key_columns))
+
+    def _serving_index(self, indexes: Dict[str, List[str]], key_columns: List[str]) -> Optional[str]:
+        """An existing index whose leading columns are the key columns, in any order"""
+        for name, index_columns in indexes.items():
+            if set(index_columns[: len(key_columns)]) == set(key_columns):
+                return name
+        return None
+
+    def _create_sql(self, table_name: str, key_columns: List[str], include_columns: List[str]) -> str:
+        name = f"idx_{table_name}_{'_'.join(key_columns)}"
+        sql = f"CREATE INDEX {name} ON {table_name} ({', '.join(key_columns)})"
+        if include_columns and self.dialect == "mssql":
+            sql += f" INCLUDE ({', '.join(include_columns)})"
+        return sql
+
+    # ===== SQL SERVER =====
+
+    def _analyze_mssql(self, sql: str, params: Dict[str, Any]) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Estimated plan with SET SHOWPLAN_XML - the statement is compiled but not run"""
+        connection = self.dw_db.connection()
+        connection.exec_driver_sql("SET SHOWPLAN_XML ON")
+        try:
+            plan_xml = connection.execute(text(sql), params).scalar()
+        finally:
+            connection.exec_driver_sql("SET SHOWPLAN_XML OFF")
+        return parse_showplan(plan_xml)
+
+
+def parse_showplan(plan_xml: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Operators reading tables, and the optimizer's missing-index hints, from an XML showplan"""
+    root = ET.fromstring(plan_xml)
+    plan = []
+    for operator in root.iter(f"{SHOWPLAN_NAMESPACE}RelOp"):
+        target = operator.find(f"./*/{SHOWPLAN_NAMESPACE}Object")
+        if target is None:
+            continue
+        table = (target.get("Table") or "").strip("[]")
+        index = (target.get("Index") or "").strip("[]")
+        plan.append(f"{operator.get('PhysicalOp')} {table}" + (f" ({index})" if index else ""))
+
+    recommendations = []
+    for group in root.iter(f"{SHOWPLAN_NAMESPACE}MissingIndexGroup"):
+        impact = float(group.get("Impact", 0))
+        for missing in group.iter(f"{SHOWPLAN_NAMESPACE}MissingIndex"):
+            columns: Dict[str, List[str]] = {"EQUALITY": [], "INEQUALITY": [], "INCLUDE": []}
+            for column_group in missing.iter(f"{SHOWPLAN_NAMESPACE}ColumnGroup"):
+                columns[column_group.get("Usage")] = [
+                    column.get("Name").strip("[]") for column in column_group.iter(f"{SHOWPLAN_NAMESPACE}Column")
+                ]
+            recommendations.append({
+                "table": missing.get("Table").strip("[]"),
+                "key_columns": columns["EQUALITY"] + columns["INEQUALITY"],
+                "include_columns": columns["INCLUDE"],
+                "reason": "missing index reported by the SQL Server optimizer",
+                "impact": impact,
+            })
+    return plan, recommendations
@@ -1,6 +1,6 @@
 """Database models for the datawarehouse module (data warehouse database)."""
 
-from sqlalchemy import Column, Integer, String, Float, SmallInteger, ForeignKey, CHAR, and_, Numeric
+from sqlalchemy import Column, Integer, String, Float, SmallInteger, ForeignKey, CHAR, Index, and_, Numeric
 from sqlalchemy.orm import relationship, Mapped, mapped_column, foreign
 from sqlalchemy.dialects.mssql import MONEY
 from app.core.database import DWBase as Base
@@ -62,6 +62,18 @@ class TrancheBal(Base):
     tr_int_accrl_amt: Mapped[float] = mapped_column(Numeric(19, 4), nullable=False)
     tr_int_shtfl_amt: Mapped[float] = mapped_column(Numeric(19, 4), nullable=False)
 
+    __table_args__ = (
+        # Report statements filter on one cycle, then join on deal and tranche; on SQL Server the
+        # balance columns are included so those reads never touch the clustered primary key
+        Index(
+            "idx_tranchebal_cycle_deal_tranche", "cycle_cde", "dl_nbr", "tr_id",
+            mssql_include=[
+                "tr_end_bal_amt", "tr_prin_rel_ls_amt", "tr_pass_thru_rte", "tr_accrl_days",
+                "tr_int_dstrb_amt", "tr_prin_dstrb_amt", "tr_int_accrl_amt", "tr_int_shtfl_amt",
+            ],
+        ),
+    )
+
     tranche = relationship(
         "Tranche",
         back_populates="tranchebals",
@@ -0,0 +1,85 @@
+"""Policies deciding how much of a response body the request log keeps."""
+
+from typing import Dict, Optional, Tuple
+import os
+import random
+
+
+def _parse_sample_rates(value: str) -> Dict[str, float]:
+    """Parse "path_prefix=rate,..." into {prefix: rate}; malformed entries are skipped."""
+    rates = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        prefix, _, rate = entry.rpartition("=")
+        try:
+            rates[prefix.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            print(f"Warning: Ignoring malformed LOG_BODY_SAMPLE_RATES entry '{entry}'")
+    return rates
+
+
+# "full" keeps bodies within the limits below, "metadata" logs only status, sizes and timing
+LOG_BODY_CAPTURE_MODE = os.environ.get("LOG_BODY_CAPTURE_MODE", "full").lower()
+# Bodies are cut to their first bytes; streamed responses (no Content-Length) keep fewer
+LOG_RESPONSE_BODY_MAX_BYTES = int(os.environ.get("LOG_RESPONSE_BODY_MAX_BYTES", "65536"))
+LOG_STREAMED_BODY_MAX_BYTES = int(os.environ.get("LOG_STREAMED_BODY_MAX_BYTES", "4096"))
+LOG_REQUEST_BODY_MAX_BYTES = int(os.environ.get("LOG_REQUEST_BODY_MAX_BYTES", "65536"))
+# Responses declared larger than this are logged without their body (0 disables)
+LOG_METADATA_ONLY_ABOVE_BYTES = int(os.environ.get("LOG_METADATA_ONLY_ABOVE_BYTES", str(1024 * 1024)))
+# Content types (prefixes) whose bodies are never kept - binary exports and files
+LOG_EXCLUDED_CONTENT_TYPES = tuple(
+    content_type.strip().lower()
+    for content_type in os.environ.get(
+        "LOG_EXCLUDED_CONTENT_TYPES",
+        "application/vnd.openxmlformats,application/vnd.apache,application/octet-stream,"
+        "application/pdf,application/zip,image/,font/",
+    ).split(",")
+    if content_type.strip()
+)
+# Share of requests whose body is kept, by longest matching path prefix, e.g. "/api/reports/run=0.1"
+LOG_BODY_SAMPLE_RATE = float(os.environ.get("LOG_BODY_SAMPLE_RATE", "1.0"))
+LOG_BODY_SAMPLE_RATES = _parse_sample_rates(os.environ.get("LOG_BODY_SAMPLE_RATES", ""))
+
+
+def body_sample_rate(path: str) -> float:
+    """Sample rate of the longest configured prefix of path, or the default rate."""
+    matches = [prefix for prefix in LOG_BODY_SAMPLE_RATES if path.startswith(prefix)]
+    return LOG_BODY_SAMPLE_RATES[max(matches, key=len)] if matches else LOG_BODY_SAMPLE_RATE
+
+
+def response_capture_limit(path: str, content_type: str,
+                           content_length: Optional[int]) -> Tuple[int, Optional[str]]:
+    """How many leading body bytes to keep for a response, and why nothing is kept when that is 0.
+
+    A missing content_length means a streamed response.
+    """
+    if LOG_BODY_CAPTURE_MODE == "metadata":
+        return 0, "metadata-only mode"
+    content_type = content_type.lower()
+    if any(content_type.startswith(excluded) for excluded in LOG_EXCLUDED_CONTENT_TYPES):
+        return 0, f"content type {content_type.split(';')[0]}"
+    if LOG_METADATA_ONLY_ABOVE_BYTES and content_length is not None and content_length > LOG_METADATA_ONLY_ABOVE_BYTES:
+        return 0, "response too large"
+    sample_rate = body_sample_rate(path)
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return 0, "not sampled"
+    return (LOG_STREAMED_BODY_MAX_BYTES if content_length is None else LOG_RESPONSE_BODY_MAX_BYTES), None
+
+
+def describe_response_body(captured: bytes, total_bytes: int, skipped_reason: Optional[str],
+                           is_streamed: bool) -> str:
+    """Text stored as the logged response body: the captured head, with a note when it is partial."""
+    if skipped_reason:
+        return f"[Response body not logged ({skipped_reason}): {total_bytes} bytes sent]"
+    body = captured.decode("utf-8", errors="ignore")
+    if total_bytes > len(captured):
+        kind = "Streamed response" if is_streamed else "Response"
+        return body + f"\n[{kind} truncated: {total_bytes} bytes sent]"
+    return body
+
+
+def describe_request_body(captured: bytes, total_bytes: int) -> str:
+    """Logged request body: the captured head, with a note when the body was longer."""
+    body = captured.decode("utf-8", errors="ignore")
+    if total_bytes > len(captured):
+        return body + f"\n[Request truncated: {total_bytes} bytes received]"
+    return body
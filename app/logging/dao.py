@@ -1,9 +1,11 @@
 """Data Access Objects for the logging module."""
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select, text, func, or_, cast, String
-from typing import List, Dict, Any, Optional
+from sqlalchemy import select, text, func, or_, and_, cast, String
+from typing import List, Dict, Any, Optional, Tuple
 from app.logging.models import Log
+from app.logging.search import log_search_condition
+from app.core.retention import RetentionResult, ensure_future_partitions, purge_before
 from datetime import datetime, timedelta
 
 
@@ -22,41 +24,31 @@ class LogDAO:
         status_min: Optional[int] = None,
         status_max: Optional[int] = None,
         search: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
     ) -> List[Log]:
-        """Get logs with pagination and filtering"""
+        """Get logs with pagination and filtering, newest first.
+
+        With a cursor (timestamp and id of the last row of the previous page) the page is read with
+        a keyset condition instead of OFFSET, so deep pages cost the same as the first one.
+        """
         if log_id:
             query = select(Log).where(Log.id == log_id)
         else:
-            # Calculate the time threshold based on the hours parameter
-            time_threshold = datetime.now() - timedelta(hours=hours)
-
-            # Start with time filter
-            query = select(Log).where(Log.timestamp >= time_threshold)
+            query = self._apply_filters(select(Log), hours, status_min, status_max, search)
 
-            # Add status code range filter if provided
-            if status_min is not None:
-                query = query.where(Log.status_code >= status_min)
-            if status_max is not None:
-                query = query.where(Log.status_code <= status_max)
-
-            # Apply search filter if provided
-            if search:
-                search_term = f"%{search}%"
+            if cursor is not None:
+                cursor_timestamp, cursor_id = cursor
                 query = query.where(
                     or_(
-                        Log.path.ilike(search_term),
-                        Log.method.ilike(search_term),
-                        Log.client_ip.ilike(search_term),
-                        Log.username.ilike(search_term),
-                        Log.hostname.ilike(search_term),
-                        # Convert status_code to string for searching
-                        cast(Log.status_code, String).ilike(search_term),
-                        cast(Log.application_id, String).ilike(search_term),
+                        Log.timestamp < cursor_timestamp,
+                        and_(Log.timestamp == cursor_timestamp, Log.id < cursor_id),
                     )
                 )
+            elif offset:
+                query = query.offset(offset)
 
-            # Add sorting and pagination
-            query = query.order_by(Log.timestamp.desc()).offset(offset).limit(limit)
+            # Add sorting and pagination - id breaks timestamp ties so pages never overlap
+            query = query.order_by(Log.timestamp.desc(), Log.id.desc()).limit(limit)
 
         result = self.session.execute(query).scalars().all()
         return list(result)
@@ -69,11 +61,35 @@ class LogDAO:
         search: Optional[str] = None,
     ) -> int:
         """Get total count of logs matching the filters"""
+        query = self._apply_filters(select(func.count()).select_from(Log), hours, status_min, status_max, search)
+        result = self.session.execute(query).scalar_one()
+        return result
+
+    async def estimate_logs_count(
+        self,
+        hours: int = 24,
+        status_min: Optional[int] = None,
+        status_max: Optional[int] = None,
+        search: Optional[str] = None,
+        cap: int = 10000,
+    ) -> Tuple[int, bool]:
+        """Count of logs matching the filters that stops at cap rows, and whether it is exact.
+
+        Ids aren't in timestamp order (the batched writer inserts out of order), so the id range of the
+        window can't stand in for a count. Above cap the count is a lower bound and not exact.
+        """
+        capped = self._apply_filters(select(Log.id), hours, status_min, status_max, search).limit(cap + 1)
+        count = self.session.execute(select(func.count()).select_from(capped.subquery())).scalar_one()
+        return min(count, cap), count <= cap
+
+    def _apply_filters(self, query, hours: int, status_min: Optional[int], status_max: Optional[int],
+                       search: Optional[str]):
+        """Time window, status range and search filters of the log list"""
         # Calculate the time threshold based on the hours parameter
         time_threshold = datetime.now() - timedelta(hours=hours)
 
         # Start with time filter
-        query = select(func.count()).select_from(Log).where(Log.timestamp >= time_threshold)
+        query = query.where(Log.timestamp >= time_threshold)
 
         # Add status code range filter if provided
         if status_min is not None:
@@ -81,8 +97,11 @@ class LogDAO:
         if status_max is not None:
             query = query.where(Log.status_code <= status_max)
 
-        # Apply search filter if provided
+        # Apply search filter if provided - through the full-text index when it can answer the term
         if search:
+            indexed = log_search_condition(self.session.get_bind(), search)
+            if indexed is not None:
+                return query.where(indexed)
             search_term = f"%{search}%"
             query = query.where(
                 or_(
@@ -96,9 +115,7 @@ class LogDAO:
                     cast(Log.application_id, String).ilike(search_term),
                 )
             )
-
-        result = self.session.execute(query).scalar_one()
-        return result
+        return query
 
     async def get_status_distribution(self, hours: int = 24) -> List[Dict[str, Any]]:
         """Get distribution of logs by status code with time filter"""
@@ -128,3 +145,9 @@ class LogDAO:
 
         result = self.session.execute(query).scalars().all()
         return list(result)
+
+    def cleanup_old_logs(self, days_to_keep: int = 30) -> RetentionResult:
+        """Remove request logs older than specified days (whole partitions where the table has them)."""
+        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+        ensure_future_partitions(self.session)
+        return purge_before(self.session, Log.__table__, Log.timestamp, cutoff_date)
@@ -3,8 +3,7 @@
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import ResponseValidationError, RequestValidationError
-from app.logging.models import Log
-from app.core.database import SessionLocal
+from app.logging.writer import write_request_log
 from datetime import datetime
 import json
 import os
@@ -35,23 +34,15 @@ def safe_json_dumps(obj):
 
 
 def get_request_body_safely(request: Request) -> str:
-    """Safely get request body, handling cases where it's already been consumed"""
+    """Request body stored by the logging middleware - what had been received when the error happened.
+
+    The middleware doesn't read bodies ahead of the app, so a body the app never read is logged as such.
+    """
     try:
-        # Try to get the body from the request scope if middleware stored it
         if hasattr(request.state, "body"):
             return request.state.body
-
-        # If that's not available, try to read from the request
-        # This will only work if the body hasn't been consumed yet
-        import asyncio
-
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # We're in an async context but can't await here
-            return "Request body already consumed"
-        else:
-            # Fallback - this probably won't work in most cases
-            return "Unable to read request body"
+        # Paths the logging middleware skips
+        return "Request body not captured"
     except Exception:
         return "Unable to read request body"
 
@@ -60,58 +51,52 @@ async def general_exception_handler(request: Request, exc: Exception):
     """Handle all unhandled exceptions and log them to database"""
     error_traceback = traceback.format_exc()
 
-    with SessionLocal() as session:
-        try:
-            # Get request body safely without trying to await in sync context
-            request_body = get_request_body_safely(request)
-
-            log = Log(
-                timestamp=datetime.now(),
-                method=request.method,
-                path=str(request.url.path),
-                status_code=500,
-                client_ip=request.client.host if request.client else None,
-                request_headers=json.dumps(dict(request.headers)),
-                request_body=request_body,
-                response_body=safe_json_dumps(
-                    {"error": str(exc), "type": type(exc).__name__, "traceback": error_traceback}
-                ),
-                processing_time=None,
-                user_agent=request.headers.get("user-agent"),
-                username=USERNAME,
-                hostname=HOSTNAME,
-                application_id=APPLICATION_ID,
-            )
-            session.add(log)
-            session.commit()
-        except Exception as log_error:
-            print(f"Error logging exception: {log_error}")
-
-    return JSONResponse(
-        status_code=500,
-        content={"detail": "Internal Server Error"},
-    )
-
+    try:
+        # Get request body safely without trying to await in sync context
+        request_body = get_request_body_safely(request)
 
-async def response_validation_exception_handler(request: Request, exc: ResponseValidationError):
-    with SessionLocal() as session:
-        log = Log(
+        write_request_log(dict(
             timestamp=datetime.now(),
             method=request.method,
             path=str(request.url.path),
             status_code=500,
             client_ip=request.client.host if request.client else None,
             request_headers=json.dumps(dict(request.headers)),
-            request_body=get_request_body_safely(request),
-            response_body=safe_json_dumps(exc.errors()),
+            request_body=request_body,
+            response_body=safe_json_dumps(
+                {"error": str(exc), "type": type(exc).__name__, "traceback": error_traceback}
+            ),
             processing_time=None,
             user_agent=request.headers.get("user-agent"),
             username=USERNAME,
             hostname=HOSTNAME,
             application_id=APPLICATION_ID,
-        )
-        session.add(log)
-        session.commit()
+        ))
+    except Exception as log_error:
+        print(f"Error logging exception: {log_error}")
+
+    return JSONResponse(
+        status_code=500,
+        content={"detail": "Internal Server Error"},
+    )
+
+
+async def response_validation_exception_handler(request: Request, exc: ResponseValidationError):
+    write_request_log(dict(
+        timestamp=datetime.now(),
+        method=request.method,
+        path=str(request.url.path),
+        status_code=500,
+        client_ip=request.client.host if request.client else None,
+        request_headers=json.dumps(dict(request.headers)),
+        request_body=get_request_body_safely(request),
+        response_body=safe_json_dumps(exc.errors()),
+        processing_time=None,
+        user_agent=request.headers.get("user-agent"),
+        username=USERNAME,
+        hostname=HOSTNAME,
+        application_id=APPLICATION_ID,
+    ))
 
     return JSONResponse(
         status_code=500,
@@ -121,30 +106,27 @@ async def response_validation_exception_handler(request: Request, exc: ResponseV
 
 async def request_validation_exception_handler(request: Request, exc: RequestValidationError):
     """Handle request validation errors"""
-    with SessionLocal() as session:
-        try:
-            # Get request body safely
-            request_body = get_request_body_safely(request)
+    try:
+        # Get request body safely
+        request_body = get_request_body_safely(request)
 
-            log = Log(
-                timestamp=datetime.now(),
-                method=request.method,
-                path=str(request.url.path),
-                status_code=422,
-                client_ip=request.client.host if request.client else None,
-                request_headers=json.dumps(dict(request.headers)),
-                request_body=request_body,
-                response_body=safe_json_dumps(exc.errors()),
-                processing_time=None,
-                user_agent=request.headers.get("user-agent"),
-                username=USERNAME,
-                hostname=HOSTNAME,
-                application_id=APPLICATION_ID,
-            )
-            session.add(log)
-            session.commit()
-        except Exception as log_error:
-            print(f"Error logging validation exception: {log_error}")
+        write_request_log(dict(
+            timestamp=datetime.now(),
+            method=request.method,
+            path=str(request.url.path),
+            status_code=422,
+            client_ip=request.client.host if request.client else None,
+            request_headers=json.dumps(dict(request.headers)),
+            request_body=request_body,
+            response_body=safe_json_dumps(exc.errors()),
+            processing_time=None,
+            user_agent=request.headers.get("user-agent"),
+            username=USERNAME,
+            hostname=HOSTNAME,
+            application_id=APPLICATION_ID,
+        ))
+    except Exception as log_error:
+        print(f"Error logging validation exception: {log_error}")
 
     # Convert errors to a safe format for JSON response
     def convert_error(error):
@@ -167,32 +149,29 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions and log 4xx/5xx errors"""
     # Log 4xx and 5xx errors
     if exc.status_code >= 400:
-        with SessionLocal() as session:
-            try:
-                # Get request body safely
-                request_body = get_request_body_safely(request)
-
-                log = Log(
-                    timestamp=datetime.now(),
-                    method=request.method,
-                    path=str(request.url.path),
-                    status_code=exc.status_code,
-                    client_ip=request.client.host if request.client else None,
-                    request_headers=json.dumps(dict(request.headers)),
-                    request_body=request_body,
-                    response_body=safe_json_dumps(
-                        {"detail": exc.detail, "headers": getattr(exc, "headers", None)}
-                    ),
-                    processing_time=None,
-                    user_agent=request.headers.get("user-agent"),
-                    username=USERNAME,
-                    hostname=HOSTNAME,
-                    application_id=APPLICATION_ID,
-                )
-                session.add(log)
-                session.commit()
-            except Exception as log_error:
-                print(f"Error logging HTTP exception: {log_error}")
+        try:
+            # Get request body safely
+            request_body = get_request_body_safely(request)
+
+            write_request_log(dict(
+                timestamp=datetime.now(),
+                method=request.method,
+                path=str(request.url.path),
+                status_code=exc.status_code,
+                client_ip=request.client.host if request.client else None,
+                request_headers=json.dumps(dict(request.headers)),
+                request_body=request_body,
+                response_body=safe_json_dumps(
+                    {"detail": exc.detail, "headers": getattr(exc, "headers", None)}
+                ),
+                processing_time=None,
+                user_agent=request.headers.get("user-agent"),
+                username=USERNAME,
+                hostname=HOSTNAME,
+                application_id=APPLICATION_ID,
+            ))
+        except Exception as log_error:
+            print(f"Error logging HTTP exception: {log_error}")
 
     return JSONResponse(
         status_code=exc.status_code,
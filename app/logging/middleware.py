@@ -6,15 +6,19 @@ import os
 import getpass
 import platform
 import socket
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
-from typing import Callable, AsyncIterator
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Optional
 
 from datetime import datetime
-from starlette.background import BackgroundTask
-from app.logging.models import Log
-from app.core.database import SessionLocal
+from app.logging.writer import request_log_write_blocks, write_request_log
+from app.logging.capture import (
+    LOG_REQUEST_BODY_MAX_BYTES,
+    response_capture_limit,
+    describe_response_body,
+    describe_request_body,
+)
 
 # Import APPLICATION_ID from environment variables
 from dotenv import load_dotenv
@@ -23,12 +27,23 @@ load_dotenv()
 
 APPLICATION_ID = os.environ.get("APPLICATION_ID", "Unknown")
 
+# Paths that are never logged
+EXCLUDED_PATHS = ("/api/logs", "/static", "/logs")
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware that logs HTTP requests and responses to the database."""
+# Logged request body of requests that failed before the app read their body (or all of it)
+UNREAD_REQUEST_BODY = "[Request body not read before the error]"
+PARTIAL_REQUEST_BODY_NOTE = "\n[Request body only partly read before the error]"
+
+
+class LoggingMiddleware:
+    """ASGI middleware that logs HTTP requests and responses to the database.
+
+    Request and response messages are passed on as they arrive; only the sizes and the first
+    bytes of each body (within the capture limits) are kept for the log row.
+    """
 
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
         # Get the current username when middleware is initialized
         try:
             # Try multiple methods to get the username for cross-platform support
@@ -55,113 +70,106 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             f"{self.hostname}, App ID: {self.application_id}"
         )
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Define paths that should be excluded from logging
-        excluded_paths = ["/api/logs", "/static", "/logs"]
-
-        # Skip logging for excluded paths
-        if any(request.url.path.startswith(path) for path in excluded_paths):
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(EXCLUDED_PATHS):
+            await self.app(scope, receive, send)
+            return
 
         # --- Start timer ---
         start_time = time.time()
+        duration_ms = None
+
+        request_chunks, request_captured, request_bytes = [], 0, 0
+        status_code = None
+        is_streamed = False
+        is_html = False
+        capture_limit, skipped_reason = 0, None
+        response_chunks, response_captured, response_bytes = [], 0, 0
+
+        # Exception handlers log the request body from request.state. The body is only read when the
+        # app reads it, so the state holds what was received so far - set before the app runs, since
+        # handlers can fail a request before (or while) its body is read
+        state = scope.setdefault("state", {})
+        request_headers = Headers(scope=scope)
+        has_body = request_headers.get("content-length", "0") != "0" or "transfer-encoding" in request_headers
+        state["body"] = UNREAD_REQUEST_BODY if has_body else ""
+
+        async def logged_receive() -> Message:
+            nonlocal request_captured, request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                request_bytes += len(body)
+                if request_captured < LOG_REQUEST_BODY_MAX_BYTES:
+                    request_chunks.append(body[: LOG_REQUEST_BODY_MAX_BYTES - request_captured])
+                    request_captured += len(request_chunks[-1])
+                state["body"] = describe_request_body(b"".join(request_chunks), request_bytes)
+                if message.get("more_body", False):
+                    state["body"] += PARTIAL_REQUEST_BODY_NOTE
+            return message
+
+        async def logged_send(message: Message) -> None:
+            nonlocal duration_ms, status_code, is_streamed, is_html, capture_limit, skipped_reason
+            nonlocal response_captured, response_bytes
+            if message["type"] == "http.response.start":
+                # --- End timer (time to the response headers) ---
+                duration_ms = (time.time() - start_time) * 1000
+                status_code = message["status"]
+                headers = Headers(raw=message.get("headers", []))
+                content_type = headers.get("content-type", "")
+                is_html = "text/html" in content_type
+                # Keep at most the head of the body - report results and exports can be megabytes
+                is_streamed = "content-length" not in headers
+                content_length = None if is_streamed else int(headers["content-length"])
+                capture_limit, skipped_reason = response_capture_limit(scope["path"], content_type, content_length)
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                response_bytes += len(body)
+                if response_captured < capture_limit:
+                    response_chunks.append(body[: capture_limit - response_captured])
+                    response_captured += len(response_chunks[-1])
+            await send(message)
 
-        # --- Read request body ---
-        body_bytes = await request.body()
-        request_body = body_bytes.decode("utf-8", errors="ignore")
-
-        # Store request body in request state for exception handlers
-        request.state.body = request_body
-
-        # Reconstruct stream
-        async def receive() -> dict:
-            return {"type": "http.request", "body": body_bytes}
-
-        request = Request(request.scope, receive=receive)
-
-        # Make sure the body is still available in the new request object
-        request.state.body = request_body
-
-        # --- Proceed with original response ---
-        response = await call_next(request)
-
-        # --- End timer ---
-        end_time = time.time()
-        duration_ms = (end_time - start_time) * 1000
-
-        # Capture response information
-        status_code = response.status_code
-        headers = response.headers
-        content_type = headers.get("content-type", "")
-        is_html = "text/html" in content_type
-
-        # Create a new response with captured body
-        response_body = b""
-
-        # Handle different response types to capture body
-        if isinstance(response, Response) and hasattr(response, "body"):
-            # Standard Response with body attribute
-            response_body = response.body
-            new_response = response
-        elif hasattr(response, "body_iterator"):
-            # It's a StreamingResponse
-            # We need to consume the iterator to get the full body
-            original_iterator = response.body_iterator
-
-            # Create a buffer to store the chunks
-            chunks = []
-
-            # Define a new iterator that collects chunks
-            async def buffer_iterator() -> AsyncIterator[bytes]:
-                nonlocal response_body
-                async for chunk in original_iterator:
-                    chunks.append(chunk)
-                    yield chunk
-
-                # Combine all chunks into a single response body
-                response_body = b"".join(chunks)
-
-            # Replace the body_iterator with our buffering iterator
-            response.body_iterator = buffer_iterator()
-            new_response = response
+        try:
+            await self.app(scope, logged_receive, logged_send)
+        finally:
+            # Errors raised before a response started are logged by the exception handlers
+            if status_code is not None:
+                await self._log(scope, status_code, duration_ms, request_chunks, request_bytes, response_chunks,
+                                response_bytes, skipped_reason, is_streamed, is_html)
+
+    async def _log(self, scope: Scope, status_code: int, duration_ms: float, request_chunks: list,
+                   request_bytes: int, response_chunks: list, response_bytes: int,
+                   skipped_reason: Optional[str], is_streamed: bool, is_html: bool) -> None:
+        """Write the log row of a finished request."""
+        # --- Log to DB (queued for the batched log writer) ---
+        # Determine the response body to log
+        response_body = b"".join(response_chunks)
+        if response_body or skipped_reason or response_bytes:
+            body_to_log = describe_response_body(response_body, response_bytes, skipped_reason, is_streamed)
+        elif is_html:
+            body_to_log = "[HTML content not logged for successful response]"
         else:
-            # Unknown response type - use as is
-            new_response = response
-
-        # --- Log to DB (in background) ---
-        def log_to_db() -> None:
-            with SessionLocal() as session:
-                # Determine the response body to log
-                body_to_log = ""
-                if response_body:
-                    body_to_log = response_body.decode("utf-8", errors="ignore")
-                elif is_html:
-                    body_to_log = "[HTML content not logged for successful response]"
-                else:
-                    body_to_log = "[Response body not available]"
-
-                # Create a SQLAlchemy Log object
-                log = Log(
-                    timestamp=datetime.now(),
-                    method=request.method,
-                    path=str(request.url.path),
-                    status_code=status_code,
-                    client_ip=request.client.host if request.client else None,
-                    request_headers=json.dumps(dict(request.headers)),
-                    request_body=request_body,
-                    response_body=body_to_log,
-                    processing_time=duration_ms,  # type: ignore
-                    user_agent=request.headers.get("user-agent"),
-                    username=self.username,
-                    hostname=self.hostname,
-                    application_id=self.application_id,
-                )
-                session.add(log)
-                session.commit()
-
-        # Attach as background task
-        new_response.background = getattr(new_response, "background", None) or BackgroundTask(
-            log_to_db
-        )
-
-        return new_response
+            body_to_log = "[Response body not available]"
+
+        request_headers = Headers(scope=scope)
+        client = scope.get("client")
+        row = {
+            "timestamp": datetime.now(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status_code": status_code,
+            "client_ip": client[0] if client else None,
+            "request_headers": json.dumps(dict(request_headers)),
+            "request_body": describe_request_body(b"".join(request_chunks), request_bytes),
+            "response_body": body_to_log,
+            "processing_time": duration_ms,
+            "user_agent": request_headers.get("user-agent"),
+            "username": self.username,
+            "hostname": self.hostname,
+            "application_id": self.application_id,
+        }
+        if request_log_write_blocks():
+            await run_in_threadpool(write_request_log, row)
+        else:
+            write_request_log(row)  # Only queues the row, or drops it when the queue is full
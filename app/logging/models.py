@@ -1,7 +1,7 @@
 """Database models for the logging module."""
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Float
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index
 from app.core.database import Base
 
 
@@ -25,3 +25,10 @@ class Log(Base):
     username = Column(String, nullable=True)
     hostname = Column(String, nullable=True)
     application_id = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Newest-first browsing over a time window, with id as the keyset tie-breaker
+        Index("idx_log_timestamp_id", "timestamp", "id"),
+        # Status range filters (errors only, 5xx only) within a time window
+        Index("idx_log_status_timestamp", "status_code", "timestamp"),
+    )
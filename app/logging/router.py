@@ -1,11 +1,13 @@
 """API router for the logging module with endpoints for retrieving and analyzing logs."""
 
-from fastapi import APIRouter, Depends, Query, Response
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
 from typing import List, Optional, Dict, Any
+from datetime import datetime
 from app.core.dependencies import SessionDep
 from app.logging.schemas import LogRead
-from app.logging.service import LogService
+from app.logging.service import LogService, encode_log_cursor
 from app.logging.dao import LogDAO
+from app.logging.writer import LOG_WRITER_ENABLED, get_request_log_writer
 
 router = APIRouter(
     prefix="/logs",
@@ -27,9 +29,14 @@ async def get_logs(
     status_min: Optional[int] = None,
     status_max: Optional[int] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces offset"),
+    count: str = Query("exact", description="Total count mode: exact, estimated or none"),
     log_service: LogService = Depends(get_log_service),
 ) -> List[LogRead]:
-    """Get logs with pagination and filtering"""
+    """Get logs with pagination and filtering.
+
+    Pages follow either offset or the keyset cursor returned in X-Next-Cursor, which stays fast on deep pages.
+    """
     logs = await log_service.get_logs(
         limit=limit,
         offset=offset,
@@ -38,15 +45,20 @@ async def get_logs(
         status_min=status_min,
         status_max=status_max,
         search=search,
+        cursor=cursor,
     )
 
     # Get total count for pagination
-    total_count = await log_service.get_logs_count(
-        hours=hours, status_min=status_min, status_max=status_max, search=search
+    total_count, exact = await log_service.get_logs_count(
+        hours=hours, status_min=status_min, status_max=status_max, search=search, count_mode=count
     )
 
     # Set total count in header
-    response.headers["X-Total-Count"] = str(total_count)
+    if total_count is not None:
+        response.headers["X-Total-Count"] = str(total_count)
+        response.headers["X-Total-Count-Exact"] = "true" if exact else "false"
+    if len(logs) == limit and not log_id:
+        response.headers["X-Next-Cursor"] = encode_log_cursor(logs[-1])
 
     return logs
 
@@ -67,3 +79,37 @@ async def get_recent_activities(
 ) -> Dict[str, Any]:
     """Get recent activities for the dashboard"""
     return await log_service.get_recent_activities(days=days)
+
+
+@router.get("/writer/stats")
+def get_log_writer_stats():
+    """Get request log writer statistics (queue depth, written and dropped rows) for monitoring."""
+    try:
+        return {
+            "success": True,
+            "data": get_request_log_writer().get_stats() if LOG_WRITER_ENABLED else {"enabled": False},
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving log writer stats: {str(e)}")
+
+
+@router.post("/cleanup")
+def cleanup_old_logs(
+    cleanup_params: Dict[str, int] = Body(..., example={"days_to_keep": 30}),
+    log_service: LogService = Depends(get_log_service),
+):
+    """Remove request logs older than the retention period (admin function)."""
+    try:
+        days_to_keep = cleanup_params.get("days_to_keep", 30)
+        result = log_service.cleanup_old_logs(days_to_keep)
+
+        return {
+            "success": True,
+            "data": result,
+            "message": f"Cleaned up request logs older than {days_to_keep} days"
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error cleaning up request logs: {str(e)}")
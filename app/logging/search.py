@@ -0,0 +1,190 @@
+"""Full-text search index over the request log: SQLite FTS5 locally, a full-text catalog on SQL Server."""
+
+from sqlalchemy import column, literal_column, or_, select, table, text
+from sqlalchemy.engine import Engine
+from typing import Dict, List, Optional, Tuple
+import os
+import sqlite3
+import threading
+
+from app.logging.models import Log
+
+
+LOG_SEARCH_INDEX_ENABLED = os.getenv("LOG_SEARCH_INDEX_ENABLED", "true").lower() == "true"
+# Bodies make the index several times larger - only index them when they need to be searchable
+LOG_SEARCH_INCLUDE_BODIES = os.getenv("LOG_SEARCH_INCLUDE_BODIES", "false").lower() == "true"
+
+LOG_SEARCH_TABLE = "log_fts"
+LOG_SEARCH_CATALOG = "log_search_catalog"
+# The columns the log list search has always matched, plus the bodies when enabled
+LOG_SEARCH_COLUMNS = ["path", "method", "client_ip", "username", "hostname", "status_code", "application_id"]
+LOG_SEARCH_BODY_COLUMNS = ["request_body", "response_body"]
+# The trigram tokenizer can only match terms of at least this many characters
+MIN_INDEXED_TERM_LENGTH = 3
+
+# Whether the index exists, by engine URL - checked once per process
+_index_ready: Dict[str, bool] = {}
+_index_ready_lock = threading.Lock()
+
+
+def log_search_columns() -> List[str]:
+    return LOG_SEARCH_COLUMNS + (LOG_SEARCH_BODY_COLUMNS if LOG_SEARCH_INCLUDE_BODIES else [])
+
+
+def ensure_log_search_index(engine: Engine) -> bool:
+    """Create the log search index if it is missing, and fill it from the existing rows.
+
+    Safe to call on every start. Returns whether the index is available.
+    """
+    if not LOG_SEARCH_INDEX_ENABLED:
+        return False
+    try:
+        if engine.dialect.name == "sqlite":
+            ready = _ensure_sqlite_index(engine)
+        elif engine.dialect.name == "mssql":
+            ready = _ensure_mssql_index(engine)
+        else:
+            ready = False
+    except Exception as e:
+        print(f"Warning: Could not create the request log search index, searching without it: {e}")
+        ready = False
+    with _index_ready_lock:
+        _index_ready[str(engine.url)] = ready
+    return ready
+
+
+def log_search_condition(engine: Engine, search: str):
+    """WHERE clause matching logs that contain search, or None when the index can't answer it."""
+    if not LOG_SEARCH_INDEX_ENABLED or not _is_index_ready(engine):
+        return None
+    if engine.dialect.name == "sqlite":
+        if len(search) < MIN_INDEXED_TERM_LENGTH:
+            return None
+        fts = table(LOG_SEARCH_TABLE, column("rowid"))
+        # A quoted trigram phrase matches the term anywhere in a column, case-insensitively like ILIKE
+        phrase = '"' + search.replace('"', '""') + '"'
+        return Log.id.in_(select(fts.c.rowid).where(literal_column(LOG_SEARCH_TABLE).op("MATCH")(phrase)))
+    if engine.dialect.name == "mssql":
+        return _mssql_search_condition(search)
+    return None
+
+
+def _is_index_ready(engine: Engine) -> bool:
+    key = str(engine.url)
+    if key not in _index_ready:
+        with _index_ready_lock:
+            if key not in _index_ready:
+                _index_ready[key] = _index_exists(engine)
+    return _index_ready[key]
+
+
+def _index_exists(engine: Engine) -> bool:
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == "sqlite":
+                return conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {"name": LOG_SEARCH_TABLE},
+                ).first() is not None
+            if engine.dialect.name == "mssql":
+                return conn.execute(
+                    text("SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('log')")
+                ).first() is not None
+    except Exception as e:
+        print(f"Warning: Could not check for the request log search index: {e}")
+    return False
+
+
+# ===== SQLITE (FTS5) =====
+
+
+def _ensure_sqlite_index(engine: Engine) -> bool:
+    """External-content FTS5 table over log, kept in step by triggers."""
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        print(f"Warning: SQLite {sqlite3.sqlite_version} has no trigram tokenizer, log search stays unindexed")
+        return False
+
+    columns = log_search_columns()
+    with engine.begin() as conn:
+        existing = [row[1] for row in conn.execute(text(f"PRAGMA table_info({LOG_SEARCH_TABLE})"))]
+        triggers = {row[0] for row in conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'log'")
+        )}
+        rebuild = existing != columns or not {"log_fts_ai", "log_fts_ad", "log_fts_au"} <= triggers
+        if not rebuild:
+            return True
+
+        if existing and existing != columns:
+            # LOG_SEARCH_INCLUDE_BODIES changed - the index is rebuilt with the new columns
+            conn.execute(text(f"DROP TABLE {LOG_SEARCH_TABLE}"))
+        for trigger in ("log_fts_ai", "log_fts_ad", "log_fts_au"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {LOG_SEARCH_TABLE} USING fts5("
+            f"{', '.join(columns)}, content='log', content_rowid='id', tokenize='trigram')"
+        ))
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{name}" for name in columns)
+        old_values = ", ".join(f"old.{name}" for name in columns)
+        delete_old = (
+            f"INSERT INTO {LOG_SEARCH_TABLE}({LOG_SEARCH_TABLE}, rowid, {column_list}) "
+            f"VALUES ('delete', old.id, {old_values});"
+        )
+        insert_new = f"INSERT INTO {LOG_SEARCH_TABLE}(rowid, {column_list}) VALUES (new.id, {new_values});"
+        conn.execute(text(f"CREATE TRIGGER log_fts_ai AFTER INSERT ON log BEGIN {insert_new} END"))
+        conn.execute(text(f"CREATE TRIGGER log_fts_ad AFTER DELETE ON log BEGIN {delete_old} END"))
+        conn.execute(text(f"CREATE TRIGGER log_fts_au AFTER UPDATE ON log BEGIN {delete_old} {insert_new} END"))
+
+        # Index the rows written before the triggers existed
+        print("Building the request log search index...")
+        conn.execute(text(f"INSERT INTO {LOG_SEARCH_TABLE}({LOG_SEARCH_TABLE}) VALUES ('rebuild')"))
+    return True
+
+
+# ===== SQL SERVER (FULL-TEXT CATALOG) =====
+
+
+def _ensure_mssql_index(engine: Engine) -> bool:
+    """Full-text index on the log table's text columns, populated by SQL Server change tracking."""
+    # Full-text DDL can't run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.execute(text("SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('log')")).first():
+            return True
+        conn.execute(text(
+            f"IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = '{LOG_SEARCH_CATALOG}') "
+            f"CREATE FULLTEXT CATALOG {LOG_SEARCH_CATALOG}"
+        ))
+        key_index = conn.execute(text(
+            "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID('log') AND is_primary_key = 1"
+        )).scalar()
+        conn.execute(text(
+            f"CREATE FULLTEXT INDEX ON log ({', '.join(_mssql_text_columns())}) "
+            f"KEY INDEX [{key_index}] ON {LOG_SEARCH_CATALOG} WITH CHANGE_TRACKING AUTO"
+        ))
+    return True
+
+
+def _mssql_text_columns() -> List[str]:
+    # Only character columns can be full-text indexed - status codes are matched by range instead
+    return [name for name in log_search_columns() if name != "status_code"]
+
+
+def _mssql_search_condition(search: str):
+    # Full-text matches whole words and word prefixes, e.g. "rep" finds /api/reports/run
+    term = '"' + search.replace('"', '""') + '*"'
+    condition = text(f"CONTAINS(({', '.join(_mssql_text_columns())}), :log_search_term)").bindparams(
+        log_search_term=term
+    )
+    status_range = _status_code_prefix_range(search)
+    if status_range:
+        condition = or_(condition, Log.status_code.between(*status_range))
+    return condition
+
+
+def _status_code_prefix_range(search: str) -> Optional[Tuple[int, int]]:
+    """Status codes starting with search, e.g. "4" -> 400-499, "40" -> 400-409"""
+    if not search.isdigit() or len(search) > 3:
+        return None
+    scale = 10 ** (3 - len(search))
+    return int(search) * scale, int(search) * scale + scale - 1
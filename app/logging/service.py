@@ -1,11 +1,32 @@
 """Service layer for the logging module handling business logic for logs."""
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import HTTPException
 from app.logging.models import Log
 from app.logging.schemas import LogRead
 from app.logging.dao import LogDAO
 from datetime import datetime
+import base64
+import os
+
+# "exact" counts every matching row, "estimated" stops counting at a cap, "none" skips counting
+LOG_COUNT_MODES = ("exact", "estimated", "none")
+# Estimated counts stop at this many rows and are then reported as not exact (X-Total-Count-Exact: false)
+LOG_COUNT_ESTIMATE_CAP = int(os.getenv("LOG_COUNT_ESTIMATE_CAP", "10000"))
+
+
+def encode_log_cursor(log: LogRead) -> str:
+    """Opaque cursor pointing after a log row: its timestamp and id."""
+    return base64.urlsafe_b64encode(f"{log.timestamp.isoformat()}|{log.id}".encode()).decode()
+
+
+def decode_log_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Timestamp and id from a cursor made by encode_log_cursor."""
+    try:
+        timestamp, _, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
 
 
 class LogService:
@@ -23,8 +44,10 @@ class LogService:
         status_min: Optional[int] = None,
         status_max: Optional[int] = None,
         search: Optional[str] = None,
+        cursor: Optional[str] = None,
     ) -> List[LogRead]:
-        """Get logs with pagination and filtering"""
+        """Get logs with pagination and filtering; a cursor from encode_log_cursor replaces offset"""
+        keyset = decode_log_cursor(cursor) if cursor else None
         try:
             logs = await self.dao.get_logs(
                 limit=limit,
@@ -34,6 +57,7 @@ class LogService:
                 status_min=status_min,
                 status_max=status_max,
                 search=search,
+                cursor=keyset,
             )
             # Convert SQLAlchemy models to Pydantic models directly using Pydantic's from_orm
             return [LogRead.model_validate(log) for log in logs]
@@ -46,12 +70,23 @@ class LogService:
         status_min: Optional[int] = None,
         status_max: Optional[int] = None,
         search: Optional[str] = None,
-    ) -> int:
-        """Get total count of logs matching the filters"""
+        count_mode: str = "exact",
+    ) -> Tuple[Optional[int], bool]:
+        """Get the count of logs matching the filters and whether it is exact (None when not counted)"""
+        if count_mode not in LOG_COUNT_MODES:
+            raise HTTPException(status_code=400, detail=f"count must be one of {', '.join(LOG_COUNT_MODES)}")
+        if count_mode == "none":
+            return None, False
         try:
-            return await self.dao.get_logs_count(
+            if count_mode == "estimated":
+                return await self.dao.estimate_logs_count(
+                    hours=hours, status_min=status_min, status_max=status_max, search=search,
+                    cap=LOG_COUNT_ESTIMATE_CAP
+                )
+            count = await self.dao.get_logs_count(
                 hours=hours, status_min=status_min, status_max=status_max, search=search
             )
+            return count, True
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error counting logs: {str(e)}") from e
 
@@ -101,6 +136,24 @@ class LogService:
                 status_code=500, detail=f"Error generating recent activities: {str(e)}"
             ) from e
 
+    def cleanup_old_logs(self, days_to_keep: int = 30) -> Dict[str, Any]:
+        """Remove old request logs with validation."""
+        if days_to_keep < 1:
+            raise ValueError("Cannot retain request logs for less than 1 day")
+
+        if days_to_keep > 3650:  # 10 years
+            raise ValueError("Retention period cannot exceed 10 years")
+
+        result = self.dao.cleanup_old_logs(days_to_keep)
+
+        return {
+            "deleted_count": result.deleted_count,
+            "truncated_partitions": result.truncated_partitions,
+            "delete_batches": result.delete_batches,
+            "retention_days": days_to_keep,
+            "cleanup_date": datetime.now().isoformat(),
+        }
+
     def _format_log(self, log: Log) -> Dict[str, Any]:
         """Format a log object for API response"""
         # Convert directly from SQLAlchemy model to dictionary using Pydantic
@@ -0,0 +1,188 @@
+"""Batched, non-blocking writer for request log rows."""
+
+from sqlalchemy import insert
+from typing import Dict, Any, List, Optional
+import atexit
+import os
+import queue
+import threading
+import time
+
+from app.core.database import SessionLocal
+from app.logging.models import Log
+
+
+LOG_WRITER_ENABLED = os.getenv("LOG_WRITER_ENABLED", "true").lower() == "true"
+LOG_WRITER_QUEUE_SIZE = int(os.getenv("LOG_WRITER_QUEUE_SIZE", "10000"))
+LOG_WRITER_BATCH_SIZE = int(os.getenv("LOG_WRITER_BATCH_SIZE", "500"))
+LOG_WRITER_FLUSH_INTERVAL_SECONDS = float(os.getenv("LOG_WRITER_FLUSH_INTERVAL_SECONDS", "1.0"))
+# What to do with a row when the queue is full: "drop" it, or "block" the caller for up to the timeout
+LOG_WRITER_FULL_POLICY = os.getenv("LOG_WRITER_FULL_POLICY", "drop").lower()
+LOG_WRITER_BLOCK_TIMEOUT_SECONDS = float(os.getenv("LOG_WRITER_BLOCK_TIMEOUT_SECONDS", "1.0"))
+LOG_WRITER_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("LOG_WRITER_SHUTDOWN_TIMEOUT_SECONDS", "10.0"))
+
+LOG_WRITER_FULL_POLICIES = ("drop", "block")
+
+# Global request log writer singleton
+_request_log_writer = None
+_request_log_writer_lock = threading.Lock()
+
+
+class RequestLogWriter:
+    """Bounded queue of log rows, written by one background thread with multi-row INSERTs.
+
+    Callers only enqueue a dict of Log column values, so a request never waits on the database
+    (or, on SQLite, on the single writer lock). The thread writes a batch whenever it is full
+    or the flush interval has passed, and drains the queue when closed.
+    """
+
+    def __init__(self, queue_size: int = LOG_WRITER_QUEUE_SIZE, batch_size: int = LOG_WRITER_BATCH_SIZE,
+                 flush_interval: float = LOG_WRITER_FLUSH_INTERVAL_SECONDS,
+                 full_policy: str = LOG_WRITER_FULL_POLICY,
+                 block_timeout: float = LOG_WRITER_BLOCK_TIMEOUT_SECONDS):
+        if full_policy not in LOG_WRITER_FULL_POLICIES:
+            print(f"Warning: Unknown LOG_WRITER_FULL_POLICY '{full_policy}', dropping rows when the queue is full")
+            full_policy = "drop"
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=queue_size)
+        self._batch_size = max(batch_size, 1)
+        self._flush_interval = flush_interval
+        self._full_policy = full_policy
+        self._block_timeout = block_timeout
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._batches = 0
+        self._last_flush_time: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: Dict[str, Any]) -> bool:
+        """Queue a log row. Returns False when it was dropped because the queue is full or closed."""
+        if self._stop.is_set():
+            self._count("_dropped")
+            return False
+        try:
+            if self._full_policy == "block":
+                self._queue.put(row, timeout=self._block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._count("_dropped")
+            return False
+        self._count("_enqueued")
+        return True
+
+    @property
+    def full_policy(self) -> str:
+        return self._full_policy
+
+    def close(self, timeout: float = LOG_WRITER_SHUTDOWN_TIMEOUT_SECONDS) -> None:
+        """Stop accepting rows and wait for the queued ones to be written."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Warning: Request log writer did not drain within {timeout}s, "
+                  f"{self._queue.qsize()} rows not written")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get request log writer statistics."""
+        with self._stats_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "batch_size": self._batch_size,
+                "flush_interval_seconds": self._flush_interval,
+                "full_policy": self._full_policy,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "dropped": self._dropped,
+                "failed": self._failed,
+                "batches": self._batches,
+                "last_flush_time": self._last_flush_time,
+                "running": self._thread.is_alive(),
+            }
+
+    def _run(self) -> None:
+        """Collect rows until the batch is full or the flush interval passes, then write them."""
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self._flush_interval
+        while True:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0.0)))
+            except queue.Empty:
+                pass
+
+            stopping = self._stop.is_set()
+            if len(batch) >= self._batch_size or time.monotonic() >= deadline or stopping:
+                if stopping:
+                    # Drain everything that was queued before close
+                    while len(batch) < self._batch_size:
+                        try:
+                            batch.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+                if batch:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self._flush_interval
+                if stopping and self._queue.empty():
+                    return
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert a batch with one executemany; a failed batch is counted and dropped."""
+        try:
+            with SessionLocal() as session:
+                session.execute(insert(Log), rows)
+                session.commit()
+            self._count("_written", len(rows))
+        except Exception as e:
+            print(f"Warning: Could not write {len(rows)} request log rows: {e}")
+            self._count("_failed", len(rows))
+        with self._stats_lock:
+            self._batches += 1
+            self._last_flush_time = time.time()
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+
+def get_request_log_writer() -> RequestLogWriter:
+    """Get the singleton request log writer, starting its thread on first use."""
+    global _request_log_writer
+    if _request_log_writer is None:
+        with _request_log_writer_lock:
+            if _request_log_writer is None:
+                _request_log_writer = RequestLogWriter()
+                # Register cleanup on exit
+                atexit.register(_request_log_writer.close)
+    return _request_log_writer
+
+
+def write_request_log(row: Dict[str, Any]) -> None:
+    """Record one request log row - queued for the writer thread, or inserted now when it is disabled."""
+    if LOG_WRITER_ENABLED:
+        get_request_log_writer().submit(row)
+        return
+    with SessionLocal() as session:
+        session.execute(insert(Log), [row])
+        session.commit()
+
+
+def request_log_write_blocks() -> bool:
+    """Whether write_request_log can wait - on the database, or on a full queue under the "block" policy.
+
+    Callers on the event loop run it on the threadpool when it can.
+    """
+    return not LOG_WRITER_ENABLED or get_request_log_writer().full_policy == "block"
+
+
+def close_request_log_writer() -> None:
+    """Drain and stop the request log writer, if it was started (application shutdown)."""
+    if _request_log_writer is not None:
+        _request_log_writer.close()
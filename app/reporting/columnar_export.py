@@ -0,0 +1,185 @@
+# app/reporting/columnar_export.py
+"""Arrow IPC and Parquet encoding of streamed report rows."""
+
+from decimal import Decimal
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+from sqlalchemy import Integer, Float, Numeric, String, Date, DateTime, Boolean
+
+from app.calculations.models import UserCalculation, AggregationFunction
+from app.datawarehouse.models import Deal, Tranche, TrancheBal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional - only the columnar export formats need it
+    pa = None
+    pq = None
+
+
+COLUMNAR_FORMATS = ("arrow", "parquet")
+COLUMNAR_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+COLUMNAR_FILE_EXTENSIONS = {"arrow": "arrows", "parquet": "parquet"}
+
+# Report key columns, in the order the merged rows carry them
+KEY_COLUMNS = ("deal_number", "tranche_id", "cycle_code")
+
+_WAREHOUSE_TABLES = {model.__tablename__: model.__table__ for model in (Deal, Tranche, TrancheBal)}
+
+# Report columns are (name, arrow type); None means the type is taken from the first batch
+ReportColumns = List[Tuple[str, Optional["pa.DataType"]]]
+
+
+def columnar_export_available() -> bool:
+    """Whether pyarrow is installed."""
+    return pa is not None
+
+
+def arrow_type_for_sql_type(sql_type) -> Optional["pa.DataType"]:
+    """Arrow type for a warehouse column type. Numeric(p, s) stays an exact decimal128(p, s)."""
+    if isinstance(sql_type, Float):
+        return pa.float64()
+    if isinstance(sql_type, Numeric):
+        return pa.decimal128(sql_type.precision or 38, sql_type.scale or 0)
+    if isinstance(sql_type, Integer):
+        return pa.int64()
+    if isinstance(sql_type, Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(sql_type, Date):
+        return pa.date32()
+    if isinstance(sql_type, String):
+        return pa.string()
+    return None
+
+
+def arrow_type_for_static_field(field_path: str) -> Optional["pa.DataType"]:
+    """Arrow type of a static field such as tranchebal.tr_end_bal_amt."""
+    table_name, _, column_name = field_path.partition(".")
+    table = _WAREHOUSE_TABLES.get(table_name)
+    if table is None or column_name not in table.c:
+        return None
+    return arrow_type_for_sql_type(table.c[column_name].type)
+
+
+def arrow_type_for_user_calculation(calc: UserCalculation) -> Optional["pa.DataType"]:
+    """Arrow type of a user calculation's aggregate, following the SQL Server result types."""
+    if calc.aggregation_function == AggregationFunction.COUNT:
+        return pa.int64()
+    if calc.aggregation_function in (AggregationFunction.AVG, AggregationFunction.WEIGHTED_AVG):
+        return pa.float64()
+
+    source_type = arrow_type_for_static_field(f"{calc.source_model.value.lower()}.{calc.source_field}")
+    if (calc.aggregation_function == AggregationFunction.SUM and source_type is not None
+            and pa.types.is_decimal(source_type)):
+        # SUM of decimal(p, s) is decimal(38, s)
+        return pa.decimal128(38, source_type.scale)
+    return source_type
+
+
+def encode_arrow_stream(batches: Iterator[List[Dict[str, Any]]], columns: ReportColumns) -> Iterator[bytes]:
+    """Encode row batches as an Arrow IPC stream, one record batch per row batch."""
+    yield from _encode_columnar(batches, columns, lambda sink, schema: pa.ipc.new_stream(sink, schema))
+
+
+def encode_parquet(batches: Iterator[List[Dict[str, Any]]], columns: ReportColumns) -> Iterator[bytes]:
+    """Encode row batches as a Parquet file, one row group per row batch."""
+    yield from _encode_columnar(batches, columns, lambda sink, schema: pq.ParquetWriter(sink, schema))
+
+
+def _encode_columnar(batches: Iterator[List[Dict[str, Any]]], columns: ReportColumns, open_writer) -> Iterator[bytes]:
+    """Convert each row batch to a record batch and hand back whatever the writer produced for it."""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Arrow and Parquet exports")
+
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    for batch in batches:
+        if writer is None:
+            schema = _build_schema(batch, columns)
+            writer = open_writer(sink, schema)
+        writer.write_batch(_record_batch(batch, schema))
+        yield sink.drain()
+
+    if writer is None:
+        # No rows - still a valid (empty) stream or file
+        schema = _build_schema([], columns)
+        writer = open_writer(sink, schema)
+    writer.close()
+    yield sink.drain()
+
+
+def _build_schema(first_batch: List[Dict[str, Any]], columns: ReportColumns) -> "pa.Schema":
+    """Key columns present in the merged rows, then every report column with its declared or inferred type."""
+    first_row = first_batch[0] if first_batch else {"deal_number": None, "cycle_code": None}
+    fields = [
+        pa.field(name, pa.string() if name == "tranche_id" else pa.int64())
+        for name in KEY_COLUMNS if name in first_row
+    ]
+    for name, arrow_type in columns:
+        if arrow_type is None:
+            inferred = pa.array([row.get(name) for row in first_batch]).type if first_batch else pa.null()
+            # System calculations with no values in the first batch are assumed numeric
+            arrow_type = pa.float64() if pa.types.is_null(inferred) else inferred
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def _record_batch(batch: List[Dict[str, Any]], schema: "pa.Schema") -> "pa.RecordBatch":
+    """Column-wise conversion of merged rows; calculations missing from a row become nulls."""
+    arrays = []
+    for arrow_field in schema:
+        values = [row.get(arrow_field.name) for row in batch]
+        if pa.types.is_decimal(arrow_field.type):
+            values = _to_decimals(values, arrow_field.type.scale)
+        arrays.append(pa.array(values, type=arrow_field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _to_decimals(values: List[Any], scale: int) -> List[Optional[Decimal]]:
+    """Decimal values at the column scale. Drivers without decimal support (SQLite) return floats."""
+    quantum = Decimal(1).scaleb(-scale)
+    return [
+        None if value is None else (value if isinstance(value, Decimal) else Decimal(repr(value))).quantize(quantum)
+        for value in values
+    ]
+
+
+class _ChunkSink:
+    """Write-only file object whose written bytes are drained after every batch.
+
+    tell() keeps counting across drains, so Parquet footer offsets stay correct.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
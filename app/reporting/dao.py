@@ -1,8 +1,8 @@
 """Simplified Data Access Objects for the reporting module."""
 
 from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import select
-from typing import List, Optional
+from sqlalchemy import select, update
+from typing import Any, Dict, List, Optional
 from app.reporting.models import Report, ReportDeal, ReportTranche, ReportCalculation
 
 
@@ -52,6 +52,19 @@ class ReportDAO:
         self.db.refresh(report)
         return report
 
+    def save_execution_plan(self, report_id: int, plan: Dict[str, Any], plan_version: int) -> bool:
+        """Store a compiled execution plan unless the report's plan was cleared since plan_version was read."""
+        stmt = (
+            update(Report)
+            .where(Report.id == report_id, Report.execution_plan_version == plan_version)
+            # Keep updated_date - storing a plan doesn't change the report
+            .values(execution_plan=plan, updated_date=Report.updated_date)
+            .execution_options(synchronize_session=False)
+        )
+        saved = self.db.execute(stmt).rowcount > 0
+        self.db.commit()
+        return saved
+
     async def delete(self, report_id: int) -> bool:
         """Soft delete a report by ID."""
         report = await self.get_by_id(report_id)
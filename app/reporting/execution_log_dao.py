@@ -2,10 +2,14 @@
 """Data Access Object for Report Execution Logs."""
 
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_
-from typing import List, Optional, Dict, Any
+from sqlalchemy import desc, and_, case, func, cast, select, Date
+from typing import List, Optional, Dict, Any, Sequence
 from datetime import datetime, timedelta
-from app.reporting.models import ReportExecutionLog
+from app.reporting.models import ReportExecutionLog, ReportExecutionTiming
+from app.core.retention import RetentionResult, ensure_future_partitions, purge_before
+
+# Latency percentiles reported by the analytics queries
+EXECUTION_TIME_PERCENTILES = (50, 95, 99)
 
 
 class ReportExecutionLogDAO:
@@ -75,94 +79,210 @@ class ReportExecutionLogDAO:
 
     def get_execution_stats_by_report(self, report_id: int) -> Dict[str, Any]:
         """Get execution statistics for a specific report."""
-        logs = self.db.query(ReportExecutionLog).filter(
-            ReportExecutionLog.report_id == report_id
-        ).all()
-
-        if not logs:
-            return {
-                "total_executions": 0,
-                "successful_executions": 0,
-                "failed_executions": 0,
-                "success_rate": 0.0,
-                "average_execution_time_ms": 0.0,
-                "last_execution_date": None,
-                "last_successful_execution": None
-            }
+        return self.get_execution_stats_by_reports([report_id])[report_id]
 
-        successful_logs = [log for log in logs if log.success]
-        failed_logs = [log for log in logs if not log.success]
-        
-        # Calculate average execution time for successful runs
-        execution_times = [
-            log.execution_time_ms for log in successful_logs 
-            if log.execution_time_ms is not None
-        ]
-        avg_execution_time = sum(execution_times) / len(execution_times) if execution_times else 0.0
+    def get_execution_stats_by_reports(self, report_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get execution statistics for many reports with one grouped query.
+
+        Every requested report is in the result - reports that never ran get zeroed statistics.
+        """
+        successful = ReportExecutionLog.success == True
+        rows = (
+            self.db.query(
+                ReportExecutionLog.report_id,
+                func.count(ReportExecutionLog.id),
+                func.sum(case((successful, 1), else_=0)),
+                # Average over successful runs; AVG skips the NULLs of failed ones
+                func.avg(case((successful, ReportExecutionLog.execution_time_ms))),
+                func.max(ReportExecutionLog.executed_at),
+                func.max(case((successful, ReportExecutionLog.executed_at))),
+            )
+            .filter(ReportExecutionLog.report_id.in_(report_ids))
+            .group_by(ReportExecutionLog.report_id)
+            .all()
+        ) if report_ids else []
 
-        # Get most recent execution dates
-        sorted_logs = sorted(logs, key=lambda x: x.executed_at, reverse=True)
-        successful_sorted = sorted(successful_logs, key=lambda x: x.executed_at, reverse=True)
+        stats = {report_id: self._execution_stats(0, 0, None, None, None) for report_id in report_ids}
+        for report_id, total, successful_count, average_time, last_execution, last_success in rows:
+            stats[report_id] = self._execution_stats(total, successful_count or 0, average_time,
+                                                     last_execution, last_success)
+        return stats
 
+    def _execution_stats(self, total: int, successful_count: int, average_time: Optional[float],
+                         last_execution: Optional[datetime], last_success: Optional[datetime]) -> Dict[str, Any]:
+        """Execution statistics in the shape the service and API expect."""
         return {
-            "total_executions": len(logs),
-            "successful_executions": len(successful_logs),
-            "failed_executions": len(failed_logs),
-            "success_rate": (len(successful_logs) / len(logs) * 100) if logs else 0.0,
-            "average_execution_time_ms": avg_execution_time,
-            "last_execution_date": sorted_logs[0].executed_at if sorted_logs else None,
-            "last_successful_execution": successful_sorted[0].executed_at if successful_sorted else None
+            "total_executions": total,
+            "successful_executions": successful_count,
+            "failed_executions": total - successful_count,
+            "success_rate": (successful_count / total * 100) if total else 0.0,
+            "average_execution_time_ms": average_time or 0.0,
+            "last_execution_date": last_execution,
+            "last_successful_execution": last_success
         }
 
     def get_performance_metrics(self, days_back: int = 30) -> Dict[str, Any]:
-        """Get performance metrics for the last N days."""
+        """Get performance metrics for the last N days, aggregated in SQL."""
         cutoff_date = datetime.now() - timedelta(days=days_back)
-        
-        recent_logs = self.db.query(ReportExecutionLog).filter(
-            ReportExecutionLog.executed_at >= cutoff_date
-        ).all()
-
-        if not recent_logs:
-            return {
-                "period_days": days_back,
-                "total_executions": 0,
-                "successful_executions": 0,
-                "failed_executions": 0,
-                "average_execution_time_ms": 0.0,
-                "min_execution_time_ms": 0.0,
-                "max_execution_time_ms": 0.0,
-                "reports_executed": 0
-            }
+        in_period = ReportExecutionLog.executed_at >= cutoff_date
+        successful = ReportExecutionLog.success == True
+        # Timing metrics cover successful runs only
+        successful_time = case((successful, ReportExecutionLog.execution_time_ms))
 
-        successful_logs = [log for log in recent_logs if log.success]
-        execution_times = [
-            log.execution_time_ms for log in successful_logs 
-            if log.execution_time_ms is not None
-        ]
-        
-        unique_reports = set(log.report_id for log in recent_logs)
+        total, successful_count, average_time, min_time, max_time, reports_executed = self.db.query(
+            func.count(ReportExecutionLog.id),
+            func.sum(case((successful, 1), else_=0)),
+            func.avg(successful_time),
+            func.min(successful_time),
+            func.max(successful_time),
+            func.count(ReportExecutionLog.report_id.distinct()),
+        ).filter(in_period).one()
 
-        return {
+        metrics = {
             "period_days": days_back,
-            "total_executions": len(recent_logs),
-            "successful_executions": len(successful_logs),
-            "failed_executions": len(recent_logs) - len(successful_logs),
-            "average_execution_time_ms": sum(execution_times) / len(execution_times) if execution_times else 0.0,
-            "min_execution_time_ms": min(execution_times) if execution_times else 0.0,
-            "max_execution_time_ms": max(execution_times) if execution_times else 0.0,
-            "reports_executed": len(unique_reports)
+            "total_executions": total,
+            "successful_executions": successful_count or 0,
+            "failed_executions": total - (successful_count or 0),
+            "average_execution_time_ms": average_time or 0.0,
+            "min_execution_time_ms": min_time or 0.0,
+            "max_execution_time_ms": max_time or 0.0,
+            "reports_executed": reports_executed
         }
+        percentiles = self._execution_time_percentiles([in_period, successful]).get(None, {})
+        for percentile in EXECUTION_TIME_PERCENTILES:
+            metrics[f"p{percentile}_execution_time_ms"] = percentiles.get(f"p{percentile}") or 0.0
+        return metrics
+
+    def _execution_time_percentiles(self, conditions: Sequence, group_by=None,
+                                       value=None) -> Dict[Any, Dict[str, Optional[float]]]:
+        """Nearest-rank percentiles of execution times matching conditions, computed in SQL.
+
+        Rows are ranked with ROW_NUMBER() per group (SQLite and SQL Server both support it), so only
+        one row per group comes back. Keyed by group value, or None without group_by.
+        """
+        value = value if value is not None else ReportExecutionLog.execution_time_ms
+        partition = [group_by] if group_by is not None else []
+        key_columns = [group_by.label("group_key")] if group_by is not None else []
+        ranked = (
+            select(
+                *key_columns,
+                value.label("value"),
+                func.row_number().over(partition_by=partition, order_by=value).label("position"),
+                func.count().over(partition_by=partition).label("group_size"),
+            )
+            .where(value.isnot(None), *conditions)
+            .subquery()
+        )
+
+        percentile_columns = [
+            # Nearest rank: the ceil(p% * n)-th smallest value, in integer arithmetic
+            func.max(case((ranked.c.position == (ranked.c.group_size * percentile + 99) // 100, ranked.c.value)))
+            .label(f"p{percentile}")
+            for percentile in EXECUTION_TIME_PERCENTILES
+        ]
+        if group_by is not None:
+            stmt = select(ranked.c.group_key, *percentile_columns).group_by(ranked.c.group_key)
+        else:
+            stmt = select(*percentile_columns).having(func.count() > 0)
+
+        percentiles = {}
+        for row in self.db.execute(stmt).mappings():
+            key = row["group_key"] if group_by is not None else None
+            percentiles[key] = {f"p{percentile}": row[f"p{percentile}"] for percentile in EXECUTION_TIME_PERCENTILES}
+        return percentiles
+
+    def get_report_execution_time_percentiles(self, days_back: int = 30) -> Dict[int, Dict[str, Optional[float]]]:
+        """Execution time percentiles of successful runs in the last N days, per report."""
+        cutoff_date = datetime.now() - timedelta(days=days_back)
+        return self._execution_time_percentiles(
+            [ReportExecutionLog.executed_at >= cutoff_date, ReportExecutionLog.success == True],
+            group_by=ReportExecutionLog.report_id
+        )
+
+    def get_execution_time_percentiles_for_report(self, report_id: int, since: datetime) -> Dict[str, Optional[float]]:
+        """Execution time percentiles of a report's successful runs since a date."""
+        return self._execution_time_percentiles([
+            ReportExecutionLog.report_id == report_id,
+            ReportExecutionLog.executed_at >= since,
+            ReportExecutionLog.success == True,
+        ]).get(None, {})
 
-    def cleanup_old_logs(self, days_to_keep: int = 90) -> int:
-        """Clean up execution logs older than specified days. Returns count of deleted records."""
+    def get_stage_time_percentiles(self, report_id: int, since: datetime) -> Dict[str, Dict[str, Any]]:
+        """Timing percentiles of a report's execution stages since a date.
+
+        Returns {"query": {calculation alias or compiled level: percentiles}, "merge": percentiles, ...}.
+        """
+        stages = {}
+        conditions = [ReportExecutionTiming.report_id == report_id, ReportExecutionTiming.executed_at >= since]
+        per_query = self._execution_time_percentiles(
+            conditions + [ReportExecutionTiming.stage == "query"],
+            group_by=ReportExecutionTiming.name, value=ReportExecutionTiming.duration_ms
+        )
+        if per_query:
+            stages["query"] = per_query
+        per_stage = self._execution_time_percentiles(
+            conditions + [ReportExecutionTiming.stage != "query"],
+            group_by=ReportExecutionTiming.stage, value=ReportExecutionTiming.duration_ms
+        )
+        stages.update(per_stage)
+        return stages
+
+    def get_daily_execution_stats(self, start_date: datetime, end_date: datetime,
+                                  report_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Execution counts and average time per day within a date range, oldest day first."""
+        day = self._execution_day()
+        query = self.db.query(
+            day.label("day"),
+            func.count(ReportExecutionLog.id),
+            func.sum(case((ReportExecutionLog.success == True, 1), else_=0)),
+            func.avg(ReportExecutionLog.execution_time_ms),
+        ).filter(
+            ReportExecutionLog.executed_at >= start_date,
+            ReportExecutionLog.executed_at <= end_date
+        )
+        if report_id:
+            query = query.filter(ReportExecutionLog.report_id == report_id)
+
+        return [
+            {
+                "date": day_value if isinstance(day_value, str) else day_value.isoformat(),
+                "total_executions": total,
+                "successful_executions": successful_count or 0,
+                "failed_executions": total - (successful_count or 0),
+                "average_execution_time_ms": average_time or 0.0,
+            }
+            for day_value, total, successful_count, average_time in query.group_by(day).order_by(day).all()
+        ]
+
+    def get_recent_success_flags(self, report_id: int, since: datetime, limit: int = 10) -> List[bool]:
+        """Success flags of a report's latest executions since a date, most recent first."""
+        rows = (
+            self.db.query(ReportExecutionLog.success)
+            .filter(ReportExecutionLog.report_id == report_id, ReportExecutionLog.executed_at >= since)
+            .order_by(desc(ReportExecutionLog.executed_at))
+            .limit(limit)
+            .all()
+        )
+        return [success for (success,) in rows]
+
+    def _execution_day(self):
+        """executed_at truncated to the day - SQLite stores datetimes as text, so CAST AS DATE won't do there"""
+        if self.db.get_bind().dialect.name == "sqlite":
+            return func.date(ReportExecutionLog.executed_at)
+        return cast(ReportExecutionLog.executed_at, Date)
+
+    def cleanup_old_logs(self, days_to_keep: int = 90) -> Dict[str, RetentionResult]:
+        """Clean up execution logs (and their timings) older than specified days, by table."""
         cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-        
-        deleted_count = self.db.query(ReportExecutionLog).filter(
-            ReportExecutionLog.executed_at < cutoff_date
-        ).delete()
-        
-        self.db.commit()
-        return deleted_count
+        ensure_future_partitions(self.db)
+
+        # Timings carry their log's executed_at, so they go first without a join
+        return {
+            "timings": purge_before(
+                self.db, ReportExecutionTiming.__table__, ReportExecutionTiming.executed_at, cutoff_date
+            ),
+            "logs": purge_before(self.db, ReportExecutionLog.__table__, ReportExecutionLog.executed_at, cutoff_date),
+        }
 
     def delete(self, log_id: int) -> bool:
         """Delete a specific execution log."""
@@ -4,7 +4,7 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from app.reporting.execution_log_dao import ReportExecutionLogDAO
-from app.reporting.models import ReportExecutionLog
+from app.reporting.models import ReportExecutionLog, ReportExecutionTiming
 
 
 class ReportExecutionLogService:
@@ -21,9 +21,14 @@ class ReportExecutionLogService:
         execution_time_ms: Optional[float] = None,
         row_count: Optional[int] = None,
         success: bool = True,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        cache_hit: Optional[bool] = None,
+        timings: Optional[List[Dict[str, Any]]] = None
     ) -> ReportExecutionLog:
-        """Log a report execution with all relevant metrics."""
+        """Log a report execution with all relevant metrics.
+
+        timings are the stage entries collected while executing ({stage, name, duration_ms, row_count}).
+        """
         
         # Validate inputs
         if execution_time_ms is not None and execution_time_ms < 0:
@@ -44,8 +49,20 @@ class ReportExecutionLogService:
             row_count=row_count,
             success=success,
             error_message=error_message,
+            cache_hit=cache_hit,
             executed_at=datetime.now()
         )
+        execution_log.timings = [
+            ReportExecutionTiming(
+                report_id=report_id,
+                stage=timing["stage"],
+                name=timing.get("name"),
+                duration_ms=max(timing["duration_ms"], 0.0),
+                row_count=timing.get("row_count"),
+                executed_at=execution_log.executed_at
+            )
+            for timing in timings or []
+        ]
 
         return self.execution_log_dao.create(execution_log)
 
@@ -67,6 +84,7 @@ class ReportExecutionLogService:
                 "row_count": log.row_count,
                 "success": log.success,
                 "error_message": log.error_message,
+                "cache_hit": log.cache_hit,
                 "executed_at": log.executed_at.isoformat() if log.executed_at else None
             }
             for log in logs
@@ -86,6 +104,7 @@ class ReportExecutionLogService:
                 "row_count": log.row_count,
                 "success": log.success,
                 "error_message": log.error_message,
+                "cache_hit": log.cache_hit,
                 "executed_at": log.executed_at.isoformat() if log.executed_at else None
             }
             for log in logs
@@ -95,6 +114,10 @@ class ReportExecutionLogService:
         """Get comprehensive execution statistics for a report."""
         return self.execution_log_dao.get_execution_stats_by_report(report_id)
 
+    def get_execution_stats_for_reports(self, report_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get execution statistics for many reports at once, keyed by report id."""
+        return self.execution_log_dao.get_execution_stats_by_reports(report_ids)
+
     def get_failed_executions(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get recent failed executions for troubleshooting."""
         logs = self.execution_log_dao.get_failed_executions(limit)
@@ -115,6 +138,9 @@ class ReportExecutionLogService:
     def get_performance_dashboard(self, days_back: int = 30) -> Dict[str, Any]:
         """Get performance metrics for dashboard display."""
         metrics = self.execution_log_dao.get_performance_metrics(days_back)
+        metrics["report_execution_time_percentiles_ms"] = self.execution_log_dao.get_report_execution_time_percentiles(
+            days_back
+        )
         
         # Add some calculated fields for better dashboard display
         if metrics["total_executions"] > 0:
@@ -170,6 +196,7 @@ class ReportExecutionLogService:
                 "row_count": log.row_count,
                 "success": log.success,
                 "error_message": log.error_message,
+                "cache_hit": log.cache_hit,
                 "executed_at": log.executed_at.isoformat() if log.executed_at else None
             }
             for log in logs
@@ -184,10 +211,13 @@ class ReportExecutionLogService:
         if days_to_keep > 3650:  # 10 years
             raise ValueError("Retention period cannot exceed 10 years")
 
-        deleted_count = self.execution_log_dao.cleanup_old_logs(days_to_keep)
+        results = self.execution_log_dao.cleanup_old_logs(days_to_keep)
         
         return {
-            "deleted_count": deleted_count,
+            "deleted_count": results["logs"].deleted_count,
+            "deleted_timings_count": results["timings"].deleted_count,
+            "truncated_partitions": sum(result.truncated_partitions for result in results.values()),
+            "delete_batches": sum(result.delete_batches for result in results.values()),
             "retention_days": days_to_keep,
             "cleanup_date": datetime.now().isoformat()
         }
@@ -197,54 +227,21 @@ class ReportExecutionLogService:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days_back)
         
-        logs = self.execution_log_dao.get_executions_by_date_range(start_date, end_date)
-        
-        # Group by date
-        daily_stats = {}
-        for log in logs:
-            date_key = log.executed_at.date().isoformat()
-            if date_key not in daily_stats:
-                daily_stats[date_key] = {
-                    "date": date_key,
-                    "total_executions": 0,
-                    "successful_executions": 0,
-                    "failed_executions": 0,
-                    "total_execution_time_ms": 0.0,
-                    "execution_count_with_time": 0
-                }
-            
-            daily_stats[date_key]["total_executions"] += 1
-            if log.success:
-                daily_stats[date_key]["successful_executions"] += 1
-            else:
-                daily_stats[date_key]["failed_executions"] += 1
-            
-            if log.execution_time_ms is not None:
-                daily_stats[date_key]["total_execution_time_ms"] += log.execution_time_ms
-                daily_stats[date_key]["execution_count_with_time"] += 1
+        # Grouped by date in SQL, already sorted by date
+        daily_stats = self.execution_log_dao.get_daily_execution_stats(start_date, end_date)
 
-        # Calculate averages and format for charts
-        trend_data = []
-        for stats in daily_stats.values():
-            avg_time = (
-                stats["total_execution_time_ms"] / stats["execution_count_with_time"]
-                if stats["execution_count_with_time"] > 0 else 0
-            )
-            
-            trend_data.append({
-                "date": stats["date"],
-                "total_executions": stats["total_executions"],
-                "successful_executions": stats["successful_executions"],
-                "failed_executions": stats["failed_executions"],
+        trend_data = [
+            {
+                **stats,
                 "success_rate": (
                     stats["successful_executions"] / stats["total_executions"] * 100
                     if stats["total_executions"] > 0 else 0
                 ),
-                "average_execution_time_ms": avg_time
-            })
-
-        # Sort by date
-        trend_data.sort(key=lambda x: x["date"])
+            }
+            for stats in daily_stats
+        ]
+        total_executions = sum(stats["total_executions"] for stats in daily_stats)
+        successful_executions = sum(stats["successful_executions"] for stats in daily_stats)
         
         return {
             "period_days": days_back,
@@ -253,11 +250,39 @@ class ReportExecutionLogService:
             "daily_trends": trend_data,
             "summary": {
                 "total_days_with_data": len(daily_stats),
-                "total_executions": sum(log.total_executions for log in daily_stats.values()),
+                "total_executions": total_executions,
                 "overall_success_rate": (
-                    sum(log.successful_executions for log in daily_stats.values()) /
-                    sum(log.total_executions for log in daily_stats.values()) * 100
-                    if any(log.total_executions for log in daily_stats.values()) else 0
+                    successful_executions / total_executions * 100 if total_executions else 0
                 )
             }
-        }
\ No newline at end of file
+        }
+
+    def get_report_period_analysis(self, report_id: int, days_back: int = 30) -> Dict[str, Any]:
+        """Daily execution counts, latency percentiles and recent failures of a report over the last N days."""
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days_back)
+
+        daily_stats = self.execution_log_dao.get_daily_execution_stats(start_date, end_date, report_id)
+        percentiles = self.execution_log_dao.get_execution_time_percentiles_for_report(report_id, start_date)
+        stage_percentiles = self.execution_log_dao.get_stage_time_percentiles(report_id, start_date)
+
+        return {
+            "period_days": days_back,
+            "start_date": start_date.date().isoformat(),
+            "end_date": end_date.date().isoformat(),
+            "daily_trends": [
+                {
+                    "date": stats["date"],
+                    "successful_executions": stats["successful_executions"],
+                    "failed_executions": stats["failed_executions"],
+                    "total_executions": stats["total_executions"]
+                }
+                for stats in daily_stats
+            ],
+            "total_executions_in_period": sum(stats["total_executions"] for stats in daily_stats),
+            "execution_time_percentiles_ms": percentiles,
+            # Per calculation (or compiled level) SQL time, and the merge and serialization stages
+            "calculation_time_percentiles_ms": stage_percentiles.pop("query", {}),
+            "stage_time_percentiles_ms": stage_percentiles,
+            "recent_success_flags": self.execution_log_dao.get_recent_success_flags(report_id, start_date),
+        }
@@ -0,0 +1,138 @@
+# app/reporting/execution_plan.py
+"""Compiled execution plans stored with saved reports, and the listeners that clear them."""
+
+from dataclasses import dataclass
+from sqlalchemy import event, inspect, select
+from typing import Dict, List, Any, Optional
+import os
+
+from app.calculations.resolver import CalculationRequest, PreparedStatements, QueryResult
+
+
+REPORT_EXECUTION_PLANS_ENABLED = os.getenv("REPORT_EXECUTION_PLANS_ENABLED", "true").lower() == "true"
+# Bump when the stored layout or the shape of the generated SQL changes, so older plans are rebuilt
+EXECUTION_PLAN_FORMAT = 2
+
+
+@dataclass
+class ExecutionPlan:
+    """Everything a saved report run needs except the cycle code"""
+    deal_tranche_map: Dict[int, List[str]]  # deal_id -> [tranche_ids] or [] for all
+    calculation_requests: List[CalculationRequest]
+    statements: PreparedStatements  # Generated SQL and the column layout of each statement
+
+
+def execution_plan_to_dict(plan: ExecutionPlan) -> Dict[str, Any]:
+    """JSON document stored in Report.execution_plan"""
+    return {
+        "format": EXECUTION_PLAN_FORMAT,
+        "deal_tranche_map": {str(deal_id): tranche_ids for deal_id, tranche_ids in plan.deal_tranche_map.items()},
+        "calculation_requests": [
+            {"calc_type": request.calc_type, "calc_id": request.calc_id,
+             "field_path": request.field_path, "alias": request.alias}
+            for request in plan.calculation_requests
+        ],
+        "selection_table": plan.statements.selection_table,
+        "queries": {alias: _query_to_dict(query) for alias, query in plan.statements.queries.items()},
+        "compiled_queries": {
+            level: _query_to_dict(query) for level, query in plan.statements.compiled_queries.items()
+        },
+        "compile_errors": plan.statements.compile_errors,
+    }
+
+
+def execution_plan_from_dict(data: Optional[Dict[str, Any]]) -> Optional[ExecutionPlan]:
+    """Stored plan, or None when there is none or it was written in another format"""
+    if not data or data.get("format") != EXECUTION_PLAN_FORMAT:
+        return None
+    try:
+        return ExecutionPlan(
+            deal_tranche_map={int(deal_id): tranche_ids for deal_id, tranche_ids in data["deal_tranche_map"].items()},
+            calculation_requests=[CalculationRequest(**request) for request in data["calculation_requests"]],
+            statements=PreparedStatements(
+                selection_table=data["selection_table"],
+                queries={alias: _query_from_dict(query) for alias, query in data["queries"].items()},
+                compiled_queries={level: _query_from_dict(query) for level, query in data["compiled_queries"].items()},
+                compile_errors=data["compile_errors"],
+            ),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable report execution plan: {e}")
+        return None
+
+
+def _query_to_dict(query: QueryResult) -> Dict[str, Any]:
+    # Bind values are left out - they are rebuilt from the selection and cycle on every run
+    return {"sql": query.sql, "columns": query.columns, "calc_type": query.calc_type, "group_level": query.group_level}
+
+
+def _query_from_dict(data: Dict[str, Any]) -> QueryResult:
+    return QueryResult(data["sql"], data["columns"], data["calc_type"], data["group_level"])
+
+
+def setup_execution_plan_invalidation_listeners():
+    """Clear stored plans whenever a report, its selections or one of its calculations changes.
+
+    Plans are cleared with an UPDATE on the flushing connection, so the change and the cleared
+    plan commit together; the version bump stops a run that read the old definitions from saving its plan.
+    """
+
+    # Import here to avoid circular imports
+    from app.calculations.models import UserCalculation, SystemCalculation
+    from app.reporting.models import Report, ReportDeal, ReportTranche, ReportCalculation
+
+    reports = Report.__table__
+    report_deals = ReportDeal.__table__
+    report_calculations = ReportCalculation.__table__
+
+    def clear_plans(connection, report_filter):
+        connection.execute(
+            reports.update()
+            .where(report_filter)
+            .values(
+                execution_plan=None,
+                execution_plan_version=reports.c.execution_plan_version + 1,
+                updated_date=reports.c.updated_date,  # Clearing a plan isn't an edit of the report
+            )
+        )
+
+    def on_report_selection_change(mapper, connection, target):
+        clear_plans(connection, reports.c.id == target.report_id)
+
+    def on_report_tranche_change(mapper, connection, target):
+        clear_plans(connection, reports.c.id.in_(
+            select(report_deals.c.report_id).where(report_deals.c.id == target.report_deal_id)
+        ))
+
+    def on_calculation_change(mapper, connection, target):
+        # Report calculations store the id as text, without a reliable type - clear every match
+        clear_plans(connection, reports.c.id.in_(
+            select(report_calculations.c.report_id).where(report_calculations.c.calculation_id == str(target.id))
+        ))
+
+    @event.listens_for(Report, "before_update")
+    def on_report_update(mapper, connection, target):
+        if _has_column_changes(target):
+            target.execution_plan = None
+            target.execution_plan_version = Report.execution_plan_version + 1
+
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(ReportDeal, event_name, on_report_selection_change)
+        event.listen(ReportCalculation, event_name, on_report_selection_change)
+        event.listen(ReportTranche, event_name, on_report_tranche_change)
+        event.listen(UserCalculation, event_name, on_calculation_change)
+        event.listen(SystemCalculation, event_name, on_calculation_change)
+
+
+def _has_column_changes(target) -> bool:
+    """Whether a report's own columns changed - collection changes are handled by the child listeners"""
+    state = inspect(target)
+    return any(
+        state.attrs[attr.key].history.has_changes()
+        for attr in state.mapper.column_attrs
+        if attr.key not in ("execution_plan", "execution_plan_version")
+    )
+
+
+# Initialize the event listeners when this module is imported
+setup_execution_plan_invalidation_listeners()
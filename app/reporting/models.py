@@ -1,8 +1,8 @@
 """Clean database models for the reporting module - streamlined for new calculation system."""
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float, Index, JSON
+from sqlalchemy.orm import relationship, deferred
 from app.core.database import Base
 
 
@@ -20,6 +20,12 @@ class Report(Base):
     updated_date = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     is_active = Column(Boolean, default=True)
 
+    # Compiled execution plan (resolved calculations and their SQL), rebuilt after the report or
+    # one of its calculations changes. Deferred so report listings don't load it
+    execution_plan = deferred(Column(JSON(none_as_null=True), nullable=True))
+    # Bumped whenever the plan is cleared, so a plan built from older definitions isn't saved
+    execution_plan_version = Column(Integer, nullable=False, default=0, server_default="0")
+
     # Relationships
     selected_deals = relationship(
         "ReportDeal", back_populates="report", cascade="all, delete-orphan"
@@ -79,6 +85,11 @@ class ReportCalculation(Base):
     # Relationship
     report = relationship("Report", back_populates="selected_calculations")
 
+    # Calculation usage lookups filter on the referenced calculation, not the report
+    __table_args__ = (
+        Index("idx_report_calculations_calculation", "calculation_id", "calculation_type"),
+    )
+
 
 class ReportExecutionLog(Base):
     """Log of report executions with performance metrics."""
@@ -93,7 +104,47 @@ class ReportExecutionLog(Base):
     row_count = Column(Integer, nullable=True)
     success = Column(Boolean, nullable=False)
     error_message = Column(String, nullable=True)
+    cache_hit = Column(Boolean, nullable=True)  # Served from the report result cache
+    executed_at = Column(DateTime, default=datetime.now)
+
+    # Relationships
+    report = relationship("Report", back_populates="execution_logs")
+    timings = relationship(
+        "ReportExecutionTiming", back_populates="execution_log", cascade="all, delete-orphan"
+    )
+
+    __table_args__ = (
+        # Per-report history and statistics, newest first
+        Index("idx_report_execution_logs_report_executed", "report_id", "executed_at"),
+        # Period filters of the system-wide analytics
+        Index("idx_report_execution_logs_executed_at", "executed_at"),
+    )
+
+
+class ReportExecutionTiming(Base):
+    """Time spent in one stage of a report execution.
+
+    Stages are "query" (one row per statement, named by calculation alias or compiled level),
+    "merge" and "serialization". report_id and executed_at are copied from the execution log
+    so percentiles can be computed without a join.
+    """
+
+    __tablename__ = "report_execution_timings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    execution_log_id = Column(Integer, ForeignKey("report_execution_logs.id"), nullable=False)
+    report_id = Column(Integer, nullable=False)
+    stage = Column(String, nullable=False)
+    name = Column(String, nullable=True)
+    duration_ms = Column(Float, nullable=False)
+    row_count = Column(Integer, nullable=True)
     executed_at = Column(DateTime, default=datetime.now)
 
     # Relationship
-    report = relationship("Report", back_populates="execution_logs")
\ No newline at end of file
+    execution_log = relationship("ReportExecutionLog", back_populates="timings")
+
+    __table_args__ = (
+        # Per-report, per-stage percentiles over a period
+        Index("idx_report_execution_timings_report_stage", "report_id", "stage", "executed_at"),
+        Index("idx_report_execution_timings_log", "execution_log_id"),
+    )
\ No newline at end of file
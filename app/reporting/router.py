@@ -2,10 +2,17 @@
 
 from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
-import pandas as pd
-import io
-from app.reporting.service import ReportService
+from fastapi.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+import anyio
+from app.reporting.service import ReportService, STREAM_FORMATS
+from app.reporting.columnar_export import (
+    COLUMNAR_FORMATS,
+    COLUMNAR_MEDIA_TYPES,
+    COLUMNAR_FILE_EXTENSIONS,
+    columnar_export_available,
+)
+from app.reporting.xlsx_export import XLSX_MEDIA_TYPE, encode_xlsx
 from app.reporting.dao import ReportDAO
 from app.reporting.schemas import (
     ReportRead,
@@ -16,13 +23,35 @@ from app.reporting.schemas import (
     AvailableCalculation,
     ReportScope,
 )
-from app.core.dependencies import SessionDep, DWSessionDep, get_user_calculation_service, get_system_calculation_service, get_report_execution_service
+from app.core.dependencies import SessionDep, DWSessionDep, get_user_calculation_service, get_system_calculation_service, get_report_execution_service, get_report_execution_log_service
+from app.reporting.execution_log_service import ReportExecutionLogService
 from app.datawarehouse.dao import DatawarehouseDAO
 from app.calculations.service import UserCalculationService, SystemCalculationService, ReportExecutionService
+from app.calculations.resolver import EXECUTION_MODES
+from app.core.exceptions import ReportTimeoutError
+from app.calculations.result_cache import get_report_result_cache, invalidate_report_results
 
 
 router = APIRouter(prefix="/reports", tags=["reporting"])
 
+EXPORT_FORMATS = COLUMNAR_FORMATS + ("xlsx",)
+EXPORT_MEDIA_TYPES = {**COLUMNAR_MEDIA_TYPES, "xlsx": XLSX_MEDIA_TYPE}
+EXPORT_FILE_EXTENSIONS = {**COLUMNAR_FILE_EXTENSIONS, "xlsx": "xlsx"}
+
+
+class ReportStreamingResponse(StreamingResponse):
+    """Streaming response that closes the report stream when the response ends, even on a disconnect.
+
+    Starlette stops iterating without closing the body, which would leave logging and session cleanup to GC.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
 
 # Dependency functions
 def get_report_dao(db: SessionDep) -> ReportDAO:
@@ -38,15 +67,19 @@ def get_report_service(
     dw_dao: DatawarehouseDAO = Depends(get_dw_dao),
     user_calc_service: UserCalculationService = Depends(get_user_calculation_service),
     system_calc_service: SystemCalculationService = Depends(get_system_calculation_service),
-    report_execution_service: ReportExecutionService = Depends(get_report_execution_service)
+    report_execution_service: ReportExecutionService = Depends(get_report_execution_service),
+    execution_log_service: ReportExecutionLogService = Depends(get_report_execution_log_service)
 ) -> ReportService:
-    return ReportService(
+    service = ReportService(
         report_dao, 
         dw_dao, 
         user_calc_service, 
         system_calc_service, 
         report_execution_service
     )
+    # Without it runs (and their cache hits) are never written to the execution log
+    service.execution_log_service = execution_log_service
+    return service
 
 
 # ===== REPORT CONFIGURATION ENDPOINTS =====
@@ -115,9 +148,11 @@ async def run_report(
     request: RunReportRequest, service: ReportService = Depends(get_report_service)
 ) -> List[Dict[str, Any]]:
     """Run a saved report configuration."""
-    return await service.run_saved_report(
-        request.report_id, request.cycle_code
+    content = await service.run_saved_report(
+        request.report_id, request.cycle_code, encode_json=True
     )  # FIXED: added await
+    # Already serialized (and timed) by the service; response_model still documents the shape
+    return Response(content, media_type="application/json")
 
 
 @router.post("/run/{report_id}", response_model=List[Dict[str, Any]])
@@ -128,7 +163,79 @@ async def run_report_by_id(
     cycle_code = request.get("cycle_code")
     if not cycle_code:
         raise HTTPException(status_code=400, detail="cycle_code is required")
-    return await service.run_saved_report(report_id, cycle_code)  # FIXED: added await
+    execution_mode = request.get("execution_mode")
+    if execution_mode and execution_mode not in EXECUTION_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"execution_mode must be one of {', '.join(EXECUTION_MODES)}"
+        )
+    try:
+        content = await service.run_saved_report(
+            report_id, cycle_code, execution_mode=execution_mode, encode_json=True
+        )  # FIXED: added await
+    except ReportTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return Response(content, media_type="application/json")
+
+
+@router.post("/run/{report_id}/stream")
+async def stream_report_by_id(
+    report_id: int, request: Dict[str, Any], service: ReportService = Depends(get_report_service)
+) -> StreamingResponse:
+    """Run a saved report and stream its rows as NDJSON (default) or as a chunked JSON array."""
+    cycle_code = request.get("cycle_code")
+    if not cycle_code:
+        raise HTTPException(status_code=400, detail="cycle_code is required")
+    execution_mode = request.get("execution_mode")
+    if execution_mode and execution_mode not in EXECUTION_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"execution_mode must be one of {', '.join(EXECUTION_MODES)}"
+        )
+    output_format = request.get("format", "ndjson")
+    if output_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(STREAM_FORMATS)}")
+
+    try:
+        chunks = await service.stream_saved_report(
+            report_id, cycle_code, execution_mode=execution_mode, output_format=output_format
+        )
+    except ReportTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    media_type = "application/x-ndjson" if output_format == "ndjson" else "application/json"
+    return ReportStreamingResponse(chunks, media_type=media_type)
+
+
+@router.get("/{report_id}/export")
+async def export_report_by_id(
+    report_id: int,
+    cycle_code: int,
+    format: str = "parquet",
+    execution_mode: Optional[str] = None,
+    service: ReportService = Depends(get_report_service),
+) -> StreamingResponse:
+    """Download a saved report for a cycle as an Arrow IPC stream, a Parquet file or an XLSX workbook."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if execution_mode and execution_mode not in EXECUTION_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"execution_mode must be one of {', '.join(EXECUTION_MODES)}"
+        )
+    if format in COLUMNAR_FORMATS and not columnar_export_available():
+        raise HTTPException(status_code=501, detail="pyarrow is not installed on this server")
+
+    try:
+        chunks = await service.export_saved_report(
+            report_id, cycle_code, format, execution_mode=execution_mode
+        )
+    except ReportTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+    file_name = f"report_{report_id}_{cycle_code}.{EXPORT_FILE_EXTENSIONS[format]}"
+    return ReportStreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename={file_name}"},
+    )
 
 
 # ===== PREVIEW AND EXECUTION LOG ENDPOINTS =====
@@ -142,6 +249,14 @@ async def preview_report_sql(
     return await service.preview_report_sql(report_id, cycle_code)  # FIXED: added await
 
 
+@router.get("/{report_id}/index-advice")
+async def advise_report_indexes(
+    report_id: int, cycle_code: int = 202404, service: ReportService = Depends(get_report_service)
+) -> Dict[str, Any]:
+    """Query plans of a report's SQL and the warehouse indexes they are missing."""
+    return await service.advise_report_indexes(report_id, cycle_code)
+
+
 @router.get("/{report_id}/execution-logs")
 async def get_report_execution_logs(
     report_id: int, limit: int = 50, service: ReportService = Depends(get_report_service)
@@ -225,39 +340,11 @@ async def export_to_xlsx(request: Dict[str, Any]) -> Response:
         if not data:
             raise HTTPException(status_code=400, detail="No data provided for export")
 
-        # Create DataFrame from the data
-        df = pd.DataFrame(data)
-
-        # Create Excel file in memory
-        excel_buffer = io.BytesIO()
-
-        with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
-            # Write the data to the Excel file
-            df.to_excel(
-                writer, sheet_name=report_type[:31], index=False
-            )  # Excel sheet name limit is 31 chars
-
-            # Get the workbook and worksheet to format
-            workbook = writer.book
-            worksheet = writer.sheets[report_type[:31]]
-
-            # Auto-adjust column widths
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
+        # Columns in order of first appearance, as the DataFrame-based export produced them
+        column_names = list(dict.fromkeys(key for row in data for key in row))
 
-                # Set column width with some padding, max 50 characters
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-
-        excel_buffer.seek(0)
+        # Sheet name is limited to 31 chars; widths come from a sample of the rows
+        excel_bytes = b"".join(encode_xlsx(iter([data]), column_names, report_type))
 
         # Ensure the filename has .xlsx extension
         if not file_name.endswith(".xlsx"):
@@ -265,8 +352,8 @@ async def export_to_xlsx(request: Dict[str, Any]) -> Response:
 
         # Return the Excel file as a response
         return Response(
-            content=excel_buffer.getvalue(),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            content=excel_bytes,
+            media_type=XLSX_MEDIA_TYPE,
             headers={"Content-Disposition": f"attachment; filename={file_name}"},
         )
 
@@ -498,37 +585,10 @@ async def get_report_execution_analytics(
         # Get comprehensive stats
         stats = execution_log_service.get_execution_stats_for_report(report_id)
         
-        # Get recent executions for trends
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days_back)
-        recent_logs = execution_log_service.get_executions_by_date_range(
-            start_date, end_date, report_id
-        )
-        
-        # Calculate daily execution counts
-        daily_counts = {}
-        for log_data in recent_logs:
-            log_date = datetime.fromisoformat(log_data["executed_at"]).date()
-            date_key = log_date.isoformat()
-            if date_key not in daily_counts:
-                daily_counts[date_key] = {"successful": 0, "failed": 0, "total": 0}
-            
-            daily_counts[date_key]["total"] += 1
-            if log_data["success"]:
-                daily_counts[date_key]["successful"] += 1
-            else:
-                daily_counts[date_key]["failed"] += 1
-        
-        # Format for charts
-        daily_trends = [
-            {
-                "date": date,
-                "successful_executions": counts["successful"],
-                "failed_executions": counts["failed"],
-                "total_executions": counts["total"]
-            }
-            for date, counts in sorted(daily_counts.items())
-        ]
+        # Daily counts and percentiles aggregated in SQL
+        period_analysis = execution_log_service.get_report_period_analysis(report_id, days_back)
+        recent_success_flags = period_analysis.pop("recent_success_flags")
+        total_in_period = period_analysis["total_executions_in_period"]
         
         analytics_data = {
             "report_info": {
@@ -538,18 +598,13 @@ async def get_report_execution_analytics(
                 "scope": report.scope
             },
             "overall_statistics": stats,
-            "period_analysis": {
-                "period_days": days_back,
-                "start_date": start_date.date().isoformat(),
-                "end_date": end_date.date().isoformat(),
-                "daily_trends": daily_trends,
-                "total_executions_in_period": len(recent_logs)
-            },
+            "period_analysis": period_analysis,
             "performance_insights": {
                 "reliability_score": stats["success_rate"],
                 "avg_execution_time_display": stats.get("average_execution_time_display", "N/A"),
-                "has_recent_failures": any(not log["success"] for log in recent_logs[-10:]) if recent_logs else False,
-                "execution_frequency": len(recent_logs) / days_back if days_back > 0 else 0
+                # Among the last 10 executions in the period
+                "has_recent_failures": not all(recent_success_flags),
+                "execution_frequency": total_in_period / days_back if days_back > 0 else 0
             }
         }
         
@@ -614,4 +669,34 @@ def get_execution_dashboard(
             }
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating execution dashboard: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error generating execution dashboard: {str(e)}")
+
+# ===== RESULT CACHE ENDPOINTS =====
+
+
+@router.get("/cache/stats")
+def get_result_cache_stats():
+    """Get report result cache statistics for monitoring."""
+    try:
+        return {
+            "success": True,
+            "data": get_report_result_cache().get_stats(),
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving result cache stats: {str(e)}")
+
+
+@router.post("/cache/clear")
+def clear_result_cache():
+    """Drop cached report results, e.g. after warehouse data for a cycle was reloaded (admin function)."""
+    try:
+        invalidate_report_results()
+        return {
+            "success": True,
+            "message": "Report result cache cleared",
+            "data": get_report_result_cache().get_stats(),
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error clearing result cache: {str(e)}")
@@ -238,6 +238,7 @@ class ReportExecutionLog(BaseModel):
     row_count: Optional[int] = None
     success: bool
     error_message: Optional[str] = None
+    cache_hit: Optional[bool] = None
     executed_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
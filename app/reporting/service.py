@@ -1,10 +1,30 @@
 # app/reporting/service.py
 """Clean reporting service using only the new separated calculation system with execution logging."""
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Callable, Union
 from fastapi import HTTPException
+from pydantic import TypeAdapter
+import anyio
+from starlette.concurrency import run_in_threadpool
 
+from app.core.database import SessionLocal, DWSessionLocal
 from app.reporting.dao import ReportDAO
+from app.reporting.execution_log_dao import ReportExecutionLogDAO
+from app.reporting.execution_log_service import ReportExecutionLogService
+from app.reporting.columnar_export import (
+    ReportColumns,
+    arrow_type_for_static_field,
+    arrow_type_for_user_calculation,
+    encode_arrow_stream,
+    encode_parquet,
+)
+from app.reporting.xlsx_export import encode_xlsx
+from app.reporting.execution_plan import (
+    REPORT_EXECUTION_PLANS_ENABLED,
+    ExecutionPlan,
+    execution_plan_from_dict,
+    execution_plan_to_dict,
+)
 from app.reporting.models import Report, ReportDeal, ReportTranche, ReportCalculation
 from app.reporting.schemas import (
     ReportRead,
@@ -21,10 +41,18 @@ from app.calculations.service import (
     StaticFieldService,
     ReportExecutionService
 )
-from app.calculations.models import GroupLevel
-from app.calculations.resolver import CalculationRequest
+from app.calculations.models import GroupLevel, UserCalculation, SystemCalculation
+from app.calculations.definition_cache import load_calculation_definition, load_calculation_definitions
+from app.calculations.resolver import CalculationRequest, QueryFilters, ExecutionTimings
 import time
 
+# Output formats for streamed report results
+STREAM_FORMATS = ("ndjson", "json")
+
+# Same serialization as FastAPI applies for the List[Dict[str, Any]] response model of the run endpoints
+_REPORT_ROWS_ADAPTER = TypeAdapter(List[Dict[str, Any]])
+_REPORT_ROW_ADAPTER = TypeAdapter(Dict[str, Any])
+
 
 class ReportService:
     """Clean service for managing reports with the new calculation system and execution logging."""
@@ -234,36 +262,48 @@ class ReportService:
         """Get all reports with summary information."""
         reports = await self.report_dao.get_all()
         summaries = []
-        
+
+        # Tranche counts of every deal selected with all of its tranches, across all reports, in one go
+        tranche_counts = self.dw_dao.get_tranche_counts_by_dl_nbrs(
+            deal.dl_nbr for report in reports for deal in report.selected_deals if not deal.selected_tranches
+        )
+
+        # Execution statistics of every report from one grouped query
+        all_exec_stats = {}
+        if self.execution_log_service:
+            try:
+                all_exec_stats = self.execution_log_service.get_execution_stats_for_reports(
+                    [report.id for report in reports]
+                )
+            except Exception as e:
+                # If execution stats fail, just use defaults
+                print(f"Warning: Could not fetch execution stats: {e}")
+
         for report in reports:
-            summary = self._build_summary(report)
+            summary = self._build_summary(report, tranche_counts)
             
-            # Add execution statistics if execution log service is available
-            if self.execution_log_service:
-                try:
-                    exec_stats = self.execution_log_service.get_execution_stats_for_report(report.id)
-                    summary.total_executions = exec_stats.get("total_executions", 0)
-                    summary.last_executed = exec_stats.get("last_execution_date")
-                    summary.last_execution_success = (
-                        exec_stats.get("successful_executions", 0) > 0 
-                        if exec_stats.get("total_executions", 0) > 0 else None
-                    )
-                except Exception as e:
-                    # If execution stats fail, just use defaults
-                    print(f"Warning: Could not fetch execution stats for report {report.id}: {e}")
+            # Add execution statistics if they could be loaded
+            exec_stats = all_exec_stats.get(report.id)
+            if exec_stats:
+                summary.total_executions = exec_stats.get("total_executions", 0)
+                summary.last_executed = exec_stats.get("last_execution_date")
+                summary.last_execution_success = (
+                    exec_stats.get("successful_executions", 0) > 0 
+                    if exec_stats.get("total_executions", 0) > 0 else None
+                )
             
             summaries.append(summary)
         
         return summaries
 
-    def _build_summary(self, report: Report) -> ReportSummary:
-        """Build summary for a single report."""
+    def _build_summary(self, report: Report, tranche_counts: Dict[int, int]) -> ReportSummary:
+        """Build summary for a single report from preloaded tranche counts of its all-tranche deals."""
         deal_count = len(report.selected_deals)
         tranche_count = sum(
             (
                 len(deal.selected_tranches)
                 if deal.selected_tranches
-                else len(self.dw_dao.get_tranches_by_dl_nbr(deal.dl_nbr))
+                else tranche_counts.get(deal.dl_nbr, 0)
             )
             for deal in report.selected_deals
         )
@@ -388,8 +428,13 @@ class ReportService:
 
     # ===== REPORT EXECUTION =====
 
-    async def run_saved_report(self, report_id: int, cycle_code: int, executed_by: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Execute a report using the new calculation system with proper logging."""
+    async def run_saved_report(self, report_id: int, cycle_code: int, executed_by: Optional[str] = None,
+                               execution_mode: Optional[str] = None,
+                               encode_json: bool = False) -> Union[List[Dict[str, Any]], bytes]:
+        """Execute a report using the new calculation system with proper logging.
+
+        With encode_json the rows come back as the JSON response body, so serialization is timed too.
+        """
         if not self.report_execution_service:
             raise HTTPException(status_code=500, detail="Report execution service not available")
 
@@ -397,16 +442,24 @@ class ReportService:
         start_time = time.time()
         
         try:
-            # Convert report to calculation requests
-            deal_tranche_map, calculation_requests = self._prepare_execution(report)
+            # Stored plan of the report - only the cycle code is bound per run
+            plan = await run_in_threadpool(self._get_execution_plan, report)
 
             # Execute via new system
-            result = self.report_execution_service.execute_report(
-                calculation_requests,
-                deal_tranche_map,
-                cycle_code
+            result = await self.report_execution_service.execute_report_async(
+                plan.calculation_requests,
+                plan.deal_tranche_map,
+                cycle_code,
+                execution_mode,
+                plan.statements
             )
 
+            output = result['data']
+            timings = ExecutionTimings(result['metadata'].get('timings'))
+            if encode_json:
+                with timings.measure("serialization"):
+                    output = _REPORT_ROWS_ADAPTER.dump_json(output)
+
             # Log successful execution
             execution_time_ms = (time.time() - start_time) * 1000
             await self._log_execution(
@@ -415,10 +468,12 @@ class ReportService:
                 executed_by=executed_by or "api_user",
                 execution_time_ms=execution_time_ms,
                 row_count=len(result['data']),
-                success=True
+                success=True,
+                cache_hit=result['metadata'].get('cache_hit'),
+                timings=timings.entries
             )
 
-            return result['data']
+            return output
 
         except Exception as e:
             # Log failed execution
@@ -434,17 +489,218 @@ class ReportService:
             )
             raise
 
-    def _prepare_execution(self, report: Report) -> tuple[Dict[int, List[str]], List[CalculationRequest]]:
+    async def stream_saved_report(self, report_id: int, cycle_code: int, executed_by: Optional[str] = None,
+                                  execution_mode: Optional[str] = None,
+                                  output_format: str = "ndjson") -> AsyncIterator[bytes]:
+        """Execute a saved report and return its rows as an iterator of NDJSON or JSON array chunks."""
+        report = await self._get_report_or_404(report_id)
+        plan = await run_in_threadpool(self._get_execution_plan, report)
+
+        chunks = self._logged_stream(
+            report_id, cycle_code, executed_by or "api_user", execution_mode, plan,
+            lambda batches: self._encode_report_stream(batches, output_format)
+        )
+        return await self._start_stream(chunks)
+
+    async def export_saved_report(self, report_id: int, cycle_code: int, output_format: str,
+                                  executed_by: Optional[str] = None,
+                                  execution_mode: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Execute a saved report and return it as Arrow IPC stream, Parquet or XLSX file chunks."""
+        report = await self._get_report_or_404(report_id)
+        plan = await run_in_threadpool(self._get_execution_plan, report)
+        columns = await run_in_threadpool(self._export_columns, plan.calculation_requests)
+
+        def encode(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+            if output_format == "xlsx":
+                return encode_xlsx(batches, [name for name, _ in columns], report.name)
+            if output_format == "parquet":
+                return encode_parquet(batches, columns)
+            return encode_arrow_stream(batches, columns)
+
+        chunks = self._logged_stream(report_id, cycle_code, executed_by or "api_user", execution_mode, plan, encode)
+        return await self._start_stream(chunks)
+
+    async def _start_stream(self, chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+        """Produce the first chunk before the response starts, so a failing report still gets an error status."""
+        first_chunk = await run_in_threadpool(next, chunks, None)
+        return self._closing_stream(first_chunk, chunks)
+
+    async def _closing_stream(self, first_chunk: Optional[bytes], chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+        """Chunks pulled on the threadpool; closing this closes them, so the execution is logged right away."""
+        try:
+            chunk = first_chunk
+            while chunk is not None:
+                yield chunk
+                chunk = await run_in_threadpool(next, chunks, None)
+        finally:
+            # Runs the stream's cleanup (execution log, sessions) even when the response was cancelled
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(chunks.close)
+
+    def _export_columns(self, calculation_requests: List[CalculationRequest]) -> ReportColumns:
+        """Report columns with their warehouse types; system calculation types come from the data."""
+        columns = []
+        for request in calculation_requests:
+            arrow_type = None
+            if request.calc_type == "static_field":
+                arrow_type = arrow_type_for_static_field(request.field_path)
+            elif request.calc_type == "user_calculation":
+                calc = load_calculation_definition(self.report_dao.db, UserCalculation, request.calc_id)
+                if calc:
+                    arrow_type = arrow_type_for_user_calculation(calc)
+            columns.append((request.alias, arrow_type))
+        return columns
+
+    def _logged_stream(self, report_id: int, cycle_code: int, executed_by: str, execution_mode: Optional[str],
+                       plan: ExecutionPlan,
+                       encode: Callable[[Iterator[List[Dict[str, Any]]]], Iterator[bytes]]) -> Iterator[bytes]:
+        """Encoded report chunks, logging the execution and its stage timings once the stream ends.
+
+        Serialization time is the time spent producing chunks less the time spent waiting for rows;
+        sending the chunks to the client is not counted.
+        """
+        start_time = time.time()
+        timings = ExecutionTimings()
+        row_count, rows_ms, chunks_ms = 0, 0.0, 0.0
+        success, error_message = False, "Stream closed before all rows were sent"
+
+        def counted(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+            nonlocal row_count, rows_ms
+            try:
+                while True:
+                    started = time.perf_counter()
+                    batch = next(batches, None)
+                    rows_ms += (time.perf_counter() - started) * 1000
+                    if batch is None:
+                        return
+                    row_count += len(batch)
+                    yield batch
+            finally:
+                batches.close()
+
+        rows = counted(self._stream_report_rows(cycle_code, execution_mode, plan, timings))
+        chunks = encode(rows)
+        try:
+            while True:
+                started = time.perf_counter()
+                chunk = next(chunks, None)
+                chunks_ms += (time.perf_counter() - started) * 1000
+                if chunk is None:
+                    break
+                yield chunk
+            success, error_message = True, None
+        except Exception as e:
+            error_message = str(e)
+            raise
+        finally:
+            # Close the row stream first - the resolver records its last timings as it closes
+            chunks.close()
+            rows.close()
+            timings.record("serialization", None, max(chunks_ms - rows_ms, 0.0))
+            config_db = SessionLocal()
+            try:
+                ReportExecutionLogService(ReportExecutionLogDAO(config_db)).log_execution(
+                    report_id=report_id,
+                    cycle_code=cycle_code,
+                    executed_by=executed_by,
+                    execution_time_ms=(time.time() - start_time) * 1000,
+                    row_count=row_count,
+                    success=success,
+                    error_message=error_message,
+                    timings=timings.entries
+                )
+            except Exception as e:
+                print(f"Warning: Could not log execution: {e}")
+            finally:
+                config_db.close()
+
+    def _stream_report_rows(self, cycle_code: int, execution_mode: Optional[str], plan: ExecutionPlan,
+                            timings: ExecutionTimings) -> Iterator[List[Dict[str, Any]]]:
+        """Report rows in batches, recording statement and merge times into timings.
+
+        Request-scoped sessions are closed before a streaming body is sent, so the stream owns its sessions.
+        """
+        dw_db, config_db = DWSessionLocal(), SessionLocal()
+        try:
+            execution_service = ReportExecutionService(dw_db, config_db)
+            yield from execution_service.stream_report(
+                plan.calculation_requests, plan.deal_tranche_map, cycle_code, execution_mode,
+                prepared_statements=plan.statements, timings=timings
+            )
+        finally:
+            dw_db.close()
+            config_db.close()
+
+    def _encode_report_stream(self, batches: Iterator[List[Dict[str, Any]]], output_format: str) -> Iterator[bytes]:
+        """Serialize row batches as NDJSON lines or as the pieces of one JSON array.
+
+        Values are encoded like the run endpoints' response (Decimal as a string, dates as ISO).
+        """
+        if output_format == "ndjson":
+            for batch in batches:
+                yield b"".join(_REPORT_ROW_ADAPTER.dump_json(row) + b"\n" for row in batch)
+            return
+
+        opening = b"["
+        for batch in batches:
+            if not batch:
+                continue
+            yield opening + _REPORT_ROWS_ADAPTER.dump_json(batch)[1:-1]
+            opening = b","
+        yield b"[]" if opening == b"[" else b"]"
+
+    def _get_execution_plan(self, report: Report) -> ExecutionPlan:
+        """Stored execution plan of the report, compiled and saved again when a change cleared it.
+
+        Reads definitions and generates SQL on the sync config session - async callers run it on the threadpool.
+        """
+        if not self.report_execution_service:
+            raise HTTPException(status_code=500, detail="Report execution service not available")
+        resolver = self.report_execution_service.resolver
+
+        # Read before the plan, so a change committed while it is rebuilt stops it from being saved
+        plan_version = report.execution_plan_version or 0
+        if REPORT_EXECUTION_PLANS_ENABLED:
+            plan = execution_plan_from_dict(report.execution_plan)
+            # A different staging threshold or warehouse dialect needs different SQL
+            if plan and plan.statements.selection_table == resolver.selection_table_for(
+                    QueryFilters(plan.deal_tranche_map, None)):
+                return plan
+
+        # Stored plans outlive the definition cache TTL, so compile from the committed definitions
+        deal_tranche_map, calculation_requests = self._prepare_execution(
+            report, refresh_definitions=REPORT_EXECUTION_PLANS_ENABLED
+        )
+        # The cycle is a bind parameter, so the statements are compiled without one
+        statements = resolver.prepare_statements(calculation_requests, QueryFilters(deal_tranche_map, None))
+        plan = ExecutionPlan(deal_tranche_map, calculation_requests, statements)
+
+        if REPORT_EXECUTION_PLANS_ENABLED:
+            try:
+                self.report_dao.save_execution_plan(report.id, execution_plan_to_dict(plan), plan_version)
+            except Exception as e:
+                self.report_dao.db.rollback()
+                print(f"Warning: Could not save execution plan for report {report.id}: {e}")
+        return plan
+
+    def _prepare_execution(self, report: Report, refresh_definitions: bool = False
+                           ) -> tuple[Dict[int, List[str]], List[CalculationRequest]]:
         """Convert report to execution format with enhanced calculation type detection."""
-        # Build deal-tranche mapping
+        # Build deal-tranche mapping - deals without selected tranches map to [] (all tranches),
+        # which the resolver filters on the deal alone, so no warehouse lookup is needed
         deal_tranche_map = {}
         for deal in report.selected_deals:
-            if deal.selected_tranches:
-                deal_tranche_map[deal.dl_nbr] = [rt.tr_id for rt in deal.selected_tranches]
-            else:
-                # Include all tranches for this deal
-                all_tranches = self.dw_dao.get_tranches_by_dl_nbr(deal.dl_nbr)
-                deal_tranche_map[deal.dl_nbr] = [t.tr_id for t in all_tranches]
+            deal_tranche_map[deal.dl_nbr] = [rt.tr_id for rt in deal.selected_tranches]
+
+        # Load every referenced definition up front - one query per calculation table on a cold cache
+        numeric_ids = [
+            int(report_calc.calculation_id) for report_calc in report.selected_calculations
+            if report_calc.calculation_id.isdigit()
+        ]
+        user_calcs = load_calculation_definitions(self.report_dao.db, UserCalculation, numeric_ids, refresh_definitions)
+        system_calcs = load_calculation_definitions(
+            self.report_dao.db, SystemCalculation, numeric_ids, refresh_definitions
+        )
 
         # Convert to calculation requests with improved logic
         calculation_requests = []
@@ -475,7 +731,7 @@ class ReportService:
             
             # If calculation_type is explicitly set, use it
             if calc_type == "user_calculation":
-                user_calc = self.user_calc_service.get_user_calculation_by_id(numeric_id)
+                user_calc = user_calcs.get(numeric_id)
                 if user_calc:
                     calc_request = CalculationRequest(
                         calc_type="user_calculation",
@@ -483,7 +739,7 @@ class ReportService:
                         alias=user_calc.name
                     )
             elif calc_type == "system_calculation":
-                system_calc = self.system_calc_service.get_system_calculation_by_id(numeric_id)
+                system_calc = system_calcs.get(numeric_id)
                 if system_calc:
                     calc_request = CalculationRequest(
                         calc_type="system_calculation",
@@ -496,7 +752,7 @@ class ReportService:
                 print(f"Warning: calculation_type is NULL for calc_id {numeric_id}, attempting auto-detection")
                 
                 # Check user calculations first
-                user_calc = self.user_calc_service.get_user_calculation_by_id(numeric_id)
+                user_calc = user_calcs.get(numeric_id)
                 if user_calc:
                     calc_request = CalculationRequest(
                         calc_type="user_calculation",
@@ -506,7 +762,7 @@ class ReportService:
                     print(f"Auto-detected as user_calculation: {user_calc.name}")
                 else:
                     # Try system calculations
-                    system_calc = self.system_calc_service.get_system_calculation_by_id(numeric_id)
+                    system_calc = system_calcs.get(numeric_id)
                     if system_calc:
                         calc_request = CalculationRequest(
                             calc_type="system_calculation",
@@ -535,19 +791,36 @@ class ReportService:
             raise HTTPException(status_code=500, detail="Report execution service not available")
 
         report = await self._get_report_or_404(report_id)
-        deal_tranche_map, calculation_requests = self._prepare_execution(report)
+        plan = await run_in_threadpool(self._get_execution_plan, report)
 
-        result = self.report_execution_service.preview_report_sql(
-            calculation_requests, deal_tranche_map, cycle_code
+        result = await run_in_threadpool(
+            self.report_execution_service.preview_report_sql,
+            plan.calculation_requests, plan.deal_tranche_map, cycle_code, plan.statements
         )
 
         return {
             "template_name": report.name,
             "sql_previews": result['sql_previews'],
+            "compiled_sql": result['compiled_sql'],
             "parameters": result['parameters'],
             "summary": result['summary']
         }
 
+    async def advise_report_indexes(self, report_id: int, cycle_code: int) -> Dict[str, Any]:
+        """Recommend warehouse indexes for the SQL a report generates, from its query plans."""
+        if not self.report_execution_service:
+            raise HTTPException(status_code=500, detail="Report execution service not available")
+
+        report = await self._get_report_or_404(report_id)
+        plan = await run_in_threadpool(self._get_execution_plan, report)
+
+        result = await run_in_threadpool(
+            self.report_execution_service.advise_report_indexes,
+            plan.calculation_requests, plan.deal_tranche_map, cycle_code, plan.statements
+        )
+
+        return {"template_name": report.name, "cycle_code": cycle_code, **result}
+
     async def get_execution_logs(self, report_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """Get execution logs for a report."""
         await self._get_report_or_404(report_id)
@@ -564,7 +837,8 @@ class ReportService:
     async def _log_execution(
         self, report_id: int, cycle_code: int, executed_by: str,
         execution_time_ms: float, row_count: int, success: bool,
-        error_message: str = None
+        error_message: str = None, cache_hit: Optional[bool] = None,
+        timings: Optional[List[Dict[str, Any]]] = None
     ) -> None:
         """Log report execution using the execution log service."""
         if not self.execution_log_service:
@@ -578,7 +852,9 @@ class ReportService:
                 execution_time_ms=execution_time_ms,
                 row_count=row_count,
                 success=success,
-                error_message=error_message
+                error_message=error_message,
+                cache_hit=cache_hit,
+                timings=timings
             )
         except Exception as e:
             print(f"Warning: Could not log execution: {e}")
@@ -608,8 +884,10 @@ class ReportService:
     ) -> Dict[int, List[Dict[str, Any]]]:
         """Get available tranches for deals."""
         try:
+            deal_ids = [int(deal_id) for deal_id in deal_ids]
+            tranches_by_deal = self.dw_dao.get_tranches_by_dl_nbrs(deal_ids)
             return {
-                deal_id: [{"tr_id": t.tr_id} for t in self.dw_dao.get_tranches_by_dl_nbr(deal_id)]
+                deal_id: [{"tr_id": t.tr_id} for t in tranches_by_deal[deal_id]]
                 for deal_id in deal_ids
             }
         except Exception as e:
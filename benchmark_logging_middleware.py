@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the request logging middleware.
+Sends the same requests through an app without middleware, with a pass-through
+BaseHTTPMiddleware (the overhead the old logging middleware started from) and with
+LoggingMiddleware, and reports requests per second for a JSON and a streamed endpoint.
+Log rows go to a temporary SQLite database through the batched log writer.
+
+Usage: python benchmark_logging_middleware.py [--requests 2000] [--concurrency 20] [--stream-chunks 100]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Log rows go to a throwaway database - set before the app modules create their engines
+_DB_DIR = tempfile.mkdtemp(prefix="logging_benchmark_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'config.db')}"
+
+# Add the current directory to the path so we can import our modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.database import Base, engine
+from app.logging.middleware import LoggingMiddleware
+from app.logging.writer import close_request_log_writer, get_request_log_writer
+
+
+class PassThroughMiddleware(BaseHTTPMiddleware):
+    """BaseHTTPMiddleware that does nothing, to isolate its own cost."""
+
+    async def dispatch(self, request, call_next):
+        return await call_next(request)
+
+
+def build_app(middleware=None) -> FastAPI:
+    app = FastAPI()
+    if middleware is not None:
+        app.add_middleware(middleware)
+
+    rows = [{"deal_number": deal, "tranche_id": "A", "balance": deal * 1.5} for deal in range(50)]
+
+    @app.post("/api/reports/run")
+    async def run(payload: dict):
+        return rows
+
+    @app.get("/api/reports/stream")
+    async def stream(chunks: int = 100):
+        async def body():
+            for index in range(chunks):
+                yield f'{{"row":{index},"value":"{"x" * 100}"}}\n'.encode()
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    return app
+
+
+async def run_requests(app: FastAPI, total: int, concurrency: int, stream_chunks: int, stream: bool) -> float:
+    """Requests per second over total requests sent by concurrency workers."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        async def worker(count: int):
+            for _ in range(count):
+                if stream:
+                    response = await client.get("/api/reports/stream", params={"chunks": stream_chunks})
+                else:
+                    response = await client.post("/api/reports/run", json={"report_id": 1, "cycle_code": 202404})
+                response.raise_for_status()
+
+        per_worker = total // concurrency
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+        return per_worker * concurrency / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request logging middleware throughput")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stream-chunks", type=int, default=100)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    variants = [
+        ("no middleware", None),
+        ("BaseHTTPMiddleware pass-through", PassThroughMiddleware),
+        ("LoggingMiddleware", LoggingMiddleware),
+    ]
+
+    print(f"{args.requests:,} requests, concurrency {args.concurrency}")
+    print(f"  {'':34}{'JSON req/s':>12}{'stream req/s':>14}")
+    for name, middleware in variants:
+        app = build_app(middleware)
+        # Warm up imports, routes and the log writer thread
+        asyncio.run(run_requests(app, args.concurrency, args.concurrency, args.stream_chunks, False))
+        json_rate = asyncio.run(run_requests(app, args.requests, args.concurrency, args.stream_chunks, False))
+        stream_rate = asyncio.run(run_requests(app, args.requests, args.concurrency, args.stream_chunks, True))
+        print(f"  {name:34}{json_rate:12,.0f}{stream_rate:14,.0f}")
+
+    close_request_log_writer()
+    stats = get_request_log_writer().get_stats()
+    print(f"Log rows written: {stats['written']:,} (dropped {stats['dropped']:,}, failed {stats['failed']:,})")
+
+    engine.dispose()
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
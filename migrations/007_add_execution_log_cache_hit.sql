@@ -0,0 +1,11 @@
+-- Migration: Record report result cache usage on execution logs
+-- Date: 2026-10-16
+-- Description: Add cache_hit to report_execution_logs so cached and computed runs can be told apart
+
+ALTER TABLE report_execution_logs
+ADD COLUMN cache_hit BOOLEAN;
+
+-- Executions logged before the result cache existed were always computed
+UPDATE report_execution_logs
+SET cache_hit = 0
+WHERE cache_hit IS NULL AND success = 1;
@@ -0,0 +1,7 @@
+-- Migration: Index report calculations by the calculation they reference
+-- Date: 2026-10-16
+-- Description: Calculation listings load the reports using every calculation in one query;
+-- index calculation_id/calculation_type so that lookup doesn't scan report_calculations
+
+CREATE INDEX IF NOT EXISTS idx_report_calculations_calculation
+ON report_calculations(calculation_id, calculation_type);
@@ -0,0 +1,11 @@
+-- Migration: Persist compiled execution plans with saved reports
+-- Date: 2026-10-16
+-- Description: Add execution_plan (resolved calculations, generated SQL and column layout) and
+-- execution_plan_version to reports. Plans are built on the first run and cleared whenever the
+-- report or one of its calculations changes
+
+ALTER TABLE reports
+ADD COLUMN execution_plan JSON;
+
+ALTER TABLE reports
+ADD COLUMN execution_plan_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,7 @@
+-- Migration: Index report execution logs by report and execution time
+-- Date: 2026-10-16
+-- Description: Report summaries compute execution statistics for every report in one grouped
+-- query, and report history lists a report's latest runs; index (report_id, executed_at) for both
+
+CREATE INDEX IF NOT EXISTS idx_report_execution_logs_report_executed
+ON report_execution_logs(report_id, executed_at);
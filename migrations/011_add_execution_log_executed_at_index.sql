@@ -0,0 +1,7 @@
+-- Migration: Index report execution logs by execution time
+-- Date: 2026-10-16
+-- Description: Execution log dashboards and trends aggregate the last N days of all reports in SQL;
+-- index executed_at so those period filters don't scan the whole log table
+
+CREATE INDEX IF NOT EXISTS idx_report_execution_logs_executed_at
+ON report_execution_logs(executed_at);
@@ -0,0 +1,25 @@
+-- Migration: Add per-stage report execution timings
+-- Date: 2026-10-16
+-- Description: Record where each report execution spent its time - every calculation's SQL
+-- (with rows fetched), the in-memory merge and response serialization - so analytics can
+-- report p50/p95/p99 per report and per calculation
+
+CREATE TABLE IF NOT EXISTS report_execution_timings (
+    id INTEGER PRIMARY KEY,
+    execution_log_id INTEGER NOT NULL REFERENCES report_execution_logs(id),
+    report_id INTEGER NOT NULL,
+    stage VARCHAR NOT NULL,
+    name VARCHAR,
+    duration_ms FLOAT NOT NULL,
+    row_count INTEGER,
+    executed_at DATETIME
+);
+
+CREATE INDEX IF NOT EXISTS ix_report_execution_timings_id
+ON report_execution_timings(id);
+
+CREATE INDEX IF NOT EXISTS idx_report_execution_timings_report_stage
+ON report_execution_timings(report_id, stage, executed_at);
+
+CREATE INDEX IF NOT EXISTS idx_report_execution_timings_log
+ON report_execution_timings(execution_log_id);
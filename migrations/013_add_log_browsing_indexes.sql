@@ -0,0 +1,10 @@
+-- Migration: Index the request log for keyset pagination
+-- Date: 2026-10-16
+-- Description: The log browser pages newest first on (timestamp, id) and filters by time window
+-- and status range; index both so deep pages and filtered counts don't scan the log table
+
+CREATE INDEX IF NOT EXISTS idx_log_timestamp_id
+ON log(timestamp, id);
+
+CREATE INDEX IF NOT EXISTS idx_log_status_timestamp
+ON log(status_code, timestamp);
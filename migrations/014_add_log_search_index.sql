@@ -0,0 +1,13 @@
+-- Migration: Full-text search index for the request log
+-- Date: 2026-10-16
+-- Description: Log search matched seven ILIKE '%term%' predicates, which always scan the log table.
+-- Index the searched columns in an FTS5 table with the trigram tokenizer (substring matches, like
+-- ILIKE). The triggers that keep it in step with log are created by ensure_log_search_index on
+-- startup, which also rebuilds the index; set LOG_SEARCH_INCLUDE_BODIES=true to index the bodies too
+
+CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5(
+    path, method, client_ip, username, hostname, status_code, application_id,
+    content='log', content_rowid='id', tokenize='trigram'
+);
+
+INSERT INTO log_fts(log_fts) VALUES ('rebuild');
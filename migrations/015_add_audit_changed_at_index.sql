@@ -0,0 +1,7 @@
+-- Migration: Index calculation audit logs by change time
+-- Date: 2026-10-16
+-- Description: Audit dashboards, trends and retention select by changed_at, which had no index,
+-- so each of them scanned the whole audit table; retention now deletes in batches ordered by it
+
+CREATE INDEX IF NOT EXISTS idx_calculation_audit_logs_changed_at
+ON calculation_audit_logs(changed_at);
@@ -0,0 +1,8 @@
+-- Migration: Index tranche balances by cycle for report queries
+-- Date: 2026-10-16
+-- Description: Every resolver statement filters tranchebal on one cycle_cde and joins it on
+-- (dl_nbr, tr_id); the primary key leads with dl_nbr, so whole-cycle reports scanned the table.
+-- On SQL Server the index is created with INCLUDE of the balance columns by ensure_warehouse_indexes
+
+CREATE INDEX IF NOT EXISTS idx_tranchebal_cycle_deal_tranche
+ON tranchebal(cycle_cde, dl_nbr, tr_id);
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+"""
+Report Execution Test Script
+
+Runs reports against throwaway SQLite config and data warehouse databases to check that:
+1. The compiled, parallel and individual execution modes return the same rows, in the same order
+2. Calculations with advanced filters leave out the keys their filter matches nothing for
+3. A calculation whose statement fails is reported, not returned as an empty column
+4. Saved reports run the same way on the async data warehouse session
+5. Cached results are kept per execution mode, dropped after a definition change and never kept for failed runs;
+   they are copies, and results computed from definitions an edit replaced are not kept
+6. The vectorized merge returns the rows of the row-by-row merge
+7. Cached calculation definitions are replaced once an edit commits
+8. Saved reports store their execution plan, and an edit to one of their calculations clears it
+9. Streamed reports encode values like the run endpoint and are logged as soon as the response ends
+
+Usage:
+    python test_report_execution.py
+    python -m pytest -q test_report_execution.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import List, Dict, Any
+
+# Point the app at scratch databases before anything from it is imported
+# Test scripts run in one pytest process share the directory, since the app is only configured once
+_DATABASE_DIR = os.environ.get("TEST_DATABASE_DIR") or tempfile.mkdtemp(prefix="report_execution_test_")
+os.environ["TEST_DATABASE_DIR"] = _DATABASE_DIR
+os.environ["DATABASE_URL"] = f"sqlite:///{_DATABASE_DIR}/config.db"
+os.environ["DATA_WAREHOUSE_URL"] = f"sqlite:///{_DATABASE_DIR}/datawarehouse.db"
+os.environ["REPORT_CACHE_DIR"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.core.database import (  # noqa: E402
+    create_all_tables, engine, SessionLocal, DWSessionLocal, AsyncDWSessionLocal, dispose_async_engines
+)
+from app.datawarehouse.models import Deal, Tranche, TrancheBal  # noqa: E402
+from app.core.exceptions import ReportGenerationError  # noqa: E402
+from app.calculations.models import (  # noqa: E402
+    UserCalculation, SystemCalculation, AggregationFunction, SourceModel, GroupLevel
+)
+from app.calculations import resolver as resolver_module  # noqa: E402
+from app.calculations.resolver import SimpleCalculationResolver, CalculationRequest, QueryFilters  # noqa: E402
+from app.calculations.result_cache import get_report_result_cache  # noqa: E402
+from app.calculations.definition_cache import load_calculation_definition  # noqa: E402
+from app.calculations.dao import UserCalculationDAO, SystemCalculationDAO  # noqa: E402
+from app.calculations.service import (  # noqa: E402
+    ReportExecutionService, UserCalculationService, SystemCalculationService
+)
+from app.datawarehouse.dao import DatawarehouseDAO  # noqa: E402
+from app.reporting.dao import ReportDAO  # noqa: E402
+from app.reporting.models import Report, ReportDeal, ReportCalculation, ReportExecutionLog  # noqa: E402
+from app.reporting.router import ReportStreamingResponse  # noqa: E402
+from app.reporting.service import ReportService  # noqa: E402
+
+CYCLE_CODE = 202401
+DEAL_TRANCHE_MAP = {1001: [], 1002: []}
+
+_fixture = None
+
+
+def _tranche_balance(dl_nbr: int, tr_id: str, end_balance: str, pass_thru_rate: float) -> TrancheBal:
+    return TrancheBal(
+        dl_nbr=dl_nbr, tr_id=tr_id, cycle_cde=CYCLE_CODE,
+        tr_end_bal_amt=Decimal(end_balance), tr_prin_rel_ls_amt=Decimal("0"), tr_pass_thru_rte=pass_thru_rate,
+        tr_accrl_days=30, tr_int_dstrb_amt=Decimal("0"), tr_prin_dstrb_amt=Decimal("0"),
+        tr_int_accrl_amt=Decimal("0"), tr_int_shtfl_amt=Decimal("0"),
+    )
+
+
+def _add_user_calculation(config_db, name: str, function: AggregationFunction, group_level: GroupLevel,
+                          filters: List[Dict[str, Any]] = None) -> int:
+    calculation = UserCalculation(
+        name=name,
+        aggregation_function=function,
+        source_model=SourceModel.TRANCHE_BAL,
+        source_field="tr_end_bal_amt",
+        group_level=group_level,
+        advanced_config={"filters": filters} if filters else None,
+        created_by="test",
+    )
+    config_db.add(calculation)
+    config_db.commit()
+    return calculation.id
+
+
+def get_fixture() -> Dict[str, Any]:
+    """Create the scratch databases once: two deals, one tranche without a balance for the cycle."""
+    global _fixture
+    if _fixture is not None:
+        return _fixture
+
+    if not str(engine.url).startswith(f"sqlite:///{_DATABASE_DIR}"):
+        raise RuntimeError("The app was imported before this script could point it at scratch databases")
+    create_all_tables()
+
+    dw_db, config_db = DWSessionLocal(), SessionLocal()
+    # tranchebal's foreign key names only part of tranche's primary key, which SQLite rejects on insert
+    dw_db.execute(text("PRAGMA foreign_keys=OFF"))
+    dw_db.add_all([
+        Deal(dl_nbr=1001, issr_cde="FHLMC", cdi_file_nme="DEAL1001", deal_cusip_id="D1001"),
+        Deal(dl_nbr=1002, issr_cde="FNMA", cdi_file_nme="DEAL1002", deal_cusip_id="D1002"),
+        Tranche(dl_nbr=1001, tr_id="A", tr_cusip_id="T1001A"),
+        Tranche(dl_nbr=1001, tr_id="B", tr_cusip_id="T1001B"),
+        Tranche(dl_nbr=1002, tr_id="A", tr_cusip_id="T1002A"),
+        Tranche(dl_nbr=1002, tr_id="B", tr_cusip_id="T1002B"),
+        Tranche(dl_nbr=1002, tr_id="C", tr_cusip_id="T1002C"),
+        _tranche_balance(1001, "A", "500000.0000", 4.0),
+        _tranche_balance(1001, "B", "2000000.0000", 4.5),
+        _tranche_balance(1002, "A", "3000000.0000", 6.0),
+        _tranche_balance(1002, "B", "100.0000", 5.5),
+    ])
+    dw_db.commit()
+
+    calc_ids = {
+        "Total Balance": _add_user_calculation(
+            config_db, "Total Balance", AggregationFunction.SUM, GroupLevel.TRANCHE),
+        "Large Balance Count": _add_user_calculation(
+            config_db, "Large Balance Count", AggregationFunction.COUNT, GroupLevel.TRANCHE,
+            [{"field": "tranchebal.tr_end_bal_amt", "operator": ">", "value": 1000000}]),
+        "Huge Balance Count": _add_user_calculation(
+            config_db, "Huge Balance Count", AggregationFunction.COUNT, GroupLevel.TRANCHE,
+            [{"field": "tranchebal.tr_end_bal_amt", "operator": ">", "value": 2500000}]),
+        "High Rate Balance": _add_user_calculation(
+            config_db, "High Rate Balance", AggregationFunction.SUM, GroupLevel.DEAL,
+            [{"field": "tranchebal.tr_pass_thru_rte", "operator": ">", "value": 5}]),
+    }
+
+    # Valid enough to resolve, fails in the warehouse
+    broken_calculation = SystemCalculation(
+        name="Broken Metric", raw_sql="SELECT deal.dl_nbr, deal.no_such_column AS broken_metric FROM deal",
+        result_column_name="broken_metric", group_level=GroupLevel.DEAL, created_by="test",
+    )
+    config_db.add(broken_calculation)
+    config_db.commit()
+    calc_ids["Broken Metric"] = broken_calculation.id
+
+    # Edited by the cache checks, so the other checks don't depend on its definition
+    calc_ids["Editable Balance Count"] = _add_user_calculation(
+        config_db, "Editable Balance Count", AggregationFunction.COUNT, GroupLevel.TRANCHE,
+        [{"field": "tranchebal.tr_end_bal_amt", "operator": ">", "value": 1000000}])
+
+    _fixture = {"dw_db": dw_db, "config_db": config_db, "calc_ids": calc_ids}
+    return _fixture
+
+
+def user_calculation(name: str) -> CalculationRequest:
+    return CalculationRequest("user_calculation", calc_id=get_fixture()["calc_ids"][name], alias=name)
+
+
+def system_calculation(name: str) -> CalculationRequest:
+    return CalculationRequest("system_calculation", calc_id=get_fixture()["calc_ids"][name], alias=name)
+
+
+def static_field(field_path: str) -> CalculationRequest:
+    return CalculationRequest("static_field", field_path=field_path)
+
+
+def resolve(calc_requests: List[CalculationRequest], execution_mode: str) -> Dict[str, Any]:
+    fixture = get_fixture()
+    resolver = SimpleCalculationResolver(fixture["dw_db"], fixture["config_db"])
+    return resolver.resolve_report(calc_requests, QueryFilters(DEAL_TRANCHE_MAP, CYCLE_CODE), execution_mode)
+
+
+def stream(calc_requests: List[CalculationRequest], execution_mode: str) -> List[Dict[str, Any]]:
+    fixture = get_fixture()
+    resolver = SimpleCalculationResolver(fixture["dw_db"], fixture["config_db"])
+    batches = resolver.stream_report(calc_requests, QueryFilters(DEAL_TRANCHE_MAP, CYCLE_CODE), execution_mode, 2)
+    return [row for batch in batches for row in batch]
+
+
+def execute(calc_requests: List[CalculationRequest], execution_mode: str) -> Dict[str, Any]:
+    """Execute through the report execution service, which puts results in the result cache"""
+    fixture = get_fixture()
+    service = ReportExecutionService(fixture["dw_db"], fixture["config_db"])
+    return service.execute_report(calc_requests, DEAL_TRANCHE_MAP, CYCLE_CODE, execution_mode)
+
+
+def set_balance_filter(calculation_name: str, minimum_balance: int):
+    """Change the advanced filter of a calculation and commit it, like an edit through the API"""
+    config_db = get_fixture()["config_db"]
+    calculation = config_db.get(UserCalculation, get_fixture()["calc_ids"][calculation_name])
+    calculation.advanced_config = {
+        "filters": [{"field": "tranchebal.tr_end_bal_amt", "operator": ">", "value": minimum_balance}]
+    }
+    config_db.commit()
+
+
+def create_report(name: str, calculation_names: List[str]) -> int:
+    config_db = get_fixture()["config_db"]
+    report = Report(
+        name=name, scope="TRANCHE", created_by="test",
+        selected_deals=[ReportDeal(dl_nbr=dl_nbr) for dl_nbr in DEAL_TRANCHE_MAP],
+        selected_calculations=[
+            ReportCalculation(calculation_id=str(get_fixture()["calc_ids"][calculation_name]),
+                              calculation_type="user_calculation", display_order=order)
+            for order, calculation_name in enumerate(calculation_names)
+        ],
+    )
+    config_db.add(report)
+    config_db.commit()
+    return report.id
+
+
+def report_service(config_db, async_dw_db=None) -> ReportService:
+    """A report service wired like the request dependencies, on its own config session"""
+    dw_db = get_fixture()["dw_db"]
+    return ReportService(
+        ReportDAO(config_db), DatawarehouseDAO(dw_db),
+        UserCalculationService(UserCalculationDAO(config_db)),
+        SystemCalculationService(SystemCalculationDAO(config_db)),
+        ReportExecutionService(dw_db, config_db, async_dw_db),
+    )
+
+
+def run_saved_report(report_id: int, execution_mode: str) -> List[Dict[str, Any]]:
+    """Run a saved report the way the API does, on the async data warehouse session"""
+    async def run() -> List[Dict[str, Any]]:
+        config_db = SessionLocal()
+        try:
+            async with AsyncDWSessionLocal() as async_dw_db:
+                return await report_service(config_db, async_dw_db).run_saved_report(
+                    report_id, CYCLE_CODE, execution_mode=execution_mode
+                )
+        finally:
+            config_db.close()
+            await dispose_async_engines()  # Pooled connections belong to this event loop
+
+    return asyncio.run(run())
+
+
+@contextmanager
+def merge_strategy(strategy: str):
+    """Merge every result with the given strategy, however few rows there are"""
+    saved = resolver_module.REPORT_MERGE_STRATEGY, resolver_module.REPORT_VECTORIZED_MERGE_MIN_ROWS
+    resolver_module.REPORT_MERGE_STRATEGY, resolver_module.REPORT_VECTORIZED_MERGE_MIN_ROWS = strategy, 0
+    try:
+        yield
+    finally:
+        resolver_module.REPORT_MERGE_STRATEGY, resolver_module.REPORT_VECTORIZED_MERGE_MIN_ROWS = saved
+
+
+def execution_logs(report_id: int) -> List[ReportExecutionLog]:
+    config_db = SessionLocal()
+    try:
+        return config_db.query(ReportExecutionLog).filter(ReportExecutionLog.report_id == report_id).all()
+    finally:
+        config_db.close()
+
+
+def stored_execution_plan(report_id: int) -> Dict[str, Any]:
+    """Execution plan column of a report, as committed"""
+    config_db = SessionLocal()
+    try:
+        return config_db.query(Report.execution_plan).filter(Report.id == report_id).scalar()
+    finally:
+        config_db.close()
+
+
+def as_items(rows: List[Dict[str, Any]]) -> List[List[tuple]]:
+    """Rows with their column order, so differences in either show up"""
+    return [list(row.items()) for row in rows]
+
+
+def assert_modes_agree(calc_requests: List[CalculationRequest]) -> List[Dict[str, Any]]:
+    individual = resolve(calc_requests, "individual")
+    assert individual["debug_info"]["errors"] == [], individual["debug_info"]
+
+    for execution_mode in ("compiled", "parallel"):
+        result = resolve(calc_requests, execution_mode)
+        assert result["debug_info"]["errors"] == [], result["debug_info"]
+        assert "compiled_fallback_error" not in result["debug_info"], result["debug_info"]
+        assert as_items(result["merged_data"]) == as_items(individual["merged_data"]), execution_mode
+
+    assert as_items(stream(calc_requests, "compiled")) == as_items(individual["merged_data"])
+    return individual["merged_data"]
+
+
+def test_modes_agree_with_advanced_filters():
+    """Filtered calculations are left out of rows they match nothing for, in every mode"""
+    rows = assert_modes_agree([
+        static_field("deal.issr_cde"),
+        user_calculation("Large Balance Count"),
+        user_calculation("Total Balance"),
+        user_calculation("High Rate Balance"),
+    ])
+
+    by_key = {(row["deal_number"], row["tranche_id"]): row for row in rows}
+    assert set(by_key) == {(1001, "A"), (1001, "B"), (1002, "A"), (1002, "B")}
+    assert "Large Balance Count" not in by_key[(1001, "A")]
+    assert by_key[(1001, "B")]["Large Balance Count"] == 1
+    assert "High Rate Balance" not in by_key[(1001, "B")]
+    assert by_key[(1002, "B")]["High Rate Balance"] == 3000100
+
+
+def test_modes_agree_when_filters_exclude_a_key():
+    """Keys no calculation returns a row for are not in the report"""
+    rows = assert_modes_agree([
+        user_calculation("Huge Balance Count"),
+        user_calculation("High Rate Balance"),
+    ])
+    assert [(row["deal_number"], row["tranche_id"]) for row in rows] == [(1002, "A")]
+
+
+def test_modes_agree_with_static_tranche_fields():
+    """Tranches without balances for the cycle still come from attribute-only fields"""
+    rows = assert_modes_agree([
+        user_calculation("Total Balance"),
+        static_field("tranche.tr_cusip_id"),
+    ])
+    assert rows[-1] == {"deal_number": 1002, "tranche_id": "C", "cycle_code": CYCLE_CODE,
+                        "tranche_tr_cusip_id": "T1002C"}
+
+
+def test_failed_statement_is_reported():
+    """Individual mode lists the failed calculation; parallel mode fails the execution"""
+    calc_requests = [user_calculation("Total Balance"), system_calculation("Broken Metric")]
+
+    individual = resolve(calc_requests, "individual")
+    assert individual["debug_info"]["errors"] == ["Broken Metric"]
+    assert "no_such_column" in individual["individual_queries"]["Broken Metric"].sql
+    assert len(individual["merged_data"]) == 4
+
+    try:
+        resolve(calc_requests, "parallel")
+    except ReportGenerationError as e:
+        assert "Broken Metric" in str(e)
+    else:
+        raise AssertionError("Parallel execution did not fail")
+
+
+def test_saved_report_runs_on_async_session():
+    """Saved reports return the resolver's rows in every mode when run through the async session"""
+    report_id = create_report("Async Report", ["Total Balance", "Large Balance Count"])
+    expected = resolve([user_calculation("Total Balance"), user_calculation("Large Balance Count")], "individual")
+
+    for execution_mode in ("individual", "parallel", "compiled"):
+        rows = run_saved_report(report_id, execution_mode)
+        assert as_items(rows) == as_items(expected["merged_data"]), execution_mode
+
+
+def test_result_cache_is_kept_per_execution_mode():
+    """A repeated execution is served from the cache, but not one in a different mode"""
+    calc_requests = [user_calculation("Total Balance"), user_calculation("Huge Balance Count")]
+
+    assert execute(calc_requests, "individual")["metadata"]["cache_hit"] is False
+    cached = execute(calc_requests, "individual")
+    assert cached["metadata"]["cache_hit"] is True
+    assert cached["metadata"]["debug_info"]["execution_mode"] == "individual"
+
+    compiled = execute(calc_requests, "compiled")
+    assert compiled["metadata"]["cache_hit"] is False
+    assert compiled["metadata"]["debug_info"]["execution_mode"] == "compiled"
+
+
+def test_result_cache_is_invalidated_by_definition_changes():
+    """Editing a calculation drops cached results, so the next execution sees the new definition"""
+    calc_requests = [user_calculation("Editable Balance Count")]
+    set_balance_filter("Editable Balance Count", 1000000)
+
+    execute(calc_requests, "compiled")
+    assert execute(calc_requests, "compiled")["metadata"]["cache_hit"] is True
+    assert len(execute(calc_requests, "compiled")["data"]) == 2
+
+    set_balance_filter("Editable Balance Count", 2500000)
+    result = execute(calc_requests, "compiled")
+    assert result["metadata"]["cache_hit"] is False
+    assert [(row["deal_number"], row["tranche_id"]) for row in result["data"]] == [(1002, "A")]
+
+
+def test_failed_execution_is_not_cached():
+    """Results with a failed calculation are executed again rather than served from the cache"""
+    calc_requests = [user_calculation("Total Balance"), system_calculation("Broken Metric")]
+
+    for _ in range(2):
+        result = execute(calc_requests, "individual")
+        assert result["metadata"]["cache_hit"] is False
+        assert result["metadata"]["debug_info"]["errors"] == ["Broken Metric"]
+
+
+def test_cached_results_are_copies():
+    """Changing a returned result changes neither the cached entry nor later hits"""
+    calc_requests = [user_calculation("Total Balance"), user_calculation("Large Balance Count")]
+    first = execute(calc_requests, "parallel")
+    expected = as_items(first["data"])
+    first["data"][0]["Total Balance"] = -1
+    first["metadata"]["debug_info"]["errors"].append("changed")
+
+    hit = execute(calc_requests, "parallel")
+    assert hit["metadata"]["cache_hit"] is True
+    assert as_items(hit["data"]) == expected
+    assert hit["metadata"]["debug_info"]["errors"] == []
+    hit["data"].clear()
+
+    assert as_items(execute(calc_requests, "parallel")["data"]) == expected
+
+
+def test_result_computed_before_an_edit_is_not_cached():
+    """A run that looked up the cache before an edit committed doesn't store its result"""
+    set_balance_filter("Editable Balance Count", 1000000)
+    calc_requests = [user_calculation("Editable Balance Count")]
+    fixture = get_fixture()
+    service = ReportExecutionService(fixture["dw_db"], fixture["config_db"])
+
+    cache_version, cache_key, cached_result = service._lookup_cached_result(
+        calc_requests, DEAL_TRANCHE_MAP, CYCLE_CODE, "individual"
+    )
+    assert cached_result is None
+    result = service._execute_report_uncached(calc_requests, DEAL_TRANCHE_MAP, CYCLE_CODE, "individual")
+    set_balance_filter("Editable Balance Count", 2500000)  # Commits while the run is finishing
+    service._cache_result(cache_version, cache_key, result)
+    assert get_report_result_cache().get(cache_key) is None
+
+
+def test_result_cache_is_invalidated_again_on_commit():
+    """Results stored between an edit's flush and its commit are dropped by the commit"""
+    config_db = get_fixture()["config_db"]
+    calculation = config_db.get(UserCalculation, get_fixture()["calc_ids"]["Editable Balance Count"])
+    calculation.description = "Flushed, not committed"
+    config_db.flush()
+
+    cache = get_report_result_cache()
+    assert cache.set("flushed-edit", {"data": [], "metadata": {}}, cache.get_version())
+    assert cache.get("flushed-edit") is not None
+    config_db.commit()
+    assert cache.get("flushed-edit") is None
+
+
+def test_vectorized_merge_matches_row_merge():
+    """The columnar merge returns the rows of the reference merge, including left-out filtered columns"""
+    calc_requests = [
+        static_field("deal.issr_cde"),
+        user_calculation("Large Balance Count"),
+        user_calculation("Total Balance"),
+        user_calculation("High Rate Balance"),
+        static_field("tranche.tr_cusip_id"),
+    ]
+    with merge_strategy("rows"):
+        expected = resolve(calc_requests, "individual")["merged_data"]
+
+    vectorized_merges = []
+    merge_columns = SimpleCalculationResolver._merge_calculation_columns
+
+    def recording_merge(self, *args):
+        merged_data = merge_columns(self, *args)
+        vectorized_merges.append(merged_data is not None)
+        return merged_data
+
+    SimpleCalculationResolver._merge_calculation_columns = recording_merge
+    try:
+        with merge_strategy("vectorized"):
+            rows = resolve(calc_requests, "individual")["merged_data"]
+    finally:
+        SimpleCalculationResolver._merge_calculation_columns = merge_columns
+
+    assert vectorized_merges == [True]
+    assert as_items(rows) == as_items(expected)
+
+
+def test_definition_cache_is_invalidated_by_edits():
+    """Other sessions are served the cached definition until an edit commits, then the new one"""
+    calc_id = get_fixture()["calc_ids"]["Editable Balance Count"]
+    set_balance_filter("Editable Balance Count", 1000000)
+
+    request_db = SessionLocal()
+    try:
+        cached = load_calculation_definition(request_db, UserCalculation, calc_id)
+        assert load_calculation_definition(request_db, UserCalculation, calc_id) is cached
+
+        set_balance_filter("Editable Balance Count", 2500000)
+        reloaded = load_calculation_definition(request_db, UserCalculation, calc_id)
+        assert reloaded is not cached
+        assert reloaded.advanced_config["filters"][0]["value"] == 2500000
+    finally:
+        request_db.close()
+
+
+def test_execution_plan_is_rebuilt_after_definition_changes():
+    """Runs store the report's plan; editing a calculation clears it and the next run compiles the new SQL"""
+    set_balance_filter("Editable Balance Count", 1000000)
+    report_id = create_report("Plan Report", ["Editable Balance Count"])
+    assert stored_execution_plan(report_id) is None
+
+    assert len(run_saved_report(report_id, "compiled")) == 2
+    assert "1000000" in json.dumps(stored_execution_plan(report_id))
+
+    set_balance_filter("Editable Balance Count", 2500000)
+    assert stored_execution_plan(report_id) is None
+
+    rows = run_saved_report(report_id, "compiled")
+    assert [(row["deal_number"], row["tranche_id"]) for row in rows] == [(1002, "A")]
+    plan = json.dumps(stored_execution_plan(report_id))
+    assert "2500000" in plan and "1000000" not in plan
+
+
+def test_streamed_rows_are_encoded_like_run_results():
+    """NDJSON lines and JSON array chunks hold the values the run endpoint returns - Decimal as a string"""
+    report_id = create_report("Streamed Report", ["Total Balance", "Large Balance Count"])
+
+    async def body(output_format: str) -> bytes:
+        config_db = SessionLocal()
+        try:
+            chunks = await report_service(config_db).stream_saved_report(
+                report_id, CYCLE_CODE, output_format=output_format
+            )
+            return b"".join([chunk async for chunk in chunks])
+        finally:
+            config_db.close()
+
+    async def run() -> bytes:
+        config_db = SessionLocal()
+        try:
+            return await report_service(config_db).run_saved_report(report_id, CYCLE_CODE, encode_json=True)
+        finally:
+            config_db.close()
+
+    expected = json.loads(asyncio.run(run()))
+    assert json.loads(asyncio.run(body("json"))) == expected
+    assert [json.loads(line) for line in asyncio.run(body("ndjson")).splitlines()] == expected
+
+    # SQLite sums come back as numbers, so check a warehouse Decimal directly
+    service = report_service(get_fixture()["config_db"])
+    batches = [[{"deal_number": 1001, "Total Balance": Decimal("500000.0000")}], []]
+    assert b"".join(service._encode_report_stream(iter(batches), "ndjson")) == \
+        b'{"deal_number":1001,"Total Balance":"500000.0000"}\n'
+    assert b"".join(service._encode_report_stream(iter(batches), "json")) == \
+        b'[{"deal_number":1001,"Total Balance":"500000.0000"}]'
+    assert b"".join(service._encode_report_stream(iter([]), "json")) == b"[]"
+
+
+def test_disconnected_stream_is_logged_when_the_response_ends():
+    """A client that goes away mid-stream gets its execution logged without waiting for garbage collection"""
+    report_id = create_report("Disconnected Report", ["Total Balance"])
+
+    async def send(message: Dict[str, Any]):
+        if message["type"] == "http.response.body" and message.get("body"):
+            raise OSError("Client went away")
+
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.disconnect"}
+
+    async def run():
+        config_db = SessionLocal()
+        try:
+            chunks = await report_service(config_db).stream_saved_report(report_id, CYCLE_CODE)
+            response = ReportStreamingResponse(chunks, media_type="application/x-ndjson")
+            scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+            try:
+                await response(scope, receive, send)
+            except Exception as e:
+                assert type(e).__name__ == "ClientDisconnect", e
+            else:
+                raise AssertionError("The disconnect was not reported")
+            # Still referenced, so only an explicit close can have written the log
+            assert [log.success for log in execution_logs(report_id)] == [False]
+        finally:
+            config_db.close()
+
+    asyncio.run(run())
+
+
+def main():
+    tests = [value for name, value in globals().items() if name.startswith("test_") and callable(value)]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {e!r}")
+    print(f"\n{len(tests) - failures}/{len(tests)} checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Request Logging Test Script
+
+Builds a fresh SQLite config database through create_all_tables and checks that:
+1. The request log search index is created with the log table, and search goes through it
+2. Indexed search returns the same logs as the ILIKE scan
+3. The batched writer stores every queued row, and retention removes only old rows
+4. The logging middleware never waits on a full writer queue on the event loop
+5. Exception handlers log the request body received so far, even when the app failed before reading it
+
+Usage:
+    python test_request_logging.py
+    python -m pytest -q test_request_logging.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any
+
+# Point the app at scratch databases before anything from it is imported
+# Test scripts run in one pytest process share the directory, since the app is only configured once
+_DATABASE_DIR = os.environ.get("TEST_DATABASE_DIR") or tempfile.mkdtemp(prefix="request_logging_test_")
+os.environ["TEST_DATABASE_DIR"] = _DATABASE_DIR
+os.environ["DATABASE_URL"] = f"sqlite:///{_DATABASE_DIR}/config.db"
+os.environ["DATA_WAREHOUSE_URL"] = f"sqlite:///{_DATABASE_DIR}/datawarehouse.db"
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import create_all_tables, engine, SessionLocal  # noqa: E402
+
+# Only the database module is loaded here, so create_all_tables has to register the log model itself
+create_all_tables()
+
+from sqlalchemy import select, func  # noqa: E402
+
+from app.logging import search as search_module  # noqa: E402
+from app.logging.dao import LogDAO  # noqa: E402
+from app.logging.models import Log  # noqa: E402
+from app.logging.search import log_search_condition  # noqa: E402
+from app.logging import writer as writer_module  # noqa: E402
+from app.logging.middleware import LoggingMiddleware, UNREAD_REQUEST_BODY, PARTIAL_REQUEST_BODY_NOTE  # noqa: E402
+from app.logging.exception_handlers import general_exception_handler, http_exception_handler  # noqa: E402
+from app.logging.writer import RequestLogWriter  # noqa: E402
+
+
+def log_row(path: str, status_code: int = 200, age: timedelta = timedelta(minutes=1), **values) -> Dict[str, Any]:
+    return {"method": "GET", "path": path, "status_code": status_code, "timestamp": datetime.now() - age,
+            "client_ip": "127.0.0.1", **values}
+
+
+def add_logs(rows: List[Dict[str, Any]]) -> None:
+    with SessionLocal() as session:
+        session.add_all([Log(**row) for row in rows])
+        session.commit()
+
+
+def search_paths(search: str) -> List[str]:
+    with SessionLocal() as session:
+        logs = asyncio.run(LogDAO(session).get_logs(limit=1000, hours=168, search=search))
+        return sorted(log.path for log in logs)
+
+
+def count_logs(path_prefix: str) -> int:
+    with SessionLocal() as session:
+        return session.execute(select(func.count()).where(Log.path.startswith(path_prefix))).scalar_one()
+
+
+async def plain_text_app(scope, receive, send):
+    """ASGI app answering every request with a short text body, without reading the request"""
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/plain"), (b"content-length", b"2")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def http_scope(path: str, method: str = "GET") -> Dict[str, Any]:
+    return {"type": "http", "method": method, "path": path, "headers": [], "client": ("127.0.0.1", 5000),
+            "query_string": b""}
+
+
+async def request(app, path: str, body: bytes = b"", method: str = "GET") -> Dict[str, Any]:
+    """Send one request through an ASGI app; returns the scope, with the state the app set"""
+    scope = http_scope(path, method)
+
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        pass
+
+    await app(scope, receive, send)
+    return scope
+
+
+def test_fresh_database_gets_log_search_index():
+    """create_all_tables creates the log table before its full-text index, so search can use the index"""
+    assert engine.dialect.name == "sqlite"
+    assert log_search_condition(engine, "reports") is not None
+
+
+def test_indexed_search_matches_scan():
+    """The full-text index finds the same logs as the case-insensitive substring scan"""
+    add_logs([
+        log_row("/api/search/Reports/1", username="Analyst"),
+        log_row("/api/search/calculations", status_code=404),
+        log_row("/api/search/reports/2/export", hostname="reports-host"),
+        log_row("/api/search/health", age=timedelta(days=30)),
+    ])
+
+    for search in ("reports", "REPORTS", "analyst", "404", "calculations", "export"):
+        assert log_search_condition(engine, search) is not None
+        indexed = search_paths(search)
+
+        search_module.LOG_SEARCH_INDEX_ENABLED = False
+        try:
+            scanned = search_paths(search)
+        finally:
+            search_module.LOG_SEARCH_INDEX_ENABLED = True
+        assert indexed == scanned and indexed, search
+
+
+def test_writer_stores_queued_rows():
+    """Rows queued on the writer are all inserted, in batches, by the time it is closed"""
+    writer = RequestLogWriter(queue_size=100, batch_size=3, flush_interval=0.05)
+    for index in range(10):
+        assert writer.submit(log_row(f"/api/writer/{index}"))
+    writer.close()
+
+    stats = writer.get_stats()
+    assert stats["written"] == 10 and stats["dropped"] == 0 and stats["failed"] == 0
+    assert stats["batches"] >= 4
+    assert count_logs("/api/writer/") == 10
+    assert not writer.submit(log_row("/api/writer/late"))
+
+
+def test_retention_removes_only_old_logs():
+    """Cleanup deletes logs past the retention period and keeps the rest"""
+    add_logs([log_row(f"/api/retention/old/{index}", age=timedelta(days=40)) for index in range(5)]
+             + [log_row(f"/api/retention/new/{index}", age=timedelta(days=5)) for index in range(3)])
+
+    with SessionLocal() as session:
+        result = LogDAO(session).cleanup_old_logs(days_to_keep=30)
+    assert result.deleted_count >= 5
+    assert count_logs("/api/retention/old/") == 0
+    assert count_logs("/api/retention/new/") == 3
+    assert search_paths("retention") == [f"/api/retention/new/{index}" for index in range(3)]
+
+
+def test_full_blocking_queue_does_not_stall_the_event_loop():
+    """Under the "block" policy the middleware waits for queue space on the threadpool, not the event loop"""
+    database_written = threading.Event()
+    writer = RequestLogWriter(queue_size=1, batch_size=1, flush_interval=0.05, full_policy="block",
+                              block_timeout=0.3)
+    writer._write = lambda rows: database_written.wait()  # A database that doesn't answer - the queue fills up
+    saved_writer, writer_module._request_log_writer = writer_module._request_log_writer, writer
+    middleware = LoggingMiddleware(plain_text_app)
+
+    async def run() -> float:
+        longest_gap, running = 0.0, True
+
+        async def ticker():
+            nonlocal longest_gap
+            last = time.monotonic()
+            while running:
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                longest_gap, last = max(longest_gap, now - last), now
+
+        ticking = asyncio.ensure_future(ticker())
+        await asyncio.gather(*(request(middleware, f"/api/blocked/{index}") for index in range(4)))
+        running = False
+        await ticking
+        return longest_gap
+
+    try:
+        longest_gap = asyncio.run(run())
+    finally:
+        database_written.set()
+        writer.close()
+        writer_module._request_log_writer = saved_writer
+
+    assert writer.get_stats()["dropped"] >= 1, writer.get_stats()
+    assert longest_gap < 0.2, longest_gap
+
+
+def test_failed_requests_log_the_body_received_so_far():
+    """Handler log rows hold the body read by the app, or say it wasn't read - never a stale fallback"""
+    from fastapi import FastAPI, HTTPException, Body
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+    app.add_middleware(LoggingMiddleware)
+    app.add_exception_handler(Exception, general_exception_handler)
+    app.add_exception_handler(HTTPException, http_exception_handler)
+
+    @app.post("/api/errors/before-body")
+    def fail_before_body():
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    @app.post("/api/errors/after-body")
+    def fail_after_body(payload: Dict[str, Any] = Body(...)):
+        raise ValueError("Failed after reading the body")
+
+    @app.get("/api/errors/no-body")
+    def fail_without_body():
+        raise HTTPException(status_code=404, detail="Missing")
+
+    writer = RequestLogWriter(flush_interval=0.05)
+    saved_writer, writer_module._request_log_writer = writer_module._request_log_writer, writer
+    try:
+        client = TestClient(app, raise_server_exceptions=False)
+        headers = {"content-type": "application/json"}
+        assert client.post("/api/errors/before-body", content=b'{"report_id": 1}', headers=headers).status_code == 403
+        assert client.post("/api/errors/after-body", content=b'{"report_id": 2}', headers=headers).status_code == 500
+        assert client.get("/api/errors/no-body").status_code == 404
+    finally:
+        writer.close()
+        writer_module._request_log_writer = saved_writer
+
+    with SessionLocal() as session:
+        # Rows written by the exception handlers (untimed), not the middleware's own row of the response
+        handler_rows = {
+            log.path: log.request_body for log in session.execute(
+                select(Log).where(Log.path.startswith("/api/errors/"), Log.processing_time.is_(None))
+            ).scalars()
+        }
+    assert handler_rows == {
+        "/api/errors/before-body": UNREAD_REQUEST_BODY,
+        "/api/errors/after-body": '{"report_id": 2}',
+        "/api/errors/no-body": "",
+    }
+
+
+def test_partly_read_body_is_stored_for_exception_handlers():
+    """The part of a body received before a failure is kept, with a note that the rest wasn't read"""
+    async def read_one_chunk_then_fail(scope, receive, send):
+        await receive()
+        raise RuntimeError("Failed while reading the body")
+
+    chunks = [{"type": "http.request", "body": b'{"report_id":', "more_body": True},
+              {"type": "http.request", "body": b" 3}", "more_body": False}]
+    scope = http_scope("/api/errors/partial", "POST")
+    scope["headers"] = [(b"transfer-encoding", b"chunked")]
+
+    async def receive() -> Dict[str, Any]:
+        return chunks.pop(0)
+
+    async def send(message: Dict[str, Any]) -> None:
+        pass
+
+    try:
+        asyncio.run(LoggingMiddleware(read_one_chunk_then_fail)(scope, receive, send))
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("The app's error was not raised")
+    assert scope["state"]["body"] == '{"report_id":' + PARTIAL_REQUEST_BODY_NOTE
+
+
+def main():
+    tests = [value for name, value in globals().items() if name.startswith("test_") and callable(value)]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {e!r}")
+    print(f"\n{len(tests) - failures}/{len(tests)} checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())